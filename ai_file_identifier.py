@@ -9,14 +9,14 @@ import os
 import re
 import json
 import time
-import asyncio
 from typing import List, Dict, Set, Any, Optional
 from datetime import datetime, timedelta
 import traceback
 
-# 导入OpenAI
+# 导入共享连接池的OpenAI客户端
 try:
-    from openai import OpenAI
+    from app.transport import get_openai_client
+    from app.llm_cache import make_cache_key, response_cache
     OPENAI_AVAILABLE = True
 except ImportError:
     OPENAI_AVAILABLE = False
@@ -50,19 +50,10 @@ class AIFileIdentifier:
                 self.model = llm_config.get("model", "gpt-3.5-turbo")
                 print("使用LLM配置初始化OpenAI客户端")
             
-            # 初始化OpenAI客户端
+            # 初始化OpenAI客户端（复用进程级连接池，不再每次新建连接）
             if OPENAI_AVAILABLE and self.api_key:
                 print(f"正在初始化OpenAI客户端，API基础URL: {self.api_base}")
-                client_params = {
-                    "api_key": self.api_key,
-                }
-                
-                # 设置基础URL（如果存在）
-                if self.api_base:
-                    client_params["base_url"] = self.api_base
-                
-                # 创建客户端
-                self.client = OpenAI(**client_params)
+                self.client = get_openai_client(self.api_key, self.api_base or None)
                 print("OpenAI客户端初始化成功")
             else:
                 self.client = None
@@ -157,19 +148,35 @@ class AIFileIdentifier:
         ]
         
         try:
-            print(f"向AI发送请求，分析日志中的文件路径...")
-            # 异步调用OpenAI API
-            response = await asyncio.to_thread(
-                lambda: self.client.chat.completions.create(
+            # 相同日志的重复识别直接复用缓存结果
+            cache_key = None
+            content = None
+            if response_cache.accepts(0.0):
+                cache_key = make_cache_key(
+                    kind="file_identification",
                     model=self.model,
                     messages=messages,
+                    max_tokens=1000,
                     temperature=0.0,
-                    max_tokens=1000
                 )
-            )
+                content = await response_cache.get(cache_key)
             
-            # 处理响应
-            content = response.choices[0].message.content.strip()
+            if content is None:
+                print(f"向AI发送请求，分析日志中的文件路径...")
+                # 异步调用OpenAI API
+                response = await self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    temperature=0.0,
+                    max_tokens=1000
+                )
+                
+                # 处理响应
+                content = response.choices[0].message.content.strip()
+                if cache_key:
+                    await response_cache.set(cache_key, content)
+            else:
+                print("命中LLM缓存，跳过AI请求")
             print(f"AI响应: {content[:100]}...")
             
             # 如果没有找到文件
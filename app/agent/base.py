@@ -1,12 +1,13 @@
 from abc import ABC, abstractmethod
 from contextlib import asynccontextmanager
-from typing import List, Literal, Optional
+from typing import Any, List, Literal, Optional
 
 from pydantic import BaseModel, Field, model_validator
 
 from app.llm import LLM
 from app.logger import logger
 from app.schema import AgentState, Memory, Message
+from app.telemetry import bind
 
 
 class BaseAgent(BaseModel, ABC):
@@ -41,6 +42,9 @@ class BaseAgent(BaseModel, ABC):
 
     duplicate_threshold: int = 2
 
+    # Saves a checkpoint after steps, see app.checkpoint.CheckpointWriter
+    checkpointer: Optional[Any] = Field(default=None, exclude=True)
+
     class Config:
         arbitrary_types_allowed = True
         extra = "allow"  # Allow extra fields for flexibility in subclasses
@@ -135,7 +139,8 @@ class BaseAgent(BaseModel, ABC):
             ):
                 self.current_step += 1
                 logger.info(f"Executing step {self.current_step}/{self.max_steps}")
-                step_result = await self.step()
+                with bind(agent=self.name, step=self.current_step):
+                    step_result = await self.step()
 
                 # Check for stuck state
                 if self.is_stuck():
@@ -143,11 +148,51 @@ class BaseAgent(BaseModel, ABC):
 
                 results.append(f"Step {self.current_step}: {step_result}")
 
+                if self.checkpointer is not None:
+                    await self.checkpointer.save(self)
+
             if self.current_step >= self.max_steps:
                 results.append(f"Terminated: Reached max steps ({self.max_steps})")
 
         return "\n".join(results) if results else "No steps executed"
 
+    async def warm_up(self) -> None:
+        """Start tool sessions ahead of the first task, see app.agent.pool."""
+
+    async def reset(self) -> None:
+        """Forget the last task so the agent can run another one from IDLE.
+
+        Subclasses extend this with their own run state and tool state.
+        """
+        self.memory = Memory()
+        self.state = AgentState.IDLE
+        self.current_step = 0
+        self.next_step_prompt = type(self).model_fields["next_step_prompt"].default
+        self.checkpointer = None
+        self.llm = self.llm.base  # drop a per-task model choice
+        if self.__pydantic_extra__:
+            self.__pydantic_extra__.clear()  # e.g. user_info set by the API
+
+    async def close(self) -> None:
+        """Release tool sessions held by the agent."""
+
+    def checkpoint_state(self) -> dict:
+        """JSON-serialisable run state, saved with memory in a checkpoint.
+
+        Subclasses extend the dict with their own state and restore it in
+        `restore_checkpoint`.
+        """
+        return {
+            "current_step": self.current_step,
+            "next_step_prompt": self.next_step_prompt,
+        }
+
+    async def restore_checkpoint(self, state: dict, messages: List[Message]) -> None:
+        """Continue from a checkpoint; call `run()` without a request afterwards."""
+        self.memory.messages = list(messages)
+        self.current_step = state.get("current_step", 0)
+        self.next_step_prompt = state.get("next_step_prompt", self.next_step_prompt)
+
     @abstractmethod
     async def step(self) -> str:
         """Execute a single step in the agent's workflow.
@@ -159,26 +204,41 @@ class BaseAgent(BaseModel, ABC):
         """Handle stuck state by adding a prompt to change strategy"""
         stuck_prompt = "\
         Observed duplicate responses. Consider new strategies and avoid repeating ineffective paths already attempted."
-        self.next_step_prompt = f"{stuck_prompt}\n{self.next_step_prompt}"
+        if stuck_prompt not in (self.next_step_prompt or ""):
+            self.next_step_prompt = f"{stuck_prompt}\n{self.next_step_prompt}"
         logger.warning(f"Agent detected stuck state. Added prompt: {stuck_prompt}")
 
     def is_stuck(self) -> bool:
-        """Check if the agent is stuck in a loop by detecting duplicate content"""
-        if len(self.memory.messages) < 2:
-            return False
+        """Check if the agent is stuck in a loop.
 
-        last_message = self.memory.messages[-1]
-        if not last_message.content:
+        The agent is stuck when the last message repeats the content of
+        `duplicate_threshold` earlier assistant messages, or when its latest
+        tool calls, arguments included, were also issued by the previous
+        `duplicate_threshold` assistant messages in a row. Memory keeps
+        counts of both, so the check does not scan the history.
+        """
+        messages = self.memory.messages
+        if len(messages) < 2:
             return False
 
-        # Count identical content occurrences
-        duplicate_count = sum(
-            1
-            for msg in reversed(self.memory.messages[:-1])
-            if msg.role == "assistant" and msg.content == last_message.content
-        )
-
-        return duplicate_count >= self.duplicate_threshold
+        last_message = messages[-1]
+        if last_message.content:
+            # Count identical content occurrences, not counting the message itself
+            duplicate_count = self.memory.content_count(last_message.content) - (
+                last_message.role == "assistant"
+            )
+            if duplicate_count >= self.duplicate_threshold:
+                return True
+
+        # The assistant message that issued this step's tool results
+        index = len(messages) - 1
+        while index > 0 and messages[index].role == "tool":
+            index -= 1
+        calls_message = messages[index]
+        if calls_message.role != "assistant" or not calls_message.tool_calls:
+            return False
+        repeat_count = self.memory.tool_call_streak() - 1
+        return repeat_count >= self.duplicate_threshold
 
     @property
     def messages(self) -> List[Message]:
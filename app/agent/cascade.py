@@ -0,0 +1,75 @@
+"""Model cascade: routine agent steps on a fast model, trouble on the primary one."""
+
+from collections import Counter
+from typing import Optional, Tuple
+
+from app.config import config
+from app.llm import LLM
+from app.logger import logger
+
+
+PRIMARY = "primary"
+FAST = "fast"
+
+
+class ModelCascade:
+    """Chooses which model serves each step of one agent run.
+
+    Steps go to the fast model by default. Calling `escalate` (after a tool
+    error, an unparseable tool call, a stuck loop, or for a planning step)
+    sends the next `escalation_steps` steps to the primary model, after
+    which routine steps drop back to the fast one. Without a fast model
+    every step uses the primary model.
+    """
+
+    def __init__(
+        self, primary: LLM, fast: Optional[LLM] = None, escalation_steps: int = 1
+    ):
+        self.primary = primary
+        self.fast = fast if fast is not primary else None
+        self.escalation_steps = escalation_steps
+        self.steps: Counter = Counter()  # steps served, by tier
+        self.escalations: Counter = Counter()  # escalations, by reason
+        self._pending: Optional[str] = None
+        self._remaining = 0
+
+    @classmethod
+    def for_llm(cls, llm: LLM, escalation_steps: int = 1) -> "ModelCascade":
+        """Cascade from the fast model named by `llm`'s `fast_config`, if any."""
+        name = getattr(llm, "fast_config", None)
+        fast = None
+        if name:
+            if name in config.llm:
+                fast = LLM(config_name=name)
+            else:
+                logger.warning(f"Fast model config [llm.{name}] not found, cascade off")
+        return cls(llm, fast, escalation_steps)
+
+    @property
+    def enabled(self) -> bool:
+        return self.fast is not None
+
+    def escalate(self, reason: str) -> None:
+        """Serve the next steps with the primary model because of `reason`."""
+        if not self.enabled:
+            return
+        self.escalations[reason] += 1
+        self._pending = self._pending or reason
+        self._remaining = max(self._remaining, self.escalation_steps)
+
+    def select(self) -> Tuple[str, LLM, Optional[str]]:
+        """Pick the model for the next step: (tier, llm, escalation reason)."""
+        if not self.enabled:
+            tier, llm, reason = PRIMARY, self.primary, None
+        elif self._remaining > 0:
+            tier, llm, reason = PRIMARY, self.primary, self._pending
+            self._remaining -= 1
+            if not self._remaining:
+                self._pending = None
+        else:
+            tier, llm, reason = FAST, self.fast, None
+        self.steps[tier] += 1
+        return tier, llm, reason
+
+    def stats(self) -> dict:
+        return {"steps": dict(self.steps), "escalations": dict(self.escalations)}
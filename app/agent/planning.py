@@ -80,6 +80,31 @@ class PlanningAgent(ToolCallAgent):
 
         return result
 
+    async def reset(self) -> None:
+        await super().reset()
+        self.active_plan_id = f"plan_{int(time.time())}"
+        self.step_execution_tracker = {}
+        self.current_step_index = None
+
+    def checkpoint_state(self) -> dict:
+        state = super().checkpoint_state()
+        state.update(
+            active_plan_id=self.active_plan_id,
+            current_step_index=self.current_step_index,
+            step_execution_tracker=self.step_execution_tracker,
+        )
+        return state
+
+    async def restore_checkpoint(self, state: dict, messages: List[Message]) -> None:
+        await super().restore_checkpoint(state, messages)
+        self.active_plan_id = state.get("active_plan_id", self.active_plan_id)
+        self.current_step_index = state.get("current_step_index")
+        self.step_execution_tracker = state.get("step_execution_tracker", {})
+
+    def _step_escalation(self) -> Optional[str]:
+        """Steps with no plan step in progress create, revise or close the plan."""
+        return "planner" if self.current_step_index is None else None
+
     async def act(self) -> str:
         """Execute a step and track its completion status."""
         result = await super().act()
@@ -0,0 +1,151 @@
+"""Pools of ready-to-run agents whose tool sessions are already started."""
+
+import asyncio
+import time
+from typing import Callable, Dict, List, Set
+
+from app.agent.base import BaseAgent
+from app.config import config
+from app.logger import logger
+from app.schema import AgentState
+
+
+class AgentPool:
+    """Keeps `size` agents of one type built and warmed up, idle or in use.
+
+    `acquire` hands out an idle agent, or builds one when none is idle so a
+    burst never waits on the pool. Returned agents are reset in the
+    background, which also replaces their tool sessions with fresh ones, and
+    go back to the pool; agents built beyond `size` are closed instead. The
+    pool is refilled off the request path as well.
+    """
+
+    def __init__(self, name: str, factory: Callable[[], BaseAgent], size: int = 2):
+        self.name = name
+        self.factory = factory
+        self.size = size
+        self._idle: List[BaseAgent] = []
+        self._in_use = 0
+        self._background: Set[asyncio.Task] = set()
+        self._refilling = False
+        self.hits = 0
+        self.misses = 0
+        self.discarded = 0
+        self._acquire_seconds = 0.0
+
+    @classmethod
+    def from_config(cls, name: str, factory: Callable[[], BaseAgent]) -> "AgentPool":
+        return cls(name, factory, size=config.agent_pool.get(name, 0))
+
+    def start(self) -> None:
+        """Fill the pool in the background."""
+        self._spawn(self._refill())
+
+    async def acquire(self) -> BaseAgent:
+        started = time.monotonic()
+        if self._idle:
+            agent = self._idle.pop()
+            self.hits += 1
+        else:
+            agent = self.factory()
+            self.misses += 1
+        self._in_use += 1
+        self._acquire_seconds += time.monotonic() - started
+        if self._wanted() > 0:
+            self._spawn(self._refill())
+        return agent
+
+    def _wanted(self) -> int:
+        return self.size - len(self._idle) - self._in_use
+
+    def release(self, agent: BaseAgent) -> None:
+        """Return `agent` once its task is over; it is reset in the background."""
+        # Decided here rather than in the task, so releases made together
+        # see each other's decisions
+        if agent.state == AgentState.RUNNING or self._wanted() < 0:
+            self._in_use -= 1
+            self._spawn(self._discard(agent))
+        else:
+            self._spawn(self._recycle(agent))
+
+    async def _recycle(self, agent: BaseAgent) -> None:
+        # The agent counts as in use until it is back in the pool
+        try:
+            await agent.reset()
+            await agent.warm_up()
+        except Exception as e:
+            logger.warning(f"Resetting pooled {self.name} agent failed: {e}")
+            await self._discard(agent)
+        else:
+            self._idle.append(agent)
+        finally:
+            self._in_use -= 1
+
+    async def _refill(self) -> None:
+        if self._refilling:
+            return
+        self._refilling = True
+        try:
+            while self._wanted() > 0:
+                agent = self.factory()
+                try:
+                    await agent.warm_up()
+                except Exception as e:
+                    logger.warning(f"Warming up a {self.name} agent failed: {e}")
+                    await self._discard(agent)
+                    return
+                self._idle.append(agent)
+        finally:
+            self._refilling = False
+
+    async def _discard(self, agent: BaseAgent) -> None:
+        self.discarded += 1
+        try:
+            await agent.close()
+        except Exception as e:
+            logger.debug(f"Closing a {self.name} agent failed: {e}")
+
+    def _spawn(self, coro) -> None:
+        task = asyncio.create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def close(self) -> None:
+        for task in list(self._background):
+            task.cancel()
+        idle, self._idle = self._idle, []
+        await asyncio.gather(*(self._discard(agent) for agent in idle))
+
+    def stats(self) -> dict:
+        acquired = self.hits + self.misses
+        return {
+            "name": self.name,
+            "size": self.size,
+            "idle": len(self._idle),
+            "in_use": self._in_use,
+            "hits": self.hits,
+            "misses": self.misses,
+            "discarded": self.discarded,
+            "avg_acquire_ms": round(self._acquire_seconds / acquired * 1000, 3)
+            if acquired
+            else None,
+        }
+
+
+_pools: Dict[str, AgentPool] = {}
+
+
+def get_pool(name: str, factory: Callable[[], BaseAgent]) -> AgentPool:
+    """The process-wide pool for agent type `name`, created on first use."""
+    pool = _pools.get(name)
+    if pool is None:
+        pool = _pools[name] = AgentPool.from_config(name, factory)
+    return pool
+
+
+def pool_stats() -> list:
+    return [pool.stats() for pool in _pools.values()]
+
+
+async def close_pools() -> None:
+    await asyncio.gather(*(pool.close() for pool in _pools.values()))
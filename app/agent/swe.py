@@ -1,9 +1,11 @@
+import asyncio
 from typing import List
 
-from pydantic import Field
+from pydantic import Field, model_validator
 
 from app.agent.toolcall import ToolCallAgent
 from app.prompt.swe import NEXT_STEP_TEMPLATE, SYSTEM_PROMPT
+from app.schema import Message
 from app.tool import Bash, StrReplaceEditor, Terminate, ToolCollection
 
 
@@ -16,16 +18,31 @@ class SWEAgent(ToolCallAgent):
     system_prompt: str = SYSTEM_PROMPT
     next_step_prompt: str = NEXT_STEP_TEMPLATE
 
-    available_tools: ToolCollection = ToolCollection(
-        Bash(), StrReplaceEditor(), Terminate()
+    available_tools: ToolCollection = Field(
+        default_factory=lambda: ToolCollection(Bash(), StrReplaceEditor(), Terminate())
     )
     special_tool_names: List[str] = Field(default_factory=lambda: [Terminate().name])
 
     max_steps: int = 30
 
+    # The collection's bash tool when it has one, so `pwd` reports the
+    # directory the agent's commands actually run in
     bash: Bash = Field(default_factory=Bash)
     working_dir: str = "."
 
+    @model_validator(mode="after")
+    def bind_bash(self) -> "SWEAgent":
+        tool = self.available_tools.tool_map.get("bash")
+        if isinstance(tool, Bash):
+            self.bash = tool
+        return self
+
+    def _own_bash(self) -> List[Bash]:
+        """`bash` when it is not one of the tools, so hooks reach it once"""
+        if any(tool is self.bash for tool in self.available_tools.tools):
+            return []
+        return [self.bash]
+
     async def think(self) -> bool:
         """Process current state and decide next action"""
         # Update working directory
@@ -38,3 +55,26 @@ class SWEAgent(ToolCallAgent):
         )
 
         return await super().think()
+
+    async def warm_up(self) -> None:
+        await asyncio.gather(
+            super().warm_up(), *(bash.warm_up() for bash in self._own_bash())
+        )
+
+    async def reset(self) -> None:
+        await asyncio.gather(
+            super().reset(), *(bash.reset() for bash in self._own_bash())
+        )
+        self.working_dir = "."
+
+    async def close(self) -> None:
+        await asyncio.gather(
+            super().close(), *(bash.close() for bash in self._own_bash())
+        )
+
+    async def restore_checkpoint(self, state: dict, messages: List[Message]) -> None:
+        await super().restore_checkpoint(state, messages)
+        bash_state = state.get("tools", {}).get("bash")
+        if bash_state:
+            for bash in self._own_bash():
+                await bash.restore_state(bash_state)
@@ -1,12 +1,17 @@
+import asyncio
 import json
-from typing import Any, List, Literal
+from typing import Any, Callable, Dict, List, Literal, Optional
 
-from pydantic import Field
+from pydantic import Field, PrivateAttr
 
+from app.agent.cascade import ModelCascade
 from app.agent.react import ReActAgent
+from app.llm import LLM
 from app.logger import logger
 from app.prompt.toolcall import NEXT_STEP_PROMPT, SYSTEM_PROMPT
 from app.schema import AgentState, Message, ToolCall
+from app.telemetry import bind
+from app.token_budget import BudgetState
 from app.tool import CreateChatCompletion, Terminate, ToolCollection
 
 
@@ -22,31 +27,87 @@ class ToolCallAgent(ReActAgent):
     system_prompt: str = SYSTEM_PROMPT
     next_step_prompt: str = NEXT_STEP_PROMPT
 
-    available_tools: ToolCollection = ToolCollection(
-        CreateChatCompletion(), Terminate()
+    available_tools: ToolCollection = Field(
+        default_factory=lambda: ToolCollection(CreateChatCompletion(), Terminate())
     )
     tool_choices: Literal["none", "auto", "required"] = "auto"
     special_tool_names: List[str] = Field(default_factory=lambda: [Terminate().name])
 
     tool_calls: List[ToolCall] = Field(default_factory=list)
 
+    # Stream the completion and start each tool as soon as its call is complete
+    stream_tool_calls: bool = False
+    token_callback: Optional[Callable[[str], None]] = Field(
+        default=None, exclude=True, description="Receives streamed content tokens"
+    )
+
     max_steps: int = 30
 
+    # Upper bound on concurrency-safe tool calls running at the same time
+    max_parallel_tools: int = 4
+
+    # Steps escalated to self.llm after trouble when it names a fast model
+    escalation_steps: int = 1
+
+    # Estimated prompt tokens sent at each step, after budgeting
+    prompt_token_usage: List[int] = Field(default_factory=list)
+
+    # Tool tasks started this step, aligned with self.tool_calls
+    _tool_tasks: List[asyncio.Task] = PrivateAttr(default_factory=list)
+    _tool_barrier: Optional[asyncio.Task] = PrivateAttr(default=None)
+    _safe_tool_tasks: List[asyncio.Task] = PrivateAttr(default_factory=list)
+    _tool_slots: Optional[asyncio.Semaphore] = PrivateAttr(default=None)
+    _cascade: Optional[ModelCascade] = PrivateAttr(default=None)
+    # One per model tier, so each model's prompt prefix stays stable
+    _budget_states: Dict[str, BudgetState] = PrivateAttr(default_factory=dict)
+    _system_msg: Optional[Message] = PrivateAttr(default=None)
+
     async def think(self) -> bool:
         """Process current state and decide next actions using tools"""
         if self.next_step_prompt:
             user_msg = Message.user_message(self.next_step_prompt)
-            self.messages += [user_msg]
+            self.memory.add_message(user_msg)
+
+        system_msgs = [self._system_message()] if self.system_prompt else None
+        tools = self.available_tools.to_params()
+
+        # Routine steps go to the fast model, troubled ones to self.llm
+        cascade = self.cascade
+        reason = self._step_escalation()
+        if reason:
+            cascade.escalate(reason)
+        tier, llm, reason = cascade.select()
+        if cascade.enabled:
+            logger.info(
+                f"🪜 {self.name} step {self.current_step}: {tier} model {llm.model}"
+                + (f" ({reason})" if reason else "")
+            )
+
+        # Keep the prompt inside the model's token budget
+        state = self._budget_states.setdefault(tier, BudgetState())
+        messages, budget = llm.budgeter.fit(
+            self.messages, system_msgs, tools, state=state
+        )
+        self.prompt_token_usage.append(budget.prompt_tokens)
+        if messages is self.messages:
+            # Untrimmed history goes out as memory's wire list, which only
+            # serialises the messages added since the last step
+            messages = self.memory.to_dict_list()
+        logger.info(f"📏 {self.name} step {self.current_step}: {budget}")
 
         # Get response with tool options
-        response = await self.llm.ask_tool(
-            messages=self.messages,
-            system_msgs=[Message.system_message(self.system_prompt)]
-            if self.system_prompt
-            else None,
-            tools=self.available_tools.to_params(),
+        ask_kwargs = dict(
+            messages=messages,
+            system_msgs=system_msgs,
+            tools=tools,
             tool_choice=self.tool_choices,
         )
+        with bind(tier=tier):
+            if self.stream_tool_calls and self.tool_choices != "none":
+                response = await self._think_streaming(llm, **ask_kwargs)
+            else:
+                self._reset_tool_schedule()
+                response = await llm.ask_tool(**ask_kwargs)
         self.tool_calls = response.tool_calls
 
         # Log response info
@@ -98,18 +159,181 @@ class ToolCallAgent(ReActAgent):
             )
             return False
 
+    async def step(self) -> str:
+        try:
+            return await super().step()
+        finally:
+            # Tools started while streaming outlive a step that ends early
+            await self._cancel_tool_tasks()
+
+    async def _cancel_tool_tasks(self) -> None:
+        """Cancel the tool tasks this step left unfinished and wait for them"""
+        tasks, self._tool_tasks = self._tool_tasks, []
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _system_message(self) -> Message:
+        """Reuse one system Message while the prompt is unchanged, so its wire dict stays cached"""
+        if self._system_msg is None or self._system_msg.content != self.system_prompt:
+            self._system_msg = Message.system_message(self.system_prompt)
+        return self._system_msg
+
+    @property
+    def cascade(self) -> ModelCascade:
+        """Model cascade for this agent, built from `llm`'s fast model on first use"""
+        if self._cascade is None or self._cascade.primary is not self.llm:
+            self._cascade = ModelCascade.for_llm(self.llm, self.escalation_steps)
+        return self._cascade
+
+    async def warm_up(self) -> None:
+        await self.available_tools.warm_up()
+
+    async def reset(self) -> None:
+        await super().reset()
+        self.tool_calls = []
+        self.stream_tool_calls = type(self).model_fields["stream_tool_calls"].default
+        self.token_callback = None
+        self.prompt_token_usage = []
+        self._reset_tool_schedule()
+        self._cascade = None
+        self._budget_states = {}
+        await self.available_tools.reset()
+
+    async def close(self) -> None:
+        await self.available_tools.close()
+
+    def checkpoint_state(self) -> dict:
+        state = super().checkpoint_state()
+        state["tools"] = self.available_tools.checkpoint_state()
+        return state
+
+    async def restore_checkpoint(self, state: dict, messages: List[Message]) -> None:
+        await super().restore_checkpoint(state, messages)
+        await self.available_tools.restore_state(state.get("tools", {}))
+
+    def _step_escalation(self) -> Optional[str]:
+        """Reason the coming step needs the primary model regardless of history.
+
+        Subclasses override this for steps that are hard by nature, such as
+        planning.
+        """
+        return None
+
+    def handle_stuck_state(self):
+        self.cascade.escalate("stuck")
+        super().handle_stuck_state()
+
+    async def _think_streaming(self, llm: LLM, **ask_kwargs) -> Message:
+        """Stream the completion, starting each tool call as soon as it is complete.
+
+        Tools are ordered as in `_start_tool`; `act` collects the results of
+        the tasks started here.
+        """
+        content: List[str] = []
+        tool_calls: List[ToolCall] = []
+        self._reset_tool_schedule()
+
+        try:
+            async for item in llm.ask_tool_stream(**ask_kwargs):
+                if isinstance(item, ToolCall):
+                    logger.info(f"🧰 Tool ready early: {item.function.name}")
+                    tool_calls.append(item)
+                    self._start_tool(item)
+                else:
+                    content.append(item)
+                    if self.token_callback:
+                        self.token_callback(item)
+        except Exception as e:
+            if not tool_calls and not content:
+                logger.warning(
+                    f"Streaming tool call failed ({e}), retrying without streaming"
+                )
+                return await llm.ask_tool(**ask_kwargs)
+            # Tools may already be running; keep what arrived so every call
+            # still gets its result recorded
+            logger.warning(f"Tool call stream interrupted, using partial response: {e}")
+
+        return Message(
+            role="assistant",
+            content="".join(content) or None,
+            tool_calls=tool_calls or None,
+        )
+
+    def _reset_tool_schedule(self) -> None:
+        self._tool_tasks = []
+        self._tool_barrier = None
+        self._safe_tool_tasks = []
+        self._tool_slots = asyncio.Semaphore(self.max_parallel_tools)
+
+    def _start_tool(self, command: ToolCall) -> asyncio.Task:
+        """Start `command` in a task, ordered against the calls started before it.
+
+        Consecutive concurrency-safe calls run together, at most
+        `max_parallel_tools` at a time. Any other call waits for everything
+        started before it, and everything started after it waits for it.
+        """
+        if self._is_concurrency_safe(command):
+            task = asyncio.create_task(
+                self._execute_after([self._tool_barrier], command, self._tool_slots)
+            )
+            self._safe_tool_tasks.append(task)
+        else:
+            task = asyncio.create_task(
+                self._execute_after(
+                    [self._tool_barrier, *self._safe_tool_tasks], command
+                )
+            )
+            self._tool_barrier = task
+            self._safe_tool_tasks = []
+        self._tool_tasks.append(task)
+        return task
+
+    def _is_concurrency_safe(self, command: ToolCall) -> bool:
+        try:
+            args = json.loads(command.function.arguments or "{}")
+        except json.JSONDecodeError:
+            return False
+        return isinstance(args, dict) and self.available_tools.is_concurrency_safe(
+            name=command.function.name, tool_input=args
+        )
+
+    async def _execute_after(
+        self,
+        dependencies: List[Optional[asyncio.Task]],
+        command: ToolCall,
+        slots: Optional[asyncio.Semaphore] = None,
+    ) -> str:
+        """Run `command` once the tools it depends on have finished"""
+        pending = [task for task in dependencies if task is not None]
+        if pending:
+            await asyncio.wait(pending)
+        if slots is None:
+            return await self.execute_tool(command)
+        async with slots:
+            return await self.execute_tool(command)
+
     async def act(self) -> str:
         """Execute tool calls and handle their results"""
         if not self.tool_calls:
+            self._tool_tasks = []
             if self.tool_choices == "required":
                 raise ValueError(TOOL_CALL_REQUIRED)
 
             # Return last message content if no tool calls
             return self.messages[-1].content or "No content or commands to execute"
 
+        # Start whatever was not already started while streaming
+        if not self._tool_tasks:
+            self._reset_tool_schedule()
+        for command in self.tool_calls[len(self._tool_tasks) :]:
+            self._start_tool(command)
+
+        # Tools may finish out of order; results enter memory in call order
         results = []
-        for command in self.tool_calls:
-            result = await self.execute_tool(command)
+        for command, task in zip(self.tool_calls, self._tool_tasks):
+            result = await task
             logger.info(
                 f"🎯 Tool '{command.function.name}' completed its mission! Result: {result}"
             )
@@ -121,15 +345,18 @@ class ToolCallAgent(ReActAgent):
             self.memory.add_message(tool_msg)
             results.append(result)
 
+        self._tool_tasks = []
         return "\n\n".join(results)
 
     async def execute_tool(self, command: ToolCall) -> str:
         """Execute a single tool call with robust error handling"""
         if not command or not command.function or not command.function.name:
+            self.cascade.escalate("invalid_tool_call")
             return "Error: Invalid command format"
 
         name = command.function.name
         if name not in self.available_tools.tool_map:
+            self.cascade.escalate("invalid_tool_call")
             return f"Error: Unknown tool '{name}'"
 
         try:
@@ -139,6 +366,8 @@ class ToolCallAgent(ReActAgent):
             # Execute the tool
             logger.info(f"🔧 Activating tool: '{name}'...")
             result = await self.available_tools.execute(name=name, tool_input=args)
+            if getattr(result, "error", None):
+                self.cascade.escalate("tool_error")
 
             # Format result for display
             observation = (
@@ -152,12 +381,14 @@ class ToolCallAgent(ReActAgent):
 
             return observation
         except json.JSONDecodeError:
+            self.cascade.escalate("invalid_tool_json")
             error_msg = f"Error parsing arguments for {name}: Invalid JSON format"
             logger.error(
                 f"📝 Oops! The arguments for '{name}' don't make sense - invalid JSON"
             )
             return f"Error: {error_msg}"
         except Exception as e:
+            self.cascade.escalate("tool_error")
             error_msg = f"⚠️ Tool '{name}' encountered a problem: {str(e)}"
             logger.error(error_msg)
             return f"Error: {error_msg}"
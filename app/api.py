@@ -9,7 +9,6 @@ import queue
 import time
 import asyncio
 import os
-import re
 import glob
 from pathlib import Path
 from starlette.responses import Response, FileResponse, RedirectResponse
@@ -44,6 +43,23 @@ except ImportError:
 from app.services.task_service import task_service
 from app.services.cos_service import cos_service
 from app.services.db_service import db_service
+from app.agent.pool import close_pools, get_pool, pool_stats
+from app.checkpoint import checkpoint_store
+from app.llm_cache import make_cache_key, response_cache
+from app.llm_router import router_stats, run_health_checks
+from app.prompt_cache import prompt_cache_stats
+from app.rate_limiter import rate_limiter_stats
+from app.event_bus import SlowConsumer, event_broker
+from app.event_stream import EventSocket, event_payload, is_completion
+from app.log_processing import clean_log_line, file_detector
+from app.scheduler import AdmissionRejected, task_scheduler
+from app.task_context import (
+    current_task_context, finish_task_context, get_task_context,
+    latest_task_context, open_task_context, root_context, start_task_context,
+)
+from app.telemetry import add_sink, set_context
+from app.worker import WorkerCrashed, WorkerTaskFailed, WorkerUnavailable, worker_pool
+from app.transport import aclose_http_client, get_openai_client, transport_stats
 
 app = FastAPI()
 
@@ -65,17 +81,9 @@ app.add_middleware(
 )
 
 # 全局变量
-generated_files = []
-current_task_logs = []
-pure_logs = []
-last_task_summary = ""
-completion_status = {"in_progress": False}
-summary_generation_status = {"in_progress": False}
-conversation_history = []
-logs_processor_callback = None  # 存储日志处理回调函数
-
-# 创建消息队列，用于存储日志消息
-message_queue = asyncio.Queue()
+# 日志缓冲、生成文件、事件通道等按任务保存在TaskContext中（app/task_context.py），
+# 通过contextvars随任务传播，多个任务可在同一事件循环中并发执行；
+# 任务的排队与并发由task_scheduler（app/scheduler.py）控制
 
 # 创建OpenAI客户端
 client = None
@@ -142,25 +150,17 @@ try:
         if openai_api_key:
             # 确保安装了最新的openai库
             try:
-                # 使用新的客户端方式
+                # 使用共享连接池的异步客户端，与LLM层复用同一组连接
                 if openai_base_url:
                     print(f"使用自定义API基础URL: {openai_base_url}")
-                    client = openai.OpenAI(
-                        api_key=openai_api_key,
-                        base_url=openai_base_url
-                    )
+                    client = get_openai_client(openai_api_key, openai_base_url)
                     # 同时设置全局配置（兼容旧代码）
                     openai.api_key = openai_api_key
                     openai.base_url = openai_base_url
                 else:
                     # 否则仅设置api_key
-                    client = openai.OpenAI(api_key=openai_api_key)
+                    client = get_openai_client(openai_api_key)
                     openai.api_key = openai_api_key
-                    
-                # 测试客户端连接
-                print("测试OpenAI客户端连接...")
-                models = client.models.list()
-                print(f"连接成功! 可用模型数量: {len(models.data) if hasattr(models, 'data') else '未知'}")
             except Exception as client_error:
                 print(f"创建OpenAI客户端时出错: {str(client_error)}")
                 # 尝试使用旧版兼容模式
@@ -179,183 +179,224 @@ except Exception as e:
     openai_base_url = ""
     client = None
 
+@app.on_event("startup")
+async def check_openai_connection():
+    """启动时测试OpenAI客户端连接（异步客户端无法在导入时调用）"""
+    if client is None:
+        return
+    try:
+        print("测试OpenAI客户端连接...")
+        models = await client.models.list()
+        print(f"连接成功! 可用模型数量: {len(models.data) if hasattr(models, 'data') else '未知'}")
+    except Exception as client_error:
+        print(f"OpenAI客户端连接测试失败: {str(client_error)}")
+
+@app.on_event("startup")
+async def record_task_usage():
+    """每次LLM调用的用量与耗时按任务汇总到任务服务
+    
+    只在API服务进程中注册：工作进程导入本模块时不会汇总，其调用记录转发到这里，
+    任务用量只在本进程中记录和保存一次"""
+    add_sink(task_service.record_llm_call)
+
+@app.on_event("startup")
+async def start_llm_health_checks():
+    """后台定期探测被熔断的LLM端点，恢复后重新加入路由"""
+    app.state.llm_health_check = asyncio.create_task(run_health_checks())
+
+def new_swe_agent():
+    """创建SWE智能体（每个实例拥有独立的工具集与bash会话）"""
+    from app.agent.swe import SWEAgent
+    return SWEAgent()
+
+@app.on_event("startup")
+async def start_agent_workers():
+    """按配置启动执行智能体任务的工作进程，未配置时任务在本进程中执行"""
+    worker_pool.start()
+
+@app.on_event("startup")
+async def warm_agent_pools():
+    """预先创建并预热智能体（启动bash会话），降低突发请求下的任务启动延迟"""
+    if worker_pool.enabled:
+        return  # 智能体在工作进程中创建和预热
+    get_pool("swe", new_swe_agent).start()
+
+@app.on_event("startup")
+async def recover_interrupted_tasks():
+    """重启前未完成的任务留有检查点：标记为中断，或按配置自动恢复执行"""
+    from app.config import config
+    for checkpoint in await asyncio.to_thread(checkpoint_store.list):
+        task_id = checkpoint["task_id"]
+        status = await task_service.get_task_status(task_id)
+        if status.get("status") in ("completed", "failed"):
+            continue
+        await task_service.ensure_task(
+            task_id, checkpoint.get("user_id", "anonymous"), checkpoint.get("prompt", "")
+        )
+        if config.checkpoint.resume_on_startup:
+            print(f"从第 {checkpoint['current_step']} 步恢复任务: {task_id}")
+            try:
+                await submit_agent_task(
+                    task_id, checkpoint.get("user_id", "anonymous"),
+                    checkpoint.get("prompt", ""), checkpoint.get("model"), resume=True
+                )
+            except AdmissionRejected as e:
+                print(f"任务 {task_id} 暂时无法恢复: {e.message}")
+        else:
+            await task_service.update_task_status(task_id, "interrupted")
+            print(f"任务因重启中断，可通过 /api/tasks/{task_id}/resume 恢复")
+
+@app.on_event("shutdown")
+async def close_shared_http_pool():
+    """关闭共享的HTTP连接池"""
+    health_check = getattr(app.state, "llm_health_check", None)
+    if health_check:
+        health_check.cancel()
+    await task_scheduler.close()
+    await worker_pool.close()
+    await close_pools()
+    await aclose_http_client()
+
 def log_interceptor(message):
     """拦截日志消息并将其添加到消息队列
     
     参数:
         message (str): 日志消息
     """
-    global message_queue, current_task_logs, conversation_history, generated_files, logs_processor_callback
-    
-    if not message_queue:
-        return
+    # 日志归属于当前任务；任务之外产生的日志归属于根上下文
+    task_ctx = current_task_context()
 
     try:
-        # 移除行首可能存在的前缀和颜色标记
+        # 移除行首的时间戳、日志级别、模块名等前缀（预编译的单次匹配）
         # 例如：2024-01-01 12:34:56 | INFO | app.module: 
-        cleaned_message = re.sub(r'^\d{4}-\d{2}-\d{2}\s+\d{2}:\d{2}:\d{2}.\d+\s+\|\s+\w+\s+\|\s+[\w\.]+:\s*', '', message)
-        
-        # 移除INFO/WARNING/ERROR前缀
-        cleaned_message = re.sub(r'^(INFO|WARNING|ERROR)\s*[:|]\s*', '', cleaned_message)
-        cleaned_message = re.sub(r'^(INFO|WARNING|ERROR)\s*\|\s*', '', cleaned_message)
-        
-        # 移除其他可能的前缀，如 | INFO | 
-        cleaned_message = re.sub(r'^\|\s*\w+\s*\|\s*', '', cleaned_message)
-        
-        # 移除一些特殊的标记符，可能导致前端显示问题
-        cleaned_message = cleaned_message.rstrip('|').strip()
-        
-        # 打印调试信息
-        print(f"日志拦截器: 原始消息 [{message[:50]}...] -> 清理后 [{cleaned_message[:50]}...]")
+        cleaned_message = clean_log_line(message)
         
         # 如果有日志处理回调函数，调用它
-        if logs_processor_callback and callable(logs_processor_callback):
-            logs_processor_callback(cleaned_message)
-        
-        # 检查是否包含文件生成信息
-        file_msg = None
-        file_patterns = [
-            r'(?:saved|created|generated|written)(?:\s*to)?\s*(?:file)?\s*[:]?\s*(?:as|to)?[:]?\s*[\'"]?(?P<filepath>[\w\-./\\]+\.\w+)[\'"]?',
-            r'file\s*(?:saved|created|generated)\s*[:]?\s*[\'"]?(?P<filepath>[\w\-./\\]+\.\w+)[\'"]?',
-            r'generated file\s*[:]?\s*[\'"]?(?P<filepath>[\w\-./\\]+\.\w+)[\'"]?'
-        ]
-        
-        for pattern in file_patterns:
-            match = re.search(pattern, cleaned_message)
-            if match:
-                file_path = match.group('filepath')
-                if file_path and os.path.exists(file_path):
-                    file_msg = {"content": cleaned_message, "file": file_path}
-                    if file_path not in generated_files:
-                        generated_files.append(file_path)
-                        print(f"识别到新生成的文件: {file_path}")
-                    break
+        if task_ctx.log_callback and callable(task_ctx.log_callback):
+            task_ctx.log_callback(cleaned_message)
         
-        # 将处理后的消息放入队列
-        if file_msg:
-            message_queue.put_nowait(file_msg)
-        else:
-            message_queue.put_nowait({
-                "content": cleaned_message
-            })
+        # 将处理后的消息发布到任务的事件通道
+        task_ctx.publish({
+            "content": cleaned_message
+        })
+        
+        # 检查是否包含文件生成信息：在后台线程中批量识别，识别到的文件另行推送文件事件
+        file_detector.submit(task_ctx, cleaned_message)
         
         # 添加到当前任务日志
         if cleaned_message != "处理完成":
-            current_task_logs.append(cleaned_message)
+            task_ctx.add_log(cleaned_message)
         
-        # 保存到对话历史
+        # 保存到对话历史（超出长度限制时丢弃最早的记录）
         if cleaned_message and isinstance(cleaned_message, str):
-            conversation_history.append({"role": "system", "content": cleaned_message})
-            # 限制历史记录长度
-            if len(conversation_history) > 100:
-                conversation_history.pop(0)
+            task_ctx.add_history("system", cleaned_message)
     except Exception as e:
         print(f"Failed to add message to queue: {str(e)}")
 
-async def event_generator():
-    """生成服务器发送事件流"""
-    global message_queue
+# 空闲连接发送心跳注释的间隔（秒），防止代理或浏览器因长时间无数据而断开
+SSE_HEARTBEAT_SECONDS = 15
+
+
+def format_sse_message(message, seq=None):
+    """将内部消息格式转换为前端期望的SSE数据帧；seq为事件序号，作为SSE的id供断线重连续传"""
+    # 转换为前端期望的格式（与WebSocket通道相同），附加消息ID
+    formatted_message = {"id": str(uuid.uuid4()), **event_payload(message)}
+    frame = f"data: {json.dumps(formatted_message)}\n\n"
+    return frame if seq is None else f"id: {seq}\n{frame}"
+
+
+def unknown_task_response():
+    """指定的task_id不存在或已过期时的404响应"""
+    return JSONResponse({"error": "任务不存在或已过期"}, status_code=404)
+
+
+def task_forbidden_response(request: Request, owner_id):
+    """任务不属于当前用户时的403响应；属于当前用户或没有记录所有者时返回None"""
+    user_info = getattr(request.state, "user", None)
+    user_id = user_info.get('user_id', 'anonymous') if user_info else 'anonymous'
+    if owner_id and str(owner_id) != str(user_id):
+        print(f"用户 {user_id} 尝试管理任务，但该任务属于用户 {owner_id}")
+        return JSONResponse({"error": "无权管理此任务"}, status_code=403)
+    return None
+
+
+def get_last_event_id(request: Request):
+    """读取客户端已收到的最后一个事件序号（Last-Event-ID请求头或last_event_id参数）"""
+    value = request.headers.get("last-event-id") or request.query_params.get("last_event_id")
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+
+async def event_generator(task_id=None, last_event_id=None):
+    """生成服务器发送事件流；指定task_id时只推送该任务的事件，否则推送所有任务的事件。
+    指定last_event_id时先补发该序号之后错过的事件"""
+    if task_id is None:
+        channel = root_context
+    else:
+        channel = get_task_context(task_id)
+        if channel is None:
+            # 未知或已过期的任务不能退回到全部任务的事件流，否则会泄露其他任务的日志
+            yield f"data: {json.dumps({'type': 'error', 'message': '任务不存在或已过期'}, ensure_ascii=False)}\n\n"
+            return
     
     # 创建此连接的唯一标识符
     connection_id = str(uuid.uuid4())
     print(f"新的SSE连接已建立: {connection_id}")
     
-    # 记录已发送消息的ID
-    sent_message_ids = set()
-    
-    # 发送初始连接事件
-    yield "event: connect\ndata: {}\n\n"
-    
-    # 发送一个欢迎消息
+    # 先订阅事件通道再发送欢迎消息，避免期间发布的事件丢失；
+    # 每个连接拥有独立的缓冲区，断线重连时先补发错过的事件
+    subscription = channel.subscribe(after=last_event_id)
     try:
-        welcome_msg = "已连接到OpenManus系统"
-        message_id = str(uuid.uuid4())
-        yield f"data: {{\"id\": \"{message_id}\", \"type\": \"log\", \"message\": \"{welcome_msg}\"}}\n\n"
-    except Exception as e:
-        print(f"欢迎消息发送错误: {str(e)}")
-    
-    # 创建一个副本队列，不影响其他连接
-    private_queue = asyncio.Queue()
-    
-    # 任务运行状态
-    running = True
-    
-    while running:
+        # 发送初始连接事件
+        yield "event: connect\ndata: {}\n\n"
+        
+        # 发送一个欢迎消息
         try:
-            # 获取所有队列中的消息，但不重复发送
+            welcome_msg = "已连接到OpenManus系统"
+            message_id = str(uuid.uuid4())
+            yield f"data: {{\"id\": \"{message_id}\", \"type\": \"log\", \"message\": \"{welcome_msg}\"}}\n\n"
+        except Exception as e:
+            print(f"欢迎消息发送错误: {str(e)}")
+        
+        # 任务运行状态
+        running = True
+        
+        while running:
+            # 阻塞等待新消息，空闲时只在心跳间隔到期时唤醒
             try:
-                # 从主队列获取一条消息
+                await asyncio.wait_for(subscription.wait(), timeout=SSE_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": heartbeat\n\n"
+                continue
+            except SlowConsumer:
+                # 客户端消费过慢，积压超过缓冲区上限，已被事件分发器断开
+                print(f"连接 {connection_id} 消费过慢，已断开")
+                break
+
+            # 取出积压的全部消息，合并为一次写入
+            frames = []
+            for seq, message in subscription.drain():
+                if not message:
+                    continue
+                # 如果消息带有任务完成标记，发送完成事件后结束
+                if is_completion(message):
+                    print(f"连接 {connection_id} 检测到任务完成信号")
+                    running = False
+                    completion_id = str(uuid.uuid4())
+                    frames.append(f"data: {{\"id\": \"{completion_id}\", \"type\": \"completion\"}}\n\n")
                 try:
-                    message = await asyncio.wait_for(message_queue.get(), timeout=0.1)
-                    
-                    # 生成消息ID（基于内容和时间戳）
-                    message_id = str(uuid.uuid4())
-                    
-                    # 如果消息带有任务完成标记，设置running为False
-                    if isinstance(message, dict) and message.get("content") == "处理完成":
-                        print(f"连接 {connection_id} 检测到任务完成信号")
-                        running = False
-                        # 发送完成事件
-                        completion_id = str(uuid.uuid4())
-                        yield f"data: {{\"id\": \"{completion_id}\", \"type\": \"completion\"}}\n\n"
-                    
-                    # 将消息放入私有队列
-                    if message_id not in sent_message_ids:
-                        sent_message_ids.add(message_id)
-                        # 将原始消息和消息ID一起放入队列
-                        await private_queue.put((message, message_id))
-                    
-                except asyncio.TimeoutError:
-                    # 超时，没有新消息
-                    pass
-                    
-                # 从私有队列获取一条消息并发送
-                if not private_queue.empty():
-                    message, msg_id = private_queue.get_nowait()
-                    if message:
-                        # 将内部消息格式转换为前端期望的格式
-                        try:
-                            if isinstance(message, dict):
-                                content = message.get("content", "")
-                                formatted_message = {
-                                    "id": msg_id,
-                                    "type": "log",
-                                    "message": content
-                                }
-                                
-                                # 如果是文件更新消息，转换为file类型
-                                if "file" in message and message.get("file"):
-                                    formatted_message["type"] = "file"
-                                    formatted_message["filename"] = message.get("file")
-                                
-                                message_json = json.dumps(formatted_message)
-                                print(f"连接 {connection_id} 发送消息: {str(formatted_message)[:50]}...")
-                                yield f"data: {message_json}\n\n"
-                            else:
-                                # 简单字符串消息
-                                formatted_message = {
-                                    "id": msg_id,
-                                    "type": "log",
-                                    "message": str(message)
-                                }
-                                message_json = json.dumps(formatted_message)
-                                yield f"data: {message_json}\n\n"
-                        except Exception as json_err:
-                            print(f"JSON序列化错误: {str(json_err)}, 消息: {str(message)[:100]}")
-                else:
-                    # 队列为空，短暂等待
-                    await asyncio.sleep(0.1)
-                    
-            except Exception as queue_err:
-                print(f"队列操作错误: {str(queue_err)}")
-                await asyncio.sleep(0.5)
-            
-        except Exception as e:
-            print(f"生成事件错误: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            # 发生错误后短暂等待
-            await asyncio.sleep(1)
+                    frames.append(format_sse_message(message, seq))
+                except Exception as json_err:
+                    print(f"JSON序列化错误: {str(json_err)}, 消息: {str(message)[:100]}")
+                if not running:
+                    break
+            if frames:
+                yield "".join(frames)
+    finally:
+        # 客户端断开时也要退订，避免事件继续堆积在缓冲区中
+        channel.unsubscribe(subscription)
     
     print(f"SSE连接 {connection_id} 已结束")
 
@@ -363,38 +404,46 @@ async def event_generator():
 # 发送日志消息
 def event_generator_send_log(message, level="info"):
     try:
-        if message_queue:
-            message_queue.put_nowait({
-                "content": message,
-                "level": level
-            })
+        current_task_context().publish({
+            "content": message,
+            "level": level
+        })
     except Exception as e:
         print(f"发送日志消息错误: {str(e)}")
 
+# 发送模型流式输出的token
+def event_generator_send_token(token):
+    try:
+        current_task_context().publish({
+            "content": token,
+            "type": "token"
+        })
+    except Exception as e:
+        print(f"发送token消息错误: {str(e)}")
+
 # 发送文件通知
 def event_generator_send_file(file_path):
     try:
-        if message_queue:
-            message_queue.put_nowait({
-                "content": f"已识别文件: {file_path}",
-                "file": file_path
-            })
+        current_task_context().publish({
+            "content": f"已识别文件: {file_path}",
+            "file": file_path
+        })
     except Exception as e:
         print(f"发送文件通知错误: {str(e)}")
 
 # 发送完成事件
 def event_generator_send_completion():
     try:
-        if message_queue:
-            message_queue.put_nowait({
-                "content": "处理完成"
-            })
+        current_task_context().publish({
+            "content": "处理完成"
+        })
     except Exception as e:
         print(f"发送完成事件错误: {str(e)}")
 
 # 设置静态方法
 event_generator.send_log = event_generator_send_log
 event_generator.send_file = event_generator_send_file
+event_generator.send_token = event_generator_send_token
 event_generator.send_completion = event_generator_send_completion
 
 # 如果前端构建目录存在，则挂载静态文件
@@ -471,8 +520,12 @@ async def stream_logs(request: Request):
         "Connection": "keep-alive",
         "Content-Type": "text/event-stream"
     }
+    # 可通过task_id参数只订阅单个任务的事件，重连时根据Last-Event-ID补发错过的事件
+    task_id = request.query_params.get("task_id")
+    if task_id is not None and get_task_context(task_id) is None:
+        return unknown_task_response()
     return StreamingResponse(
-        event_generator(), 
+        event_generator(task_id, get_last_event_id(request)), 
         media_type="text/event-stream",
         headers=headers
     )
@@ -486,12 +539,42 @@ async def stream_events(request: Request):
         "Connection": "keep-alive",
         "Content-Type": "text/event-stream"
     }
+    # 可通过task_id参数只订阅单个任务的事件，重连时根据Last-Event-ID补发错过的事件
+    task_id = request.query_params.get("task_id")
+    if task_id is not None and get_task_context(task_id) is None:
+        return unknown_task_response()
     return StreamingResponse(
-        event_generator(), 
+        event_generator(task_id, get_last_event_id(request)), 
         media_type="text/event-stream",
         headers=headers
     )
 
+@app.websocket("/api/ws/events")
+async def websocket_events(websocket: WebSocket):
+    """WebSocket事件通道：一个连接可订阅多个任务，事件按帧批量推送，支持msgpack编码与客户端流控
+    
+    查询参数: encoding=json|msgpack，credit=初始可接收的帧数（不传则不限流）；
+    订阅、退订与追加额度的消息格式见 app.event_stream.EventSocket
+    """
+    # 与HTTP接口相同的认证：URL参数中的用户信息、auth_token或Authorization头
+    if await verify_auth(websocket) is None:
+        await websocket.close(code=1008, reason="需要登录")
+        return
+    params = websocket.query_params
+    try:
+        credit = int(params["credit"]) if params.get("credit") else None
+        session = EventSocket(websocket, encoding=params.get("encoding", "json"), credit=credit)
+    except ValueError as e:
+        await websocket.close(code=1003, reason=str(e))
+        return
+    await websocket.accept()
+    connection_id = str(uuid.uuid4())
+    print(f"新的WebSocket事件连接已建立: {connection_id}")
+    try:
+        await session.serve()
+    finally:
+        print(f"WebSocket事件连接 {connection_id} 已结束: {session.stats()}")
+
 @app.post("/api/prompt")
 @Web()  # 默认需要认证
 async def handle_prompt(request: Request, prompt_data: dict):
@@ -510,7 +593,7 @@ async def handle_prompt(request: Request, prompt_data: dict):
             return {"status": "error", "message": error_msg}
         
         # 保存到对话历史
-        conversation_history.append({"role": "user", "content": prompt})
+        current_task_context().add_history("user", prompt)
         
         # 发送到前端日志
         log_interceptor(f"用户: {prompt}")
@@ -532,11 +615,24 @@ async def handle_prompt(request: Request, prompt_data: dict):
             from app.config import config
             default_model = config.llm["default"].model
             
-            # 异步执行代理，使用配置的默认模型
-            asyncio.create_task(process_prompt_with_agent(prompt, default_model, None))
+            # 从请求状态中获取用户信息（由认证装饰器添加），任务按用户计入配额
+            user_info = getattr(request.state, "user", None)
+            user_id = user_info.get('user_id', 'anonymous') if user_info else 'anonymous'
+            
+            # 先创建任务记录，调用方可据此轮询任务状态
+            task_id = await task_service.create_task(user_id, prompt)
+            
+            # 交给调度器异步执行代理，使用配置的默认模型；队列已满时返回429
+            try:
+                position = await submit_agent_task(task_id, user_id, prompt, default_model, user_info)
+            except AdmissionRejected as e:
+                return busy_response(e)
             
             # 返回成功消息
-            return {"status": "success", "message": "命令已提交"}
+            return {
+                "status": "success", "message": "命令已提交",
+                "task_id": task_id, "queue_position": position
+            }
         except Exception as e:
             error_msg = f"创建代理失败: {str(e)}"
             print(error_msg)
@@ -677,17 +773,19 @@ async def generate_task_summary(prompt, logs):
     返回:
         str: 生成的摘要
     """
-    global summary_generation_status, last_task_summary, client, message_queue
+    # 摘要与生成状态记录在当前任务的上下文中，进度推送到该任务的事件通道
+    task_ctx = current_task_context()
+    last_task_summary = ""
     
     try:
-        summary_generation_status = {
+        task_ctx.summary_status = {
             "in_progress": True,
             "message": "正在生成任务摘要..."
         }
         
         if not openai_api_key:
             last_task_summary = "无法生成详细摘要：未配置OpenAI API密钥。请在config/config.toml中配置。"
-            summary_generation_status = {
+            task_ctx.summary_status = {
                 "in_progress": False,
                 "message": "未配置API密钥，无法生成摘要"
             }
@@ -705,11 +803,11 @@ async def generate_task_summary(prompt, logs):
         need_segmentation = total_length > segment_size
         
         # 通知前端开始生成摘要
-        message_queue.put_nowait("开始生成摘要...")
+        task_ctx.publish("开始生成摘要...")
         
         if need_segmentation:
             print(f"日志过长，将分段处理，共 {(total_length + segment_size - 1) // segment_size} 段")
-            message_queue.put_nowait(f"日志较长（{total_length}字符），正在分段分析...")
+            task_ctx.publish(f"日志较长（{total_length}字符），正在分段分析...")
             
             # 分段处理
             segments = []
@@ -719,7 +817,7 @@ async def generate_task_summary(prompt, logs):
             # 为每段生成摘要
             segment_summaries = []
             for i, segment in enumerate(segments):
-                message_queue.put_nowait(f"正在分析第 {i+1}/{len(segments)} 段日志...")
+                task_ctx.publish(f"正在分析第 {i+1}/{len(segments)} 段日志...")
                 print(f"生成第 {i+1}/{len(segments)} 段摘要，长度：{len(segment)}")
                 
                 segment_summary = await _generate_segment_summary(
@@ -731,20 +829,20 @@ async def generate_task_summary(prompt, logs):
                 
                 if segment_summary:
                     segment_summaries.append(segment_summary)
-                    message_queue.put_nowait(f"第 {i+1} 段分析完成")
+                    task_ctx.publish(f"第 {i+1} 段分析完成")
                 else:
-                    message_queue.put_nowait(f"第 {i+1} 段分析失败")
+                    task_ctx.publish(f"第 {i+1} 段分析失败")
             
             # 如果有多段摘要，合并生成最终摘要
             if len(segment_summaries) > 1:
-                message_queue.put_nowait("正在整合所有段落的分析结果...")
+                task_ctx.publish("正在整合所有段落的分析结果...")
                 print("生成最终摘要，整合所有段落分析")
                 
                 final_summary = await _generate_final_summary(segment_summaries, prompt)
                 
                 if final_summary:
                     last_task_summary = final_summary
-                    message_queue.put_nowait("摘要生成完成")
+                    task_ctx.publish("摘要生成完成")
                     print("成功生成最终任务摘要")
                 else:
                     # 如果最终摘要生成失败，使用所有段落摘要的拼接
@@ -753,7 +851,7 @@ async def generate_task_summary(prompt, logs):
                         for i, summary in enumerate(segment_summaries)
                     ])
                     last_task_summary = joined_summary
-                    message_queue.put_nowait("摘要整合过程中出现问题，已提供各段分析结果")
+                    task_ctx.publish("摘要整合过程中出现问题，已提供各段分析结果")
                     print("最终摘要生成失败，使用分段摘要拼接")
             elif len(segment_summaries) == 1:
                 # 只有一段摘要
@@ -763,7 +861,7 @@ async def generate_task_summary(prompt, logs):
                 # 没有摘要
                 error_msg = "所有段落分析均失败，无法生成摘要"
                 last_task_summary = error_msg
-                message_queue.put_nowait(error_msg)
+                task_ctx.publish(error_msg)
                 print(error_msg)
         else:
             # 日志不需要分段处理，直接生成摘要
@@ -772,12 +870,12 @@ async def generate_task_summary(prompt, logs):
             
             if summary:
                 last_task_summary = summary
-                message_queue.put_nowait("摘要生成完成")
+                task_ctx.publish("摘要生成完成")
                 print("成功生成任务摘要")
             else:
                 error_msg = "摘要生成失败"
                 last_task_summary = error_msg
-                message_queue.put_nowait(error_msg)
+                task_ctx.publish(error_msg)
                 print(error_msg)
         
     except Exception as e:
@@ -786,13 +884,14 @@ async def generate_task_summary(prompt, logs):
         import traceback
         traceback.print_exc()
         last_task_summary = error_msg
-        message_queue.put_nowait(error_msg)
+        task_ctx.publish(error_msg)
         
     finally:
-        summary_generation_status = {
+        task_ctx.summary_status = {
             "in_progress": False,
             "message": ""
         }
+        task_ctx.summary = last_task_summary
         return last_task_summary
 
 async def _generate_segment_summary(segment_text, prompt, segment_label, is_first_segment):
@@ -817,8 +916,27 @@ async def _generate_segment_summary(segment_text, prompt, segment_label, is_firs
                 {"role": "user", "content": user_message}
             ]
             
+            prefix = f"【{segment_label}分析】" if segment_label != "完整" else ""
+            
+            # 命中缓存时直接回放已有摘要
+            cache_key = None
+            if response_cache.accepts(0.2):
+                cache_key = make_cache_key(
+                    kind="segment_summary",
+                    model=openai_model,
+                    messages=messages,
+                    max_tokens=1000,
+                    temperature=0.2,
+                )
+                cached = await response_cache.get(cache_key)
+                if cached:
+                    if prefix:
+                        current_task_context().publish(prefix)
+                    current_task_context().publish(cached)
+                    return f"{prefix}\n{cached}" if prefix else cached
+            
             # 使用流式请求
-            stream_response = client.chat.completions.create(
+            stream_response = await client.chat.completions.create(
                 model=openai_model,
                 messages=messages,
                 temperature=0.2,
@@ -828,16 +946,17 @@ async def _generate_segment_summary(segment_text, prompt, segment_label, is_firs
             
             # 收集摘要内容
             summary_content = ""
-            prefix = f"【{segment_label}分析】" if segment_label != "完整" else ""
             
             if prefix:
-                message_queue.put_nowait(prefix)
+                current_task_context().publish(prefix)
                 
             async for content in _aiter_stream(stream_response):
                 summary_content += content
-                message_queue.put_nowait(content)
+                current_task_context().publish(content)
             
             if summary_content.strip():
+                if cache_key:
+                    await response_cache.set(cache_key, summary_content)
                 if prefix:
                     return f"{prefix}\n{summary_content}"
                 return summary_content
@@ -873,8 +992,24 @@ async def _generate_final_summary(segment_summaries, prompt):
                 {"role": "user", "content": user_message}
             ]
             
+            # 命中缓存时直接回放已有摘要
+            cache_key = None
+            if response_cache.accepts(0.2):
+                cache_key = make_cache_key(
+                    kind="final_summary",
+                    model=openai_model,
+                    messages=messages,
+                    max_tokens=1500,
+                    temperature=0.2,
+                )
+                cached = await response_cache.get(cache_key)
+                if cached:
+                    current_task_context().publish("\n\n【最终整合分析】\n")
+                    current_task_context().publish(cached)
+                    return f"【最终整合分析】\n{cached}"
+            
             # 使用流式请求
-            stream_response = client.chat.completions.create(
+            stream_response = await client.chat.completions.create(
                 model=openai_model,
                 messages=messages,
                 temperature=0.2,
@@ -883,15 +1018,17 @@ async def _generate_final_summary(segment_summaries, prompt):
             )
             
             # 发送分隔符
-            message_queue.put_nowait("\n\n【最终整合分析】\n")
+            current_task_context().publish("\n\n【最终整合分析】\n")
             
             # 收集摘要内容
             summary_content = ""
             async for content in _aiter_stream(stream_response):
                 summary_content += content
-                message_queue.put_nowait(content)
+                current_task_context().publish(content)
             
             if summary_content.strip():
+                if cache_key:
+                    await response_cache.set(cache_key, summary_content)
                 return f"【最终整合分析】\n{summary_content}"
             else:
                 raise Exception("生成的最终摘要内容为空")
@@ -907,8 +1044,8 @@ async def _generate_final_summary(segment_summaries, prompt):
 async def _aiter_stream(stream):
     """处理流式响应的辅助函数"""
     try:
-        for chunk in stream:
-            if hasattr(chunk.choices[0].delta, 'content') and chunk.choices[0].delta.content is not None:
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content is not None:
                 yield chunk.choices[0].delta.content
     except Exception as e:
         print(f"流式迭代出错: {str(e)}")
@@ -917,9 +1054,12 @@ async def _aiter_stream(stream):
         yield f"生成过程中发生错误: {str(e)}"
 
 # 修改process_prompt_with_agent方法，支持用户信息
-async def process_prompt_with_agent(prompt, model=None, user_info=None):
-    """处理提示并记录日志，支持用户信息"""
-    global generated_files, current_task_logs, pure_logs, logs_processor_callback
+async def process_prompt_with_agent(prompt, model=None, user_info=None, task_id=None, resume=False,
+                                    record_status=True):
+    """处理提示并记录日志，支持用户信息；task_id为已创建的任务记录（可选）；
+    resume为True时从该任务的检查点继续执行；
+    record_status为False时不写入任务状态，由调用方按结果写入（工作进程中执行时）"""
+    task_ctx = None
     
     try:
         # 如果未提供模型，使用配置中的默认模型
@@ -934,8 +1074,17 @@ async def process_prompt_with_agent(prompt, model=None, user_info=None):
         from app.services.task_service import task_service
         
         # 记录任务开始信息
-        task_id = await task_service.create_task(user_id, prompt)
-        await task_service.update_task_status(task_id, "running")
+        if task_id is None:
+            task_id = await task_service.create_task(user_id, prompt)
+        if record_status:
+            await task_service.update_task_status(task_id, "running")
+        
+        # 本任务（及其创建的子任务）发起的LLM调用都计入该任务的用量
+        set_context(task_id=str(task_id))
+        
+        # 本任务的日志缓冲、生成文件和事件通道，随contextvars传播到其创建的子任务，
+        # 与同一事件循环中并发执行的其他任务互不干扰
+        task_ctx = start_task_context(task_id, prompt)
         
         # 记录任务开始信息
         log_message = f"任务开始 - 模型: {model} - 任务ID: {task_id}"
@@ -945,16 +1094,11 @@ async def process_prompt_with_agent(prompt, model=None, user_info=None):
             log_message += f" - 用户: {user_info.get('username', '未知用户')}"
         
         # 暂存到内存而不是立即上传到数据库
-        current_task_logs.append(log_message)
+        task_ctx.add_log(log_message)
         
         # 发送到前端
         event_generator.send_log(log_message, level="system")
         
-        # 重置任务状态
-        generated_files = []
-        current_task_logs = []
-        pure_logs = []
-        
         # 用于跟踪分段任务的状态
         task_status = {
             "current_logs_length": 0,
@@ -972,8 +1116,8 @@ async def process_prompt_with_agent(prompt, model=None, user_info=None):
             
             # 添加到纯净日志和任务日志
             if cleaned_log:
-                pure_logs.append(cleaned_log)
-                current_task_logs.append(cleaned_log)
+                task_ctx.pure_logs.append(cleaned_log)
+                task_ctx.add_log(cleaned_log)
                 
                 # 注释掉实时上传日志的代码，改为只在内存中积累日志
                 # 异步方式记录到数据库
@@ -983,7 +1127,7 @@ async def process_prompt_with_agent(prompt, model=None, user_info=None):
                 task_status["current_logs_length"] += len(cleaned_log)
                 if task_status["current_logs_length"] >= task_status["segment_size"]:
                     # 获取当前日志内容
-                    current_segment = "\n".join(pure_logs)
+                    current_segment = "\n".join(task_ctx.pure_logs)
                     task_status["segments"].append(current_segment)
                     
                     # 启动文件识别任务
@@ -992,7 +1136,7 @@ async def process_prompt_with_agent(prompt, model=None, user_info=None):
                     
                     # 重置当前累计长度
                     task_status["current_logs_length"] = 0
-                    pure_logs.clear()  # 使用clear()而不是重新赋值
+                    task_ctx.pure_logs.clear()  # 使用clear()而不是重新赋值
         
         # 定义段处理函数
         async def process_segment(segment_text, segment_num):
@@ -1004,8 +1148,7 @@ async def process_prompt_with_agent(prompt, model=None, user_info=None):
                 if segment_files:
                     print(f"第 {segment_num} 段识别到 {len(segment_files)} 个文件")
                     for file in segment_files:
-                        if file not in generated_files:
-                            generated_files.append(file)
+                        if task_ctx.add_file(file):
                             print(f"添加新文件: {file}")
                             
                             # 上传文件到COS并记录到数据库
@@ -1030,37 +1173,66 @@ async def process_prompt_with_agent(prompt, model=None, user_info=None):
             except Exception as e:
                 print(f"处理第 {segment_num} 段时出错: {str(e)}")
         
-        # 设置全局回调
-        logs_processor_callback = logs_processor
+        # 设置本任务的日志回调
+        task_ctx.log_callback = logs_processor
         
-        # 创建并配置智能体
-        from app.agent.swe import SWEAgent
+        # 从智能体池取出已预热的智能体，任务结束后重置并归还
+        agent_pool = get_pool("swe", new_swe_agent)
+        agent = await agent_pool.acquire()
+        # 按任务选择模型：换用该模型的LLM实例，不修改各任务共享的LLM单例
+        agent.llm = agent.llm.with_model(model)
         
-        # 根据模型创建智能体
-        agent = SWEAgent()
-        agent.llm.model = model
+        # 流式接收工具调用，模型输出的文本逐token推送到前端
+        agent.stream_tool_calls = True
+        agent.token_callback = event_generator_send_token
         
         # 如果用户已登录，添加用户信息到智能体
         if user_info:
             agent.user_info = user_info
         
+        # 每步保存检查点，服务重启后可从断点继续，无需重跑已完成的LLM调用
+        checkpointer = checkpoint_store.writer(
+            task_id, prompt=prompt, model=model, user_id=user_id
+        )
+        agent.checkpointer = checkpointer
+        
         # 执行智能体任务
-        await agent.run(prompt)
+        try:
+            checkpoint = None
+            if resume:
+                checkpoint = await asyncio.to_thread(checkpoint_store.load, task_id)
+            if checkpoint is not None:
+                await agent.restore_checkpoint(checkpoint.agent_state, checkpoint.messages)
+                event_generator.send_log(
+                    f"从检查点恢复任务，继续第 {agent.current_step + 1} 步", level="system"
+                )
+                await agent.run()
+            else:
+                await agent.run(prompt)
+        finally:
+            agent_pool.release(agent)
+            # 任务被取消时，等待仍在线程中写入的检查点写完，
+            # 使取消接口随后删除的检查点不会被它重新创建
+            if checkpointer is not None:
+                await checkpointer.flush()
+        await asyncio.to_thread(checkpoint_store.delete, task_id)
+        
+        # 等待后台文件识别处理完本任务已产生的日志
+        await file_detector.flush(task_ctx)
         
         # 处理剩余日志
-        if pure_logs and task_status["current_logs_length"] > 0:
-            current_segment = "\n".join(pure_logs)
+        if task_ctx.pure_logs and task_status["current_logs_length"] > 0:
+            current_segment = "\n".join(task_ctx.pure_logs)
             print(f"处理剩余日志片段, 长度: {task_status['current_logs_length']} 字符")
             await process_segment(current_segment, len(task_status["segments"]) + 1)
         
         # 识别所有文件
-        if current_task_logs:
-            all_logs = "\n".join(current_task_logs)
+        if task_ctx.logs:
+            all_logs = "\n".join(task_ctx.logs)
             print(f"执行最终文件识别，总日志长度: {len(all_logs)} 字符")
             final_files = await identify_generated_files(all_logs, prompt)
             for file in final_files:
-                if file not in generated_files:
-                    generated_files.append(file)
+                if task_ctx.add_file(file):
                     
                     # 上传文件到COS并记录到数据库
                     try:
@@ -1081,13 +1253,13 @@ async def process_prompt_with_agent(prompt, model=None, user_info=None):
                         event_generator.send_file(os.path.basename(file))
         
         # 清除回调
-        logs_processor_callback = None
+        task_ctx.log_callback = None
         
         # 将所有积累的日志一次性上传到COS
-        if current_task_logs:
+        if task_ctx.logs:
             try:
                 # 合并所有日志
-                all_logs_text = "\n".join(current_task_logs)
+                all_logs_text = "\n".join(task_ctx.logs)
                 print(f"任务完成，一次性上传所有日志，总长度: {len(all_logs_text)} 字符")
                 
                 # 上传日志到COS
@@ -1104,14 +1276,30 @@ async def process_prompt_with_agent(prompt, model=None, user_info=None):
                 print(f"上传任务完整日志失败: {str(log_error)}")
                 # 日志上传失败不中断流程
         
+        # 记录本任务的LLM用量汇总
+        usage = task_service.get_task_usage(task_id)
+        if usage:
+            print(
+                f"任务LLM用量: {usage['calls']}次调用, "
+                f"{usage['prompt_tokens']}+{usage['completion_tokens']} tokens"
+                f"（缓存 {usage['cached_tokens']}）, 重试 {usage['retries']}次, "
+                f"LLM耗时 {usage['latency_seconds']:.1f}s"
+            )
+            if usage.get("by_tier"):
+                tiers = ", ".join(
+                    f"{tier} {stats['steps']}步" for tier, stats in usage["by_tier"].items()
+                )
+                print(f"任务模型分级: {tiers}")
+        
         # 更新任务状态为完成
-        await task_service.update_task_status(task_id, "completed")
+        if record_status:
+            await task_service.update_task_status(task_id, "completed")
         
         # 发送完成标记
         event_generator.send_completion()
         
         # 返回生成的文件列表和任务ID
-        return {"files": generated_files, "task_id": task_id}
+        return {"files": task_ctx.files, "task_id": task_id}
     except Exception as e:
         error_msg = f"处理任务时出错: {str(e)}"
         print(error_msg)
@@ -1121,11 +1309,11 @@ async def process_prompt_with_agent(prompt, model=None, user_info=None):
         # 更新任务状态为失败
         if 'task_id' in locals():
             # 检查是否有积累的日志需要上传
-            if 'current_task_logs' in locals() and current_task_logs:
+            if task_ctx is not None and task_ctx.logs:
                 try:
                     # 合并所有日志并添加错误信息
-                    current_task_logs.append(f"ERROR: {error_msg}")
-                    all_logs_text = "\n".join(current_task_logs)
+                    task_ctx.add_log(f"ERROR: {error_msg}")
+                    all_logs_text = "\n".join(task_ctx.logs)
                     print(f"任务失败，上传错误日志，总长度: {len(all_logs_text)} 字符")
                     
                     # 上传日志到COS
@@ -1139,7 +1327,8 @@ async def process_prompt_with_agent(prompt, model=None, user_info=None):
                     print(f"上传错误日志失败: {str(log_error)}")
             
             # 更新任务状态
-            await task_service.update_task_status(task_id, "failed", str(e))
+            if record_status:
+                await task_service.update_task_status(task_id, "failed", str(e))
         
         # 发送错误消息
         event_generator.send_log(error_msg, level="error")
@@ -1149,16 +1338,157 @@ async def process_prompt_with_agent(prompt, model=None, user_info=None):
         
         # 重新抛出异常
         raise
+    finally:
+        if task_ctx is not None:
+            finish_task_context(task_ctx)
+
+async def submit_agent_task(task_id, user_id, prompt, model=None, user_info=None, resume=False):
+    """把智能体任务交给调度器，返回排队位置（0表示已开始执行）
+    
+    无法接纳时更新任务状态（恢复的任务保持中断状态，可稍后重试）并抛出AdmissionRejected
+    """
+    # 排队期间即可按task_id订阅该任务的事件
+    task_ctx = open_task_context(task_id, prompt)
+    try:
+        return task_scheduler.submit(
+            task_id, user_id,
+            lambda: run_agent_task(prompt, model, user_info, task_id, resume),
+            # 恢复的任务已完成部分工作，优先执行
+            priority=-1 if resume else 0,
+        )
+    except AdmissionRejected as e:
+        finish_task_context(task_ctx)
+        await task_service.update_task_status(
+            task_id, "interrupted" if resume else "failed", e.message
+        )
+        raise
+
+async def run_agent_task(prompt, model, user_info, task_id, resume=False):
+    """在工作进程中执行智能体任务，日志与文件事件由工作进程推送回本进程；
+    未启用工作进程或没有存活的工作进程时在本进程中执行"""
+    if not worker_pool.enabled:
+        return await process_prompt_with_agent(prompt, model, user_info, task_id=task_id, resume=resume)
+    
+    job = {
+        "task_id": task_id, "prompt": prompt, "model": model,
+        "user_info": user_info, "resume": resume,
+    }
+    # 任务状态只由本进程写入：工作进程不写状态，只在完成消息中交回结果、日志URL与文件记录
+    await task_service.update_task_status(task_id, "running")
+    try:
+        outcome = await worker_pool.run(job)
+    except WorkerUnavailable as e:
+        print(f"工作进程不可用，任务 {task_id} 在本进程中执行: {str(e)}")
+        return await process_prompt_with_agent(prompt, model, user_info, task_id=task_id, resume=resume)
+    except WorkerTaskFailed as e:
+        # 错误日志与完成事件已由工作进程发出
+        await task_service.add_task_records(task_id, e.outcome.get("records"))
+        await task_service.update_task_status(task_id, "failed", str(e))
+        raise
+    except WorkerCrashed as e:
+        # 工作进程异常退出：保留检查点，任务可通过resume接口恢复
+        error_msg = f"执行任务的工作进程异常退出: {str(e)}"
+        print(error_msg)
+        await task_service.update_task_status(task_id, "interrupted", error_msg)
+        task_ctx = get_task_context(task_id)
+        if task_ctx is not None:
+            task_ctx.publish({"content": error_msg, "level": "error"})
+            task_ctx.publish({"content": "处理完成"})
+            finish_task_context(task_ctx)
+        raise
+    
+    # 工作进程记录的日志URL与上传文件，使任务详情与在本进程中执行时一致
+    await task_service.add_task_records(task_id, outcome.get("records"))
+    if "cancelled" not in outcome:
+        await task_service.update_task_status(task_id, "completed")
+    task_ctx = get_task_context(task_id)
+    if task_ctx is not None:
+        task_ctx.files = list(outcome.get("files", []))
+        finish_task_context(task_ctx)
+    return {"files": outcome.get("files", []), "task_id": task_id}
+
+def busy_response(e: AdmissionRejected):
+    """任务无法接纳时的429响应，附带队列长度与建议的重试间隔"""
+    return JSONResponse(
+        {"status": "error", "error": e.message, "queue_length": e.queue_length,
+         "retry_after": e.retry_after},
+        status_code=429,
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
+@app.post("/api/tasks/{task_id}/cancel")
+@Web()  # 默认需要认证
+async def cancel_task(request: Request, task_id: str):
+    """取消排队中或正在执行的任务"""
+    task_key = int(task_id) if task_id.isdigit() else task_id
+    forbidden = task_forbidden_response(
+        request, (await task_service.get_task_status(task_key)).get("user_id")
+    )
+    if forbidden is not None:
+        return forbidden
+    task_ctx = get_task_context(task_id)
+    # 执行中的任务在取消返回前已等待其检查点写入完成，此后删除检查点是安全的
+    if not await task_scheduler.cancel(task_id):
+        return JSONResponse({"error": "任务不在队列中或已结束"}, status_code=404)
+    await task_service.update_task_status(task_key, "cancelled")
+    await asyncio.to_thread(checkpoint_store.delete, task_id)
+    if task_ctx is not None:
+        # 通知订阅该任务的连接，任务已结束
+        task_ctx.publish({"content": "任务已取消"})
+        task_ctx.publish({"content": "处理完成"})
+        finish_task_context(task_ctx)
+    return JSONResponse({"status": "cancelled", "task_id": task_id})
+
+@app.post("/api/tasks/{task_id}/resume")
+@Web()  # 默认需要认证
+async def resume_task(request: Request, task_id: str):
+    """从最近的检查点继续执行中断的任务，而不是从头重跑"""
+    if task_scheduler.is_active(task_id):
+        return JSONResponse({"error": "任务正在排队或执行中"}, status_code=409)
+    checkpoint = await asyncio.to_thread(checkpoint_store.load, task_id)
+    if checkpoint is None:
+        return JSONResponse({"error": "该任务没有可恢复的检查点"}, status_code=404)
+    
+    prompt = checkpoint.meta.get("prompt", "")
+    user_info = getattr(request.state, "user", None)
+    await task_service.ensure_task(
+        checkpoint.task_id, checkpoint.meta.get("user_id", "anonymous"), prompt
+    )
+    forbidden = task_forbidden_response(
+        request, (await task_service.get_task_status(checkpoint.task_id)).get("user_id")
+    )
+    if forbidden is not None:
+        return forbidden
+    try:
+        position = await submit_agent_task(
+            checkpoint.task_id, checkpoint.meta.get("user_id", "anonymous"), prompt,
+            checkpoint.meta.get("model"), user_info, resume=True
+        )
+    except AdmissionRejected as e:
+        return busy_response(e)
+    return JSONResponse({
+        "status": "processing",
+        "task_id": checkpoint.task_id,
+        "resumed_from_step": checkpoint.agent_state.get("current_step"),
+        "queue_position": position,
+    })
 
 # 添加新的API端点
 @app.get("/api/files")
 @Web()  # 默认需要认证
 async def get_generated_files(request: Request):
-    """获取当前任务生成的文件列表和任务摘要"""
+    """获取任务生成的文件列表和任务摘要；未指定task_id时返回最近一个任务的"""
     file_list = []
+    task_id = request.query_params.get("task_id")
+    if task_id:
+        task_ctx = get_task_context(task_id)
+        if task_ctx is None:
+            return unknown_task_response()
+    else:
+        task_ctx = latest_task_context() or root_context
     
     # 构建文件对象列表
-    for file_path in generated_files:
+    for file_path in task_ctx.files:
         try:
             # 根据文件路径是字符串还是字典来获取文件信息
             actual_path = file_path if isinstance(file_path, str) else file_path.get("path", "")
@@ -1180,8 +1510,8 @@ async def get_generated_files(request: Request):
     # 返回文件列表和摘要
     return {
         "files": file_list,
-        "summary": last_task_summary,
-        "summary_status": summary_generation_status
+        "summary": task_ctx.summary,
+        "summary_status": task_ctx.summary_status
     }
 
 @app.get("/api/files/{file_id}/download")
@@ -1323,8 +1653,14 @@ async def download_file_query(request: Request, file_name: str):
 @app.get("/api/history")
 @Web()  # 默认需要认证
 async def get_history(request: Request):
-    """获取对话历史记录"""
-    return {"history": conversation_history}
+    """获取对话历史记录；指定task_id时只返回该任务的记录"""
+    task_id = request.query_params.get("task_id")
+    if not task_id:
+        return {"history": root_context.history}
+    task_ctx = get_task_context(task_id)
+    if task_ctx is None:
+        return unknown_task_response()
+    return {"history": task_ctx.history}
 
 # 挂载静态文件目录
 if STATIC_DIR.exists():
@@ -1493,6 +1829,80 @@ async def get_task_by_id(request: Request, task_id: int):
             status_code=500
         )
 
+@app.get("/api/debug/llm-transport")
+@Web(auth_required=False)
+async def debug_llm_transport(request: Request):
+    """查看共享HTTP连接池的使用率和等待时间"""
+    return transport_stats()
+
+@app.get("/api/debug/llm-rate-limits")
+@Web(auth_required=False)
+async def debug_llm_rate_limits(request: Request):
+    """查看各模型限流器的排队与429统计"""
+    return {"limiters": rate_limiter_stats()}
+
+@app.get("/api/debug/llm-cache")
+@Web(auth_required=False)
+async def debug_llm_cache(request: Request):
+    """查看LLM响应缓存的命中率与容量"""
+    return response_cache.stats()
+
+@app.get("/api/debug/llm-prompt-cache")
+@Web(auth_required=False)
+async def debug_llm_prompt_cache(request: Request):
+    """查看各模型提示词前缀缓存命中的token数"""
+    return {"models": prompt_cache_stats()}
+
+@app.get("/api/task_status/{task_id}")
+@Web(auth_required=False)
+async def get_task_status(request: Request, task_id: str):
+    """轻量查询任务状态与LLM用量（不加载日志和文件），支持内存模式的字符串ID"""
+    task = await task_service.get_task_status(int(task_id) if task_id.isdigit() else task_id)
+    if not task:
+        return JSONResponse({"error": f"找不到任务: {task_id}"}, status_code=404)
+    for key in ["created_at", "updated_at", "completed_at"]:
+        if isinstance(task[key], datetime):
+            task[key] = task[key].isoformat()
+    # 排队位置：0表示正在执行，None表示不在调度器中
+    task["queue_position"] = task_scheduler.position(task_id)
+    return task
+
+@app.get("/api/debug/scheduler")
+@Web(auth_required=False)
+async def debug_scheduler(request: Request):
+    """查看任务调度状态（并发数、队列深度、排队等待时间、拒绝与取消次数）"""
+    return task_scheduler.stats()
+
+@app.get("/api/debug/workers")
+@Web(auth_required=False)
+async def debug_workers(request: Request):
+    """查看工作进程状态（存活数量、各进程执行中的任务数、崩溃次数）"""
+    return worker_pool.stats()
+
+@app.get("/api/debug/log-processing")
+@Web(auth_required=False)
+async def debug_log_processing(request: Request):
+    """查看后台文件识别状态（排队行数、批次数、识别到的文件数、路径缓存命中）"""
+    return file_detector.stats()
+
+@app.get("/api/debug/events")
+@Web(auth_required=False)
+async def debug_events(request: Request):
+    """查看事件分发状态（订阅者数量、已发布事件数、丢弃与断开的慢消费者）"""
+    return event_broker.stats()
+
+@app.get("/api/debug/agent-pools")
+@Web(auth_required=False)
+async def debug_agent_pools(request: Request):
+    """查看智能体池状态（空闲数量、命中率、取用耗时）"""
+    return {"pools": pool_stats()}
+
+@app.get("/api/debug/llm-endpoints")
+@Web(auth_required=False)
+async def debug_llm_endpoints(request: Request):
+    """查看各模型端点的延迟、错误率与熔断状态"""
+    return {"routers": router_stats()}
+
 @app.get("/{full_path:path}")
 @Web(auth_required=False)  # 不需要认证 - 静态文件和前端页面公开访问
 async def serve_frontend(request: Request, full_path: str):
@@ -1646,10 +2056,17 @@ async def process_prompt(request: Request):
     # 从请求状态中获取用户信息（由认证装饰器添加）
     user_info = getattr(request.state, "user", None)
     
-    # 异步处理任务
-    asyncio.create_task(process_prompt_with_agent(prompt, model, user_info))
+    # 先创建任务记录，调用方可据此轮询任务状态
+    user_id = user_info.get('user_id', 'anonymous') if user_info else 'anonymous'
+    task_id = await task_service.create_task(user_id, prompt)
+    
+    # 交给调度器异步处理任务；队列已满时返回429
+    try:
+        position = await submit_agent_task(task_id, user_id, prompt, model, user_info)
+    except AdmissionRejected as e:
+        return busy_response(e)
     
-    return JSONResponse({'status': 'processing'})
+    return JSONResponse({'status': 'processing', 'task_id': task_id, 'queue_position': position})
 
 @app.get("/api/test")
 @Web(auth_required=False)
@@ -2077,11 +2494,18 @@ async def run_task(request: Request, prompt: str):
         "Content-Type": "text/event-stream"
     }
     
-    # 启动任务处理
-    asyncio.create_task(handle_prompt({"prompt": prompt}))
+    # 创建任务并交给调度器；队列已满时返回429
+    user_info = getattr(request.state, "user", None)
+    user_id = user_info.get('user_id', 'anonymous') if user_info else 'anonymous'
+    task_id = await task_service.create_task(user_id, prompt)
+    try:
+        await submit_agent_task(task_id, user_id, prompt, None, user_info)
+    except AdmissionRejected as e:
+        return busy_response(e)
     
+    # 只推送本任务的事件
     return StreamingResponse(
-        event_generator(), 
+        event_generator(task_id), 
         media_type="text/event-stream",
         headers=headers
     )
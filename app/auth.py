@@ -31,7 +31,8 @@ async def verify_auth(request: Request) -> Optional[dict]:
         return {}
     
     # 输出详细的请求信息，帮助调试
-    print(f"[DEBUG] 验证请求路径: {request.url.path} 请求方法: {request.method}")
+    # WebSocket握手同样经由此处认证，它没有请求方法
+    print(f"[DEBUG] 验证请求路径: {request.url.path} 请求方法: {request.scope.get('method', 'WEBSOCKET')}")
     print(f"[DEBUG] 请求头: {dict(request.headers)}")
     
     # 检查request.state是否已经有认证信息
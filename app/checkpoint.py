@@ -0,0 +1,191 @@
+"""Agent checkpoints in a local directory, so tasks survive a server restart."""
+
+import asyncio
+import json
+import os
+import re
+import shutil
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from app.config import PROJECT_ROOT, config
+from app.logger import logger
+from app.schema import Message
+
+
+_SAFE_ID = re.compile(r"^[\w-]+$")
+
+
+@dataclass
+class Checkpoint:
+    task_id: Any
+    meta: Dict[str, Any]  # prompt, model, user_id
+    agent_state: Dict[str, Any]
+    messages: List[Message]
+    saved_at: float
+
+
+class CheckpointWriter:
+    """Checkpoints one agent run into its task directory.
+
+    Memory is stored as an append-only log of messages plus a small state
+    file naming the slice of the log that memory currently holds, so each
+    checkpoint only writes the messages added since the previous one. The
+    log is rewritten when memory changed other than by appending and
+    trimming from the front, and once trimmed messages make up most of it.
+    """
+
+    def __init__(self, directory: Path, meta: Dict[str, Any], every_steps: int = 1):
+        self.directory = directory
+        self.meta = meta
+        self.every_steps = max(every_steps, 1)
+        self._logged = 0  # messages in the log file
+        self._tail: Optional[Message] = None  # last message written to the log
+        self._pending: Optional[asyncio.Future] = None  # write running in a thread
+
+    async def save(self, agent, force: bool = False) -> None:
+        """Checkpoint `agent`; failures are logged, never raised into the run."""
+        if not force and agent.current_step % self.every_steps:
+            return
+        messages = agent.memory.messages
+        new, rewrite = self._new_messages(messages)
+        lines = [json.dumps(msg.to_dict(), ensure_ascii=False) for msg in new]
+        logged = len(lines) if rewrite else self._logged + len(lines)
+        state = {
+            **self.meta,
+            "agent": agent.checkpoint_state(),
+            "start": logged - len(messages),
+            "count": len(messages),
+            "saved_at": time.time(),
+        }
+        self._pending = asyncio.ensure_future(
+            asyncio.to_thread(self._write, lines, rewrite, state)
+        )
+        try:
+            # A cancelled run leaves the thread writing; see flush()
+            await asyncio.shield(self._pending)
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"Checkpoint of task {self.meta['task_id']} failed: {e}")
+            self._tail = None  # rewrite the log next time
+            return
+        self._logged = logged
+        self._tail = messages[-1] if messages else None
+
+    async def flush(self) -> None:
+        """Wait for a write that outlived a cancelled `save`.
+
+        Call it before deleting the checkpoint, which the write would
+        otherwise recreate.
+        """
+        if self._pending is not None:
+            await asyncio.gather(self._pending, return_exceptions=True)
+
+    def _new_messages(self, messages: List[Message]):
+        """Messages not in the log yet, and whether the log must be rewritten."""
+        if self._tail is not None:
+            for i in range(len(messages) - 1, -1, -1):
+                if messages[i] is self._tail:
+                    # Compact once trimmed messages outnumber the kept ones
+                    if self._logged - (i + 1) > len(messages):
+                        break
+                    return messages[i + 1 :], False
+        return messages, True
+
+    def _write(self, lines: List[str], rewrite: bool, state: dict) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        log = self.directory / "messages.jsonl"
+        text = "".join(line + "\n" for line in lines)
+        if rewrite:
+            _replace(log, text)
+        elif text:
+            with open(log, "a", encoding="utf-8") as f:
+                f.write(text)
+        _replace(self.directory / "state.json", json.dumps(state, ensure_ascii=False))
+
+
+def _replace(path: Path, text: str) -> None:
+    """Write `text` to `path` atomically."""
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(text, encoding="utf-8")
+    os.replace(tmp, path)
+
+
+class CheckpointStore:
+    """Checkpoints of running tasks, one subdirectory per task id."""
+
+    def __init__(self, root: Path, enabled: bool = True, every_steps: int = 1):
+        self.root = root
+        self.enabled = enabled
+        self.every_steps = every_steps
+
+    @classmethod
+    def from_config(cls) -> "CheckpointStore":
+        settings = config.checkpoint
+        root = Path(settings.path)
+        if not root.is_absolute():
+            root = PROJECT_ROOT / root
+        return cls(root, enabled=settings.enabled, every_steps=settings.every_steps)
+
+    def _directory(self, task_id: Any) -> Optional[Path]:
+        name = str(task_id)
+        if not _SAFE_ID.match(name):
+            return None
+        return self.root / name
+
+    def writer(self, task_id: Any, **meta: Any) -> Optional[CheckpointWriter]:
+        """A writer for `task_id`'s run, or None when checkpoints are disabled."""
+        directory = self._directory(task_id)
+        if not self.enabled or directory is None:
+            return None
+        return CheckpointWriter(
+            directory, {"task_id": task_id, **meta}, self.every_steps
+        )
+
+    def load(self, task_id: Any) -> Optional[Checkpoint]:
+        directory = self._directory(task_id)
+        if directory is None:
+            return None
+        try:
+            state = json.loads((directory / "state.json").read_text(encoding="utf-8"))
+            with open(directory / "messages.jsonl", encoding="utf-8") as f:
+                lines = f.read().splitlines()
+        except (OSError, ValueError) as e:
+            if not isinstance(e, FileNotFoundError):
+                logger.warning(f"Checkpoint of task {task_id} unreadable: {e}")
+            return None
+        start, count = state.pop("start"), state.pop("count")
+        messages = [
+            Message(**json.loads(line)) for line in lines[start : start + count]
+        ]
+        return Checkpoint(
+            task_id=state.pop("task_id"),
+            agent_state=state.pop("agent"),
+            saved_at=state.pop("saved_at"),
+            meta=state,
+            messages=messages,
+        )
+
+    def list(self) -> List[Dict[str, Any]]:
+        """Task id, metadata and step of every stored checkpoint."""
+        if not self.root.is_dir():
+            return []
+        checkpoints = []
+        for path in self.root.glob("*/state.json"):
+            try:
+                state = json.loads(path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                continue
+            agent = state.pop("agent", {})
+            state["current_step"] = agent.get("current_step")
+            checkpoints.append(state)
+        return checkpoints
+
+    def delete(self, task_id: Any) -> None:
+        directory = self._directory(task_id)
+        if directory is not None:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+checkpoint_store = CheckpointStore.from_config()
@@ -1,7 +1,7 @@
 import threading
 import tomllib
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Dict, List, Literal, Optional
 
 from pydantic import BaseModel, Field
 
@@ -14,6 +14,19 @@ def get_project_root() -> Path:
 PROJECT_ROOT = get_project_root()
 WORKSPACE_ROOT = PROJECT_ROOT / "workspace"
 
+# [llm] keys describing its own model only, not inherited by [llm.*] sections
+PER_MODEL_KEYS = ("endpoints", "fast_config")
+
+
+class EndpointSettings(BaseModel):
+    base_url: str = Field(..., description="API base URL")
+    api_key: Optional[str] = Field(
+        None, description="API key; defaults to the model's api_key"
+    )
+    model: Optional[str] = Field(
+        None, description="Model name at this endpoint; defaults to the model's name"
+    )
+
 
 class LLMSettings(BaseModel):
     model: str = Field(..., description="Model name")
@@ -21,10 +34,130 @@ class LLMSettings(BaseModel):
     api_key: str = Field(..., description="API key")
     max_tokens: int = Field(4096, description="Maximum number of tokens per request")
     temperature: float = Field(1.0, description="Sampling temperature")
+    rpm: Optional[int] = Field(None, description="Requests-per-minute budget")
+    tpm: Optional[int] = Field(None, description="Tokens-per-minute budget")
+    max_concurrency: Optional[int] = Field(
+        None, description="Maximum number of in-flight requests"
+    )
+    max_input_tokens: int = Field(
+        32000, description="Prompt token budget; older observations are trimmed to fit"
+    )
+    endpoints: List[EndpointSettings] = Field(
+        default_factory=list,
+        description="Additional endpoints serving the same model, used for routing",
+    )
+    hedge_delay: Optional[float] = Field(
+        None, description="Seconds before a slow call is duplicated on another endpoint"
+    )
+    failure_threshold: int = Field(
+        5, description="Consecutive failures before an endpoint is ejected"
+    )
+    circuit_cooldown: float = Field(
+        30.0, description="Seconds an ejected endpoint waits before being probed"
+    )
+    fast_config: Optional[str] = Field(
+        None,
+        description="Name of an [llm.*] section whose model serves routine agent "
+        "steps; errors, stuck loops and planning steps escalate to this model",
+    )
+    prompt_cache: Literal["auto", "anthropic"] = Field(
+        "auto",
+        description="Prompt prefix caching: 'auto' relies on the provider's automatic "
+        "prefix matching, 'anthropic' adds explicit cache_control breakpoints",
+    )
+
+
+class HTTPSettings(BaseModel):
+    max_connections: int = Field(
+        100, description="Maximum number of connections in the shared pool"
+    )
+    max_keepalive_connections: int = Field(
+        20, description="Maximum number of idle keep-alive connections"
+    )
+    keepalive_expiry: float = Field(
+        30.0, description="Seconds an idle connection is kept alive"
+    )
+    http2: bool = Field(True, description="Enable HTTP/2 multiplexing if available")
+    connect_timeout: float = Field(10.0, description="Connect timeout in seconds")
+    pool_timeout: float = Field(
+        30.0, description="Seconds to wait for a free connection from the pool"
+    )
+
+
+class CacheSettings(BaseModel):
+    enabled: bool = Field(False, description="Cache LLM responses")
+    deterministic_only: bool = Field(
+        True, description="Only cache calls made with temperature 0"
+    )
+    ttl: Optional[float] = Field(
+        86400.0, description="Entry lifetime in seconds; unset keeps entries forever"
+    )
+    max_entries: int = Field(1024, description="Entries kept in the in-memory tier")
+    path: Optional[str] = Field(
+        "workspace/llm_cache.sqlite",
+        description="SQLite file for the on-disk tier; unset keeps the cache in memory",
+    )
+    max_disk_mb: int = Field(256, description="Size cap of the on-disk tier in MB")
+
+
+class TelemetrySettings(BaseModel):
+    log_calls: bool = Field(True, description="Log a debug line for every LLM call")
+    path: Optional[str] = Field(
+        None, description="JSONL file receiving one record per LLM call"
+    )
+
+
+class CheckpointSettings(BaseModel):
+    enabled: bool = Field(True, description="Checkpoint running agents after each step")
+    path: str = Field(
+        "workspace/checkpoints", description="Directory holding one checkpoint per task"
+    )
+    every_steps: int = Field(1, description="Steps between checkpoints")
+    resume_on_startup: bool = Field(
+        False, description="Resume interrupted tasks when the server starts"
+    )
+
+
+class SchedulerSettings(BaseModel):
+    max_concurrency: int = Field(4, description="Agent tasks running at once")
+    max_pending: int = Field(32, description="Queued tasks before new ones get 429")
+    max_running_per_user: int = Field(2, description="Running tasks per user")
+    max_queued_per_user: int = Field(8, description="Queued tasks per user")
+
+
+class WorkerSettings(BaseModel):
+    processes: int = Field(
+        0, description="Processes running agent tasks; 0 runs them in the API process"
+    )
+
+
+class EventSettings(BaseModel):
+    buffer_size: int = Field(
+        1000, description="Events buffered per subscriber; 0 means unbounded"
+    )
+    slow_consumer: Literal["drop_oldest", "disconnect"] = Field(
+        "drop_oldest", description="What happens to a subscriber whose buffer is full"
+    )
+    replay_size: int = Field(
+        1000, description="Recent events kept in memory per task for reconnecting clients"
+    )
+    spill_dir: Optional[str] = Field(
+        "workspace/events",
+        description="Directory receiving older task events; unset keeps only the recent ones",
+    )
 
 
 class AppConfig(BaseModel):
     llm: Dict[str, LLMSettings]
+    http: HTTPSettings = Field(default_factory=HTTPSettings)
+    llm_cache: CacheSettings = Field(default_factory=CacheSettings)
+    telemetry: TelemetrySettings = Field(default_factory=TelemetrySettings)
+    checkpoint: CheckpointSettings = Field(default_factory=CheckpointSettings)
+    # Idle agents kept warm per agent type, see app.agent.pool
+    agent_pool: Dict[str, int] = Field(default_factory=lambda: {"swe": 2})
+    scheduler: SchedulerSettings = Field(default_factory=SchedulerSettings)
+    worker: WorkerSettings = Field(default_factory=WorkerSettings)
+    events: EventSettings = Field(default_factory=EventSettings)
 
 
 class Config:
@@ -73,6 +206,8 @@ class Config:
         # 1. 加载通用LLM配置
         base_llm = raw_config.get("llm", {})
         default_settings = {
+            # 透传限流等其他标量配置项（rpm、tpm、max_concurrency等）
+            **{k: v for k, v in base_llm.items() if not isinstance(v, dict)},
             "model": base_llm.get("model"),
             "base_url": base_llm.get("base_url"), 
             "api_key": base_llm.get("api_key"),
@@ -80,13 +215,18 @@ class Config:
             "temperature": base_llm.get("temperature", 0.0),
         }
         config_dict["llm"]["default"] = default_settings
+        # 备用端点与级联的快速模型只属于[llm]本身的模型，不被[llm.*]等其他配置继承，
+        # 否则使用其他模型的配置会故障转移到提供另一个模型的端点，快速模型也会级联到自身
+        inherited_settings = {
+            k: v for k, v in default_settings.items() if k not in PER_MODEL_KEYS
+        }
         safe_api_key = f"{default_settings['api_key'][:5]}...{default_settings['api_key'][-4:]}" if default_settings['api_key'] else "None"
         print(f"[DEBUG] 默认LLM配置: model={default_settings['model']}, base_url={default_settings['base_url']}, api_key={safe_api_key}")
         
         # 2. 加载vision模型配置（如果存在）
         if "vision" in base_llm:
             vision_config = base_llm["vision"]
-            vision_settings = {**default_settings, **vision_config}
+            vision_settings = {**inherited_settings, **vision_config}
             config_dict["llm"]["vision"] = vision_settings
             safe_api_key = f"{vision_settings['api_key'][:5]}...{vision_settings['api_key'][-4:]}" if vision_settings['api_key'] else "None"
             print(f"[DEBUG] 视觉模型配置: model={vision_settings['model']}, base_url={vision_settings['base_url']}, api_key={safe_api_key}")
@@ -100,6 +240,30 @@ class Config:
                 "api_key": openai_settings.get("api_key"),
                 "max_tokens": base_llm.get("max_tokens", 4096),
                 "temperature": base_llm.get("temperature", 0.0),
+                "rpm": openai_settings.get("rpm", base_llm.get("rpm")),
+                "tpm": openai_settings.get("tpm", base_llm.get("tpm")),
+                "max_concurrency": openai_settings.get(
+                    "max_concurrency", base_llm.get("max_concurrency")
+                ),
+                "max_input_tokens": openai_settings.get(
+                    "max_input_tokens", base_llm.get("max_input_tokens", 32000)
+                ),
+                "prompt_cache": openai_settings.get(
+                    "prompt_cache", base_llm.get("prompt_cache", "auto")
+                ),
+                # 端点路由与熔断参数；备用端点只取本节的[[openai.endpoints]]
+                "endpoints": openai_settings.get("endpoints", []),
+                "hedge_delay": openai_settings.get(
+                    "hedge_delay", base_llm.get("hedge_delay")
+                ),
+                "failure_threshold": openai_settings.get(
+                    "failure_threshold", base_llm.get("failure_threshold", 5)
+                ),
+                "circuit_cooldown": openai_settings.get(
+                    "circuit_cooldown", base_llm.get("circuit_cooldown", 30.0)
+                ),
+                # 模型级联：常规步骤使用的[llm.*]快速模型配置
+                "fast_config": openai_settings.get("fast_config"),
             }
             config_dict["llm"]["openai"] = openai_config
             safe_api_key = f"{openai_config['api_key'][:5]}...{openai_config['api_key'][-4:]}" if openai_config['api_key'] else "None"
@@ -126,11 +290,36 @@ class Config:
         }
         
         for name, override_config in llm_overrides.items():
-            merged_config = {**default_settings, **override_config}
+            merged_config = {**inherited_settings, **override_config}
             config_dict["llm"][name] = merged_config
             safe_api_key = f"{merged_config['api_key'][:5]}...{merged_config['api_key'][-4:]}" if merged_config['api_key'] else "None"
             print(f"[DEBUG] 特定LLM配置 {name}: model={merged_config['model']}, base_url={merged_config['base_url']}, api_key={safe_api_key}")
         
+        # 6. 加载共享HTTP连接池配置
+        config_dict["http"] = raw_config.get("http", {})
+
+        # 7. 加载LLM响应缓存配置
+        config_dict["llm_cache"] = raw_config.get("llm_cache", {})
+
+        # 8. 加载LLM调用遥测配置
+        config_dict["telemetry"] = raw_config.get("telemetry", {})
+
+        # 9. 加载智能体检查点配置
+        config_dict["checkpoint"] = raw_config.get("checkpoint", {})
+
+        # 10. 加载智能体池配置（各类型预热的空闲智能体数量）
+        if "agent_pool" in raw_config:
+            config_dict["agent_pool"] = raw_config["agent_pool"]
+
+        # 11. 加载任务调度配置（并发上限、排队长度与每用户配额）
+        config_dict["scheduler"] = raw_config.get("scheduler", {})
+
+        # 12. 加载工作进程配置（智能体任务在独立进程中执行）
+        config_dict["worker"] = raw_config.get("worker", {})
+
+        # 13. 加载事件分发配置（每个订阅者的缓冲区大小与慢消费者策略）
+        config_dict["events"] = raw_config.get("events", {})
+
         # 创建最终的配置对象
         self._config = AppConfig(**config_dict)
         
@@ -141,5 +330,37 @@ class Config:
     def llm(self) -> Dict[str, LLMSettings]:
         return self._config.llm
 
+    @property
+    def http(self) -> HTTPSettings:
+        return self._config.http
+
+    @property
+    def llm_cache(self) -> CacheSettings:
+        return self._config.llm_cache
+
+    @property
+    def telemetry(self) -> TelemetrySettings:
+        return self._config.telemetry
+
+    @property
+    def checkpoint(self) -> CheckpointSettings:
+        return self._config.checkpoint
+
+    @property
+    def agent_pool(self) -> Dict[str, int]:
+        return self._config.agent_pool
+
+    @property
+    def scheduler(self) -> SchedulerSettings:
+        return self._config.scheduler
+
+    @property
+    def worker(self) -> WorkerSettings:
+        return self._config.worker
+
+    @property
+    def events(self) -> EventSettings:
+        return self._config.events
+
 
 config = Config()
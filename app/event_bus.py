@@ -0,0 +1,349 @@
+"""Fan-out pub/sub of task events to the streams watching them."""
+
+import asyncio
+import json
+import re
+from collections import deque
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Literal, Optional, Set, Tuple
+
+from app.config import PROJECT_ROOT, config
+from app.logger import logger
+
+
+SlowConsumerPolicy = Literal["drop_oldest", "disconnect"]
+
+# An event as subscribers receive it: its sequence number in the topic, and
+# the event itself
+Sequenced = Tuple[int, Any]
+
+# Events moved from memory to a replay log's spill file in one write
+_SPILL_BATCH: int = 100
+# Characters replaced in topic names to make spill file names
+_UNSAFE_NAME = re.compile(r"[^\w.-]")
+
+
+class SlowConsumer(Exception):
+    """Raised by `Subscription.get` once the broker disconnected a lagging subscriber."""
+
+
+class Subscription:
+    """One subscriber's view of a topic: a bounded ring buffer of pending events.
+
+    Publishing appends to the buffer and wakes the reader, never awaiting,
+    so a subscriber that stops reading only affects itself. Once
+    `buffer_size` events are pending (0 means unbounded), the policy applies:
+    "drop_oldest" overwrites the oldest pending event and counts it in
+    `dropped`, "disconnect" closes the subscription, and `get` raises
+    SlowConsumer after the events already buffered are read. Events are
+    buffered as (sequence number, event) pairs.
+    """
+
+    __slots__ = (
+        "topic",
+        "buffer_size",
+        "policy",
+        "dropped",
+        "delivered",
+        "replayed",
+        "closed",
+        "_buffer",
+        "_waiter",
+        "_wakeup",
+    )
+
+    def __init__(
+        self,
+        topic: Optional[str],
+        buffer_size: int,
+        policy: SlowConsumerPolicy,
+        replay: Optional[List[Sequenced]] = None,
+        wakeup: Optional[asyncio.Event] = None,
+    ):
+        self.topic = topic
+        self.buffer_size = buffer_size
+        self.policy = policy
+        self.dropped = 0
+        self.delivered = 0
+        self.closed = False
+        # Replayed events may exceed the buffer size; the limit applies to
+        # the events published from now on
+        self._buffer: Deque[Sequenced] = deque(replay or ())
+        self.replayed = len(self._buffer)
+        self._waiter: Optional[asyncio.Future] = None
+        # Set along with waking `wait`, for readers of several subscriptions
+        self._wakeup = wakeup
+        if wakeup is not None and (self._buffer or self.closed):
+            wakeup.set()
+
+    def _push(self, item: Sequenced) -> bool:
+        """Buffer `item`; False if the subscription gets disconnected for lagging."""
+        if self.closed:
+            return True
+        if self.buffer_size and len(self._buffer) >= self.buffer_size:
+            if self.policy == "disconnect":
+                self.close()
+                return False
+            self._buffer.popleft()
+            self.dropped += 1
+        self._buffer.append(item)
+        self._wake()
+        return True
+
+    def _wake(self) -> None:
+        if self._wakeup is not None:
+            self._wakeup.set()
+        waiter = self._waiter
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    def close(self) -> None:
+        self.closed = True
+        self._wake()
+
+    def empty(self) -> bool:
+        return not self._buffer
+
+    def get_nowait(self) -> Sequenced:
+        """The oldest pending event; raises IndexError if there is none."""
+        self.delivered += 1
+        return self._buffer.popleft()
+
+    def drain(self) -> List[Sequenced]:
+        """All pending events, oldest first."""
+        items = list(self._buffer)
+        self._buffer.clear()
+        self.delivered += len(items)
+        return items
+
+    async def wait(self) -> None:
+        """Wait until an event is pending; raises SlowConsumer once closed and empty."""
+        while not self._buffer:
+            if self.closed:
+                raise SlowConsumer(f"subscription to {self.topic or 'all'} closed")
+            self._waiter = asyncio.get_running_loop().create_future()
+            try:
+                await self._waiter
+            finally:
+                self._waiter = None
+
+    async def get(self) -> Sequenced:
+        await self.wait()
+        return self.get_nowait()
+
+
+class ReplayLog:
+    """Numbers a topic's events and keeps them for subscribers that reconnect.
+
+    The last `size` events stay in memory. With a `spill_path`, older events
+    are appended to that JSONL file in batches rather than forgotten, so a
+    client can resume a long task from any point; without one, only the
+    last `size` events can be replayed.
+    """
+
+    def __init__(self, size: int, spill_path: Optional[Path] = None):
+        self.size = size
+        self.spill_path = spill_path
+        self.seq = 0
+        self.spilled = 0  # events written to the spill file
+        self._recent: Deque[Sequenced] = deque()
+
+    def append(self, event: Any) -> int:
+        """Record `event`; its sequence number."""
+        self.seq += 1
+        if self.size <= 0:
+            return self.seq
+        self._recent.append((self.seq, event))
+        if self.spill_path is None:
+            if len(self._recent) > self.size:
+                self._recent.popleft()
+        elif len(self._recent) >= self.size + _SPILL_BATCH:
+            self._spill(_SPILL_BATCH)
+        return self.seq
+
+    def _spill(self, count: int) -> None:
+        batch = [self._recent.popleft() for _ in range(count)]
+        try:
+            self.spill_path.parent.mkdir(parents=True, exist_ok=True)
+            # The first write replaces whatever a previous run left behind
+            with open(self.spill_path, "a" if self.spilled else "w") as f:
+                f.write(
+                    "".join(
+                        json.dumps([seq, event], ensure_ascii=False, default=str) + "\n"
+                        for seq, event in batch
+                    )
+                )
+            self.spilled += count
+        except OSError as e:
+            logger.warning(f"Spilling events to {self.spill_path} failed: {e}")
+            self.spill_path = None  # keep replaying what is still in memory
+
+    def since(self, after: int) -> List[Sequenced]:
+        """The retained events numbered above `after`, oldest first."""
+        first_recent = self._recent[0][0] if self._recent else self.seq + 1
+        items: List[Sequenced] = []
+        if after + 1 < first_recent and self.spilled and self.spill_path is not None:
+            try:
+                with open(self.spill_path) as f:
+                    for line in f:
+                        seq, event = json.loads(line)
+                        if seq > after:
+                            items.append((seq, event))
+            except (OSError, ValueError) as e:
+                logger.warning(
+                    f"Reading spilled events from {self.spill_path} failed: {e}"
+                )
+        items.extend(item for item in self._recent if item[0] > after)
+        return items
+
+    def close(self) -> None:
+        self._recent.clear()
+        if self.spilled and self.spill_path is not None:
+            self.spill_path.unlink(missing_ok=True)
+
+
+class EventBroker:
+    """Delivers each published event to every subscriber of its topic.
+
+    Topics are task ids; subscribers of the None topic receive the events of
+    every topic. Each subscriber owns its buffer, so any number of viewers of
+    a task all see every event, and publishing costs one buffer append per
+    subscriber no matter how far behind some of them are.
+
+    Every topic numbers its events from 1, the None topic included, and keeps
+    them in a `ReplayLog`, so a subscriber passing the last number it saw
+    gets the events it missed before the new ones. Task topics spill to
+    `spill_dir`; the None topic only keeps `replay_size` events in memory.
+    """
+
+    def __init__(
+        self,
+        buffer_size: int = 1000,
+        slow_consumer: SlowConsumerPolicy = "drop_oldest",
+        replay_size: int = 1000,
+        spill_dir: Optional[Path] = None,
+    ):
+        self.buffer_size = buffer_size
+        self.slow_consumer = slow_consumer
+        self.replay_size = replay_size
+        self.spill_dir = spill_dir
+        self._topics: Dict[Optional[str], Set[Subscription]] = {}
+        self._logs: Dict[Optional[str], ReplayLog] = {}
+        self.published = 0
+        self.disconnected = 0
+        self.replayed = 0
+
+    @classmethod
+    def from_config(cls) -> "EventBroker":
+        settings = config.events
+        spill_dir = None
+        if settings.spill_dir:
+            spill_dir = Path(settings.spill_dir)
+            if not spill_dir.is_absolute():
+                spill_dir = PROJECT_ROOT / spill_dir
+        return cls(
+            buffer_size=settings.buffer_size,
+            slow_consumer=settings.slow_consumer,
+            replay_size=settings.replay_size,
+            spill_dir=spill_dir,
+        )
+
+    def _log(self, topic: Optional[str]) -> ReplayLog:
+        log = self._logs.get(topic)
+        if log is None:
+            spill_path = None
+            if topic is not None and self.spill_dir is not None:
+                name = _UNSAFE_NAME.sub("_", topic)
+                spill_path = self.spill_dir / f"{name}.jsonl"
+            log = self._logs[topic] = ReplayLog(self.replay_size, spill_path)
+        return log
+
+    def subscribe(
+        self,
+        topic: Optional[str] = None,
+        buffer_size: Optional[int] = None,
+        policy: Optional[SlowConsumerPolicy] = None,
+        after: Optional[int] = None,
+        wakeup: Optional[asyncio.Event] = None,
+    ) -> Subscription:
+        """Subscribe to `topic`, or to all topics if None; defaults from the broker.
+
+        With `after`, the retained events of the topic numbered above it are
+        buffered first. A number the topic has not reached yet, as after a
+        server restart, replays everything retained. `wakeup` is set whenever
+        an event is buffered or the subscription closes, so one reader can
+        wait on several subscriptions.
+        """
+        replay = None
+        if after is not None:
+            log = self._log(topic)
+            replay = log.since(after if after <= log.seq else 0)
+            self.replayed += len(replay)
+        subscription = Subscription(
+            topic,
+            self.buffer_size if buffer_size is None else buffer_size,
+            policy or self.slow_consumer,
+            replay,
+            wakeup,
+        )
+        self._topics.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        subscription.close()
+        subscribers = self._topics.get(subscription.topic)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._topics[subscription.topic]
+
+    def publish(self, topic: Optional[str], event: Any) -> None:
+        """Deliver `event` to the subscribers of `topic` and of all topics."""
+        self.published += 1
+        seq = self._log(topic).append(event)
+        self._deliver(self._topics.get(topic), (seq, event))
+        if topic is not None:
+            seq = self._log(None).append(event)
+            self._deliver(self._topics.get(None), (seq, event))
+
+    def _deliver(
+        self, subscribers: Optional[Set[Subscription]], item: Sequenced
+    ) -> None:
+        if not subscribers:
+            return
+        lagging = [s for s in subscribers if not s._push(item)]
+        for subscription in lagging:
+            self.disconnected += 1
+            self.unsubscribe(subscription)
+            logger.warning(
+                f"Disconnecting a slow subscriber of {subscription.topic or 'all tasks'} "
+                f"({subscription.buffer_size} events pending)"
+            )
+
+    def drop_topic(self, topic: str) -> None:
+        """Forget a task topic's replay log, deleting its spill file."""
+        log = self._logs.pop(topic, None)
+        if log is not None:
+            log.close()
+
+    def subscriber_count(self, topic: Optional[str] = None) -> int:
+        return len(self._topics.get(topic, ()))
+
+    def stats(self) -> dict:
+        subscriptions = [s for subs in self._topics.values() for s in subs]
+        return {
+            "buffer_size": self.buffer_size,
+            "slow_consumer": self.slow_consumer,
+            "topics": sum(1 for topic in self._topics if topic is not None),
+            "subscribers": len(subscriptions),
+            "published": self.published,
+            "dropped": sum(s.dropped for s in subscriptions),
+            "disconnected": self.disconnected,
+            "max_pending": max((len(s._buffer) for s in subscriptions), default=0),
+            "replay_logs": len(self._logs),
+            "replayed": self.replayed,
+            "spilled": sum(log.spilled for log in self._logs.values()),
+        }
+
+
+event_broker = EventBroker.from_config()
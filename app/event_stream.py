@@ -0,0 +1,241 @@
+"""Wire format of task events, and the WebSocket transport multiplexing them."""
+
+import asyncio
+import json
+from typing import Any, Dict, List, Optional
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+from app.event_bus import Subscription, event_broker
+from app.logger import logger
+from app.task_context import get_task_context, root_context
+
+
+try:
+    import msgpack
+
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
+
+# Log message that marks the end of a task's event stream
+COMPLETION_MESSAGE = "处理完成"
+
+
+def event_payload(message: Any) -> Dict[str, Any]:
+    """The client-facing form of an event published in a task context."""
+    if not isinstance(message, dict):
+        return {"type": "log", "message": str(message)}
+    payload = {"type": "log", "message": message.get("content", "")}
+    # Streamed model tokens
+    if message.get("type") == "token":
+        payload["type"] = "token"
+    # File notifications
+    if message.get("file"):
+        payload["type"] = "file"
+        payload["filename"] = message["file"]
+    return payload
+
+
+def is_completion(message: Any) -> bool:
+    return isinstance(message, dict) and message.get("content") == COMPLETION_MESSAGE
+
+
+class EventSocket:
+    """One WebSocket connection carrying the events of any number of tasks.
+
+    The client sends JSON text messages:
+
+        {"op": "subscribe", "task_id": "...", "last_event_id": 12}
+        {"op": "unsubscribe", "task_id": "..."}
+        {"op": "credit", "frames": 8}
+
+    A null or missing task_id stands for all tasks; last_event_id replays
+    the events missed after it, as Last-Event-ID does for SSE. The server
+    replies with {"type": "subscribed" | "unsubscribed" | "error", ...}
+    messages and sends events in batches, everything pending across the
+    subscriptions in one frame of at most `max_batch` events:
+
+        {"type": "events", "events": [{"task_id": "...", "id": 13,
+                                       "type": "log", "message": "..."}, ...]}
+
+    A task's subscription ends after its completion event. Frames are JSON
+    text, or msgpack binary with `encoding="msgpack"`; permessage-deflate
+    compression is negotiated by the server (uvicorn enables it by default).
+
+    With an initial `credit`, the server sends at most that many event
+    frames until the client grants more with "credit" messages, so a
+    dashboard that falls behind makes events queue in its subscriptions,
+    where the broker's slow-consumer policy applies, rather than in socket
+    buffers. Without one, frames are sent as fast as the client takes them.
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        encoding: str = "json",
+        credit: Optional[int] = None,
+        batch_delay: float = 0.02,
+        max_batch: int = 500,
+    ):
+        if encoding == "msgpack" and not MSGPACK_AVAILABLE:
+            raise ValueError("msgpack encoding requires the msgpack package")
+        if encoding not in ("json", "msgpack"):
+            raise ValueError(f"Unknown encoding: {encoding}")
+        self.websocket = websocket
+        self.encoding = encoding
+        self.credit = credit
+        self.batch_delay = batch_delay
+        self.max_batch = max_batch
+        self.subscriptions: Dict[Optional[str], Subscription] = {}
+        self.frames_sent = 0
+        self.events_sent = 0
+        self.bytes_sent = 0
+        self._wakeup = asyncio.Event()
+        # Replies to requests and event frames are sent from different tasks
+        self._send_lock = asyncio.Lock()
+
+    async def send(self, message: Dict[str, Any]) -> None:
+        async with self._send_lock:
+            if self.encoding == "msgpack":
+                data = msgpack.packb(message, default=str)
+                await self.websocket.send_bytes(data)
+            else:
+                data = json.dumps(message, ensure_ascii=False, default=str)
+                await self.websocket.send_text(data)
+            self.bytes_sent += len(data)
+
+    async def serve(self) -> None:
+        """Run until the client disconnects."""
+        receiver = asyncio.create_task(self._receive())
+        try:
+            while not receiver.done():
+                waiting = asyncio.create_task(self._wakeup.wait())
+                await asyncio.wait(
+                    [waiting, receiver], return_when=asyncio.FIRST_COMPLETED
+                )
+                waiting.cancel()
+                if receiver.done():
+                    break
+                # Let a burst accumulate so it goes out in one frame
+                if self.batch_delay:
+                    await asyncio.sleep(self.batch_delay)
+                self._wakeup.clear()
+                await self._flush()
+            receiver.result()  # surface errors other than a disconnect
+        except WebSocketDisconnect:
+            pass
+        finally:
+            receiver.cancel()
+            for subscription in self.subscriptions.values():
+                event_broker.unsubscribe(subscription)
+            self.subscriptions.clear()
+
+    async def _receive(self) -> None:
+        while True:
+            try:
+                request = json.loads(await self.websocket.receive_text())
+                op = request.get("op")
+                if op == "subscribe":
+                    await self._subscribe(
+                        request.get("task_id"), request.get("last_event_id")
+                    )
+                elif op == "unsubscribe":
+                    await self._unsubscribe(request.get("task_id"))
+                elif op == "credit":
+                    self.credit = (self.credit or 0) + max(int(request["frames"]), 0)
+                    self._wakeup.set()
+                else:
+                    await self.send({"type": "error", "message": f"unknown op: {op}"})
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                await self.send({"type": "error", "message": f"bad request: {e}"})
+
+    async def _subscribe(self, task_id: Any, last_event_id: Any) -> None:
+        if task_id is None:
+            channel = root_context
+        else:
+            channel = get_task_context(task_id)
+            if channel is None:
+                await self.send(
+                    {"type": "error", "task_id": task_id, "message": "unknown task"}
+                )
+                return
+        topic = channel.topic
+        if topic in self.subscriptions:
+            event_broker.unsubscribe(self.subscriptions.pop(topic))
+        subscription = channel.subscribe(
+            after=int(last_event_id) if last_event_id is not None else None,
+            wakeup=self._wakeup,
+        )
+        self.subscriptions[topic] = subscription
+        await self.send(
+            {
+                "type": "subscribed",
+                "task_id": topic,
+                "replayed": subscription.replayed,
+            }
+        )
+
+    async def _unsubscribe(self, task_id: Any) -> None:
+        topic = None if task_id is None else str(task_id)
+        subscription = self.subscriptions.pop(topic, None)
+        if subscription is not None:
+            event_broker.unsubscribe(subscription)
+        await self.send({"type": "unsubscribed", "task_id": topic})
+
+    async def _flush(self) -> None:
+        """Send everything pending, as credit allows."""
+        while self.credit is None or self.credit > 0:
+            events = self._collect()
+            if not events:
+                return
+            await self.send({"type": "events", "events": events})
+            self.frames_sent += 1
+            self.events_sent += len(events)
+            if self.credit is not None:
+                self.credit -= 1
+        # Out of credit: a "credit" message wakes the loop up again
+
+    def _collect(self) -> List[Dict[str, Any]]:
+        """Take up to `max_batch` pending events across the subscriptions."""
+        events: List[Dict[str, Any]] = []
+        for topic, subscription in list(self.subscriptions.items()):
+            while not subscription.empty() and len(events) < self.max_batch:
+                seq, message = subscription.get_nowait()
+                if not message:
+                    continue
+                if topic is not None and is_completion(message):
+                    events.append({"task_id": topic, "type": "completion"})
+                    events.append(
+                        {"task_id": topic, "id": seq, **event_payload(message)}
+                    )
+                    # Nothing follows a task's completion
+                    del self.subscriptions[topic]
+                    event_broker.unsubscribe(subscription)
+                    break
+                events.append({"task_id": topic, "id": seq, **event_payload(message)})
+            if (
+                subscription.closed
+                and subscription.empty()
+                and topic in self.subscriptions
+            ):
+                # Disconnected by the broker for falling too far behind
+                del self.subscriptions[topic]
+                events.append(
+                    {"task_id": topic, "type": "error", "message": "slow consumer"}
+                )
+                logger.info(f"Event socket dropped its lagging subscription to {topic}")
+            if len(events) >= self.max_batch:
+                break
+        return events
+
+    def stats(self) -> dict:
+        return {
+            "encoding": self.encoding,
+            "subscriptions": list(self.subscriptions),
+            "credit": self.credit,
+            "frames_sent": self.frames_sent,
+            "events_sent": self.events_sent,
+            "bytes_sent": self.bytes_sent,
+        }
@@ -1,10 +1,13 @@
+import asyncio
 import json
+import re
 import time
-from typing import Dict, List, Optional, Union
+from typing import Collection, Dict, List, Optional, Union
 
 from pydantic import Field
 
 from app.agent.base import BaseAgent
+from app.exceptions import ToolError
 from app.flow.base import BaseFlow
 from app.llm import LLM
 from app.logger import logger
@@ -20,6 +23,9 @@ class PlanningFlow(BaseFlow):
     executor_keys: List[str] = Field(default_factory=list)
     active_plan_id: str = Field(default_factory=lambda: f"plan_{int(time.time())}")
     current_step_index: Optional[int] = None
+    # Plan steps whose dependencies are done run concurrently, each on an idle
+    # executor agent, up to this many at once
+    max_parallel_steps: int = 3
 
     def __init__(
         self, agents: Union[BaseAgent, List[BaseAgent], Dict[str, BaseAgent]], **data
@@ -44,22 +50,29 @@ class PlanningFlow(BaseFlow):
         if not self.executor_keys:
             self.executor_keys = list(self.agents.keys())
 
-    def get_executor(self, step_type: Optional[str] = None) -> BaseAgent:
+    def get_executor(
+        self, step_type: Optional[str] = None, busy: Collection[BaseAgent] = ()
+    ) -> Optional[BaseAgent]:
         """
         Get an appropriate executor agent for the current step.
         Can be extended to select agents based on step type/requirements.
+        Agents in `busy` are running other steps; returns None if all are busy.
         """
+
+        def idle(agent: Optional[BaseAgent]) -> bool:
+            return agent is not None and all(agent is not b for b in busy)
+
         # If step type is provided and matches an agent key, use that agent
-        if step_type and step_type in self.agents:
+        if step_type and idle(self.agents.get(step_type)):
             return self.agents[step_type]
 
         # Otherwise use the first available executor or fall back to primary agent
         for key in self.executor_keys:
-            if key in self.agents:
+            if idle(self.agents.get(key)):
                 return self.agents[key]
 
         # Fallback to primary agent
-        return self.primary_agent
+        return self.primary_agent if idle(self.primary_agent) else None
 
     async def execute(self, input_text: str) -> str:
         """Execute the planning flow with agents."""
@@ -79,24 +92,33 @@ class PlanningFlow(BaseFlow):
                     return f"Failed to create plan for: {input_text}"
 
             result = ""
+            running: Dict[asyncio.Task, BaseAgent] = {}
+            terminated = False
             while True:
-                # Get current step to execute
-                self.current_step_index, step_info = await self._get_current_step_info()
+                # Start every ready step an idle executor can take
+                if not terminated:
+                    await self._start_ready_steps(running)
 
                 # Exit if no more steps or plan completed
-                if self.current_step_index is None:
-                    result += await self._finalize_plan()
+                if not running:
+                    if not terminated:
+                        result += await self._finalize_plan()
                     break
 
-                # Execute current step with appropriate agent
-                step_type = step_info.get("type") if step_info else None
-                executor = self.get_executor(step_type)
-                step_result = await self._execute_step(executor, step_info)
-                result += step_result + "\n"
-
-                # Check if agent wants to terminate
-                if hasattr(executor, "state") and executor.state == AgentState.FINISHED:
-                    break
+                done, _ = await asyncio.wait(
+                    running, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    executor = running.pop(task)
+                    result += task.result() + "\n"
+
+                    # Check if agent wants to terminate; steps already
+                    # running are allowed to finish
+                    if (
+                        hasattr(executor, "state")
+                        and executor.state == AgentState.FINISHED
+                    ):
+                        terminated = True
 
             return result
         except Exception as e:
@@ -109,7 +131,9 @@ class PlanningFlow(BaseFlow):
 
         # Create a system message for plan creation
         system_message = Message.system_message(
-            "You are a planning assistant. Your task is to create a detailed plan with clear steps."
+            "You are a planning assistant. Your task is to create a detailed plan with clear steps. "
+            "Steps whose dependencies are completed are executed in parallel, so give "
+            "step_dependencies listing, for each step, the earlier steps it really needs."
         )
 
         # Create a user message with the request
@@ -142,7 +166,15 @@ class PlanningFlow(BaseFlow):
                     args["plan_id"] = self.active_plan_id
 
                     # Execute the tool via ToolCollection instead of directly
-                    result = await self.planning_tool.execute(**args)
+                    try:
+                        result = await self.planning_tool.execute(**args)
+                    except ToolError as e:
+                        if "step_dependencies" not in args:
+                            raise
+                        # Unusable dependencies: run the steps in order instead
+                        logger.warning(f"Ignoring plan step dependencies: {e}")
+                        args.pop("step_dependencies")
+                        result = await self.planning_tool.execute(**args)
 
                     logger.info(f"Plan creation result: {str(result)}")
                     return
@@ -160,75 +192,62 @@ class PlanningFlow(BaseFlow):
             }
         )
 
-    async def _get_current_step_info(self) -> tuple[Optional[int], Optional[dict]]:
+    async def _start_ready_steps(self, running: Dict[asyncio.Task, BaseAgent]) -> None:
+        """Start ready steps on idle executors, up to `max_parallel_steps` running."""
+        started = {task.get_name() for task in running}
+        for step_info in self._get_ready_steps(started):
+            if len(running) >= max(self.max_parallel_steps, 1):
+                return
+            executor = self.get_executor(step_info.get("type"), running.values())
+            if executor is None:
+                return
+            index = step_info["index"]
+            self.current_step_index = index
+            await self._mark_step(index, "in_progress")
+            task = asyncio.create_task(
+                self._execute_step(executor, step_info), name=str(index)
+            )
+            running[task] = executor
+
+    def _get_ready_steps(self, started: Collection[str] = ()) -> List[dict]:
         """
-        Parse the current plan to identify the first non-completed step's index and info.
-        Returns (None, None) if no active step is found.
+        Info of the unfinished steps whose dependencies are completed, in plan
+        order, skipping steps already started. Empty if the plan is missing.
         """
         if (
             not self.active_plan_id
             or self.active_plan_id not in self.planning_tool.plans
         ):
             logger.error(f"Plan with ID {self.active_plan_id} not found")
-            return None, None
+            return []
 
         try:
-            # Direct access to plan data from planning tool storage
-            plan_data = self.planning_tool.plans[self.active_plan_id]
-            steps = plan_data.get("steps", [])
-            step_statuses = plan_data.get("step_statuses", [])
-
-            # Find first non-completed step
-            for i, step in enumerate(steps):
-                if i >= len(step_statuses):
-                    status = "not_started"
-                else:
-                    status = step_statuses[i]
-
-                if status in ["not_started", "in_progress"]:
-                    # Extract step type/category if available
-                    step_info = {"text": step}
-
-                    # Try to extract step type from the text (e.g., [SEARCH] or [CODE])
-                    import re
-
-                    type_match = re.search(r"\[([A-Z_]+)\]", step)
-                    if type_match:
-                        step_info["type"] = type_match.group(1).lower()
+            steps = self.planning_tool.plans[self.active_plan_id].get("steps", [])
+            ready = self.planning_tool.ready_steps(
+                self.active_plan_id, exclude={int(i) for i in started}
+            )
+        except Exception as e:
+            logger.warning(f"Error finding ready steps: {e}")
+            return []
 
-                    # Mark current step as in_progress
-                    try:
-                        await self.planning_tool.execute(
-                            command="mark_step",
-                            plan_id=self.active_plan_id,
-                            step_index=i,
-                            step_status="in_progress",
-                        )
-                    except Exception as e:
-                        logger.warning(f"Error marking step as in_progress: {e}")
-                        # Update step status directly if needed
-                        if i < len(step_statuses):
-                            step_statuses[i] = "in_progress"
-                        else:
-                            while len(step_statuses) < i:
-                                step_statuses.append("not_started")
-                            step_statuses.append("in_progress")
-
-                        plan_data["step_statuses"] = step_statuses
-
-                    return i, step_info
-
-            return None, None  # No active step found
+        step_infos = []
+        for i in ready:
+            # Extract step type/category if available
+            step_info = {"index": i, "text": steps[i]}
 
-        except Exception as e:
-            logger.warning(f"Error finding current step index: {e}")
-            return None, None
+            # Try to extract step type from the text (e.g., [SEARCH] or [CODE])
+            type_match = re.search(r"\[([A-Z_]+)\]", steps[i])
+            if type_match:
+                step_info["type"] = type_match.group(1).lower()
+            step_infos.append(step_info)
+        return step_infos
 
     async def _execute_step(self, executor: BaseAgent, step_info: dict) -> str:
-        """Execute the current step with the specified agent using agent.run()."""
+        """Execute the given step with the specified agent using agent.run()."""
+        step_index = step_info.get("index", self.current_step_index)
         # Prepare context for the agent with current plan status
         plan_status = await self._get_plan_text()
-        step_text = step_info.get("text", f"Step {self.current_step_index}")
+        step_text = step_info.get("text", f"Step {step_index}")
 
         # Create a prompt for the agent to execute the current step
         step_prompt = f"""
@@ -236,7 +255,7 @@ class PlanningFlow(BaseFlow):
         {plan_status}
 
         YOUR CURRENT TASK:
-        You are now working on step {self.current_step_index}: "{step_text}"
+        You are now working on step {step_index}: "{step_text}"
 
         Please execute this step using the appropriate tools. When you're done, provide a summary of what you accomplished.
         """
@@ -245,29 +264,43 @@ class PlanningFlow(BaseFlow):
         try:
             step_result = await executor.run(step_prompt)
 
-            # Mark the step as completed after successful execution
-            await self._mark_step_completed()
+            # Mark the step as completed after successful execution, keeping
+            # the gist of its result in the plan for the steps that depend on it
+            await self._mark_step(
+                step_index, "completed", self._result_note(step_result)
+            )
 
             return step_result
         except Exception as e:
-            logger.error(f"Error executing step {self.current_step_index}: {e}")
-            return f"Error executing step {self.current_step_index}: {str(e)}"
+            logger.error(f"Error executing step {step_index}: {e}")
+            await self._mark_step(step_index, "blocked", f"Error: {e}")
+            return f"Error executing step {step_index}: {str(e)}"
+
+    @staticmethod
+    def _result_note(step_result: str, limit: int = 500) -> str:
+        """The end of a step's result, where agents put their summary."""
+        step_result = step_result.strip()
+        if len(step_result) <= limit:
+            return step_result
+        return "..." + step_result[-limit:]
 
-    async def _mark_step_completed(self) -> None:
-        """Mark the current step as completed."""
-        if self.current_step_index is None:
+    async def _mark_step(
+        self, step_index: Optional[int], status: str, notes: Optional[str] = None
+    ) -> None:
+        """Set the status (and notes) of a plan step."""
+        if step_index is None:
             return
 
         try:
-            # Mark the step as completed
             await self.planning_tool.execute(
                 command="mark_step",
                 plan_id=self.active_plan_id,
-                step_index=self.current_step_index,
-                step_status="completed",
+                step_index=step_index,
+                step_status=status,
+                step_notes=notes,
             )
             logger.info(
-                f"Marked step {self.current_step_index} as completed in plan {self.active_plan_id}"
+                f"Marked step {step_index} as {status} in plan {self.active_plan_id}"
             )
         except Exception as e:
             logger.warning(f"Failed to update plan status: {e}")
@@ -277,11 +310,11 @@ class PlanningFlow(BaseFlow):
                 step_statuses = plan_data.get("step_statuses", [])
 
                 # Ensure the step_statuses list is long enough
-                while len(step_statuses) <= self.current_step_index:
+                while len(step_statuses) <= step_index:
                     step_statuses.append("not_started")
 
                 # Update the status
-                step_statuses[self.current_step_index] = "completed"
+                step_statuses[step_index] = status
                 plan_data["step_statuses"] = step_statuses
 
     async def _get_plan_text(self) -> str:
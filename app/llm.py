@@ -1,18 +1,28 @@
-from typing import Dict, List, Literal, Optional, Union
+import asyncio
+import json
+import time
+from contextlib import AsyncExitStack
+from typing import Any, AsyncIterator, Dict, List, Literal, Optional, Tuple, Union
 
 from openai import (
     APIError,
-    AsyncOpenAI,
     AuthenticationError,
     OpenAIError,
     RateLimitError,
 )
+from openai.types.chat import ChatCompletionMessage
 from tenacity import retry, stop_after_attempt, wait_random_exponential
 
 from app.config import LLMSettings
 from app.logger import logger  # Assuming a logger is set up in your app
-from app.schema import Message
+from app.schema import Function, Message, ToolCall, WireMessages
+from app.token_budget import ContextBudgeter, get_tokenizer
 from app.config import config
+from app.llm_cache import make_cache_key, response_cache
+from app.prompt_cache import mark_cache_breakpoints, stats_for
+from app.llm_router import Endpoint, LLMRouter, is_endpoint_failure
+from app.rate_limiter import wait_retry_after
+from app.telemetry import current_call, record_call, start_call, tracking
 
 
 class LLM:
@@ -47,17 +57,52 @@ class LLM:
             self.model = llm_config.model
             self.max_tokens = llm_config.max_tokens
             self.temperature = llm_config.temperature
+            self.router = LLMRouter.from_settings(config_name, llm_config)
+            self.prompt_cache = llm_config.prompt_cache
+            self.fast_config = llm_config.fast_config
+            self.budgeter = ContextBudgeter(
+                llm_config.max_input_tokens, get_tokenizer(self.model)
+            )
+            # Instances for other model names, see with_model()
+            self._base: Optional["LLM"] = None
+            self._variants: Dict[str, "LLM"] = {}
             
-            # 创建OpenAI客户端
+            # 创建OpenAI客户端（共享进程级连接池）；请求经由router在各端点间路由
             try:
-                print(f"[DEBUG] 创建OpenAI客户端 - 模型: {self.model}, API基础URL: {llm_config.base_url}")
-                self.client = AsyncOpenAI(
-                    api_key=llm_config.api_key, base_url=llm_config.base_url
-                )
+                print(f"[DEBUG] 创建OpenAI客户端 - 模型: {self.model}, API基础URL: {llm_config.base_url}, 备用端点: {len(llm_config.endpoints)}")
+                self.client = self.router.endpoints[0].client
             except Exception as e:
                 print(f"[ERROR] OpenAI客户端创建失败: {str(e)}")
                 raise
 
+    @property
+    def base(self) -> "LLM":
+        """The shared instance this one was derived from by `with_model`, else itself"""
+        return self._base or self
+
+    def with_model(self, model: Optional[str]) -> "LLM":
+        """An LLM for `model` on the same endpoints, limits and settings.
+
+        Instances are shared by every agent using a config, so a per-task
+        model choice must not be made by assigning `model`; this returns a
+        separate instance instead, one per model name, sharing the clients.
+        """
+        base = self.base
+        if not model or model == base.model:
+            return base
+        variant = base._variants.get(model)
+        if variant is None:
+            variant = object.__new__(LLM)
+            variant.__dict__.update(base.__dict__)
+            variant.model = model
+            variant.budgeter = ContextBudgeter(
+                base.budgeter.budget, get_tokenizer(model)
+            )
+            variant._base = base
+            variant._variants = {}
+            base._variants[model] = variant
+        return variant
+
     @staticmethod
     def format_messages(messages: List[Union[dict, Message]]) -> List[dict]:
         """
@@ -81,33 +126,112 @@ class LLM:
             ... ]
             >>> formatted = LLM.format_messages(msgs)
         """
+        if isinstance(messages, WireMessages):
+            # Kept by Memory.to_dict_list, which checks messages as they are added
+            return messages
+
         formatted_messages = []
 
         for message in messages:
-            if isinstance(message, dict):
+            if isinstance(message, Message):
+                # Message roles are validated on construction and the dict
+                # is cached on the message, so this is a lookup
+                message = message.to_dict()
+            elif isinstance(message, dict):
                 # If message is already a dict, ensure it has required fields
                 if "role" not in message:
                     raise ValueError("Message dict must contain 'role' field")
-                formatted_messages.append(message)
-            elif isinstance(message, Message):
-                # If message is a Message object, convert it to dict
-                formatted_messages.append(message.to_dict())
+                if message["role"] not in ["system", "user", "assistant", "tool"]:
+                    raise ValueError(f"Invalid role: {message['role']}")
             else:
                 raise TypeError(f"Unsupported message type: {type(message)}")
 
-        # Validate all messages have required fields
-        for msg in formatted_messages:
-            if msg["role"] not in ["system", "user", "assistant", "tool"]:
-                raise ValueError(f"Invalid role: {msg['role']}")
-            if "content" not in msg and "tool_calls" not in msg:
+            if "content" not in message and "tool_calls" not in message:
                 raise ValueError(
                     "Message must contain either 'content' or 'tool_calls'"
                 )
+            formatted_messages.append(message)
 
         return formatted_messages
 
+    def _estimate_tokens(
+        self, messages: List[dict], tools: Optional[List[dict]] = None
+    ) -> int:
+        """Roughly estimate prompt + completion tokens to reserve TPM budget.
+
+        Uses the ~4 characters per token rule of thumb; the reservation is
+        settled against the real usage once the response arrives.
+        """
+        chars = sum(len(str(msg.get("content") or "")) for msg in messages)
+        if tools:
+            chars += len(json.dumps(tools))
+        return chars // 4 + self.max_tokens
+
+    def _record_usage(self, usage) -> None:
+        """Track how much of the prompt the provider served from its prefix cache."""
+        if usage is None:
+            return
+        prompt_tokens, cached_tokens = stats_for(self.model).record(usage)
+        if cached_tokens:
+            logger.info(
+                f"Prompt cache: {cached_tokens}/{prompt_tokens} prompt tokens cached"
+            )
+
+    async def _create(self, estimated_tokens: int, **params) -> Any:
+        """Run a non-streaming completion on the best endpoint, with failover."""
+        call = current_call()
+
+        async def attempt(endpoint: Endpoint):
+            call.attempts += 1
+            queued = time.monotonic()
+            async with endpoint.rate_limiter.reserve(estimated_tokens) as slot:
+                call.queue_seconds += time.monotonic() - queued
+                response = await endpoint.client.chat.completions.create(
+                    model=endpoint.model or self.model, **params
+                )
+                slot.settle(response.usage.total_tokens if response.usage else None)
+            call.endpoint = endpoint.base_url
+            return response
+
+        response = await self.router.call(attempt)
+        self._record_usage(response.usage)
+        call.add_usage(response.usage)
+        return response
+
+    async def _open_stream(
+        self, estimated_tokens: int, **params
+    ) -> Tuple[Endpoint, AsyncExitStack, Any]:
+        """Open a streaming completion on the best endpoint, with failover.
+
+        The returned exit stack holds the endpoint's rate-limit slot; close it
+        once the stream has been consumed.
+        """
+        call = current_call()
+
+        async def attempt(endpoint: Endpoint):
+            call.attempts += 1
+            queued = time.monotonic()
+            stack = AsyncExitStack()
+            await stack.enter_async_context(
+                endpoint.rate_limiter.reserve(estimated_tokens)
+            )
+            call.queue_seconds += time.monotonic() - queued
+            try:
+                stream = await endpoint.client.chat.completions.create(
+                    model=endpoint.model or self.model, stream=True, **params
+                )
+            except BaseException:
+                await stack.aclose()
+                raise
+            return stack, stream
+
+        endpoint, (stack, stream) = await self.router.open_stream(attempt)
+        call.endpoint = endpoint.base_url
+        return endpoint, stack, stream
+
+    @record_call("ask")
     @retry(
-        wait=wait_random_exponential(min=1, max=60),
+        wait=wait_retry_after(wait_random_exponential(min=1, max=60)),
         stop=stop_after_attempt(6),
     )
     async def ask(
@@ -142,38 +266,77 @@ class LLM:
             else:
                 messages = self.format_messages(messages)
 
-            if not stream:
-                # Non-streaming request
-                response = await self.client.chat.completions.create(
+            temperature = temperature if temperature is not None else self.temperature
+            cache_key = None
+            if response_cache.accepts(temperature):
+                cache_key = make_cache_key(
+                    kind="ask",
                     model=self.model,
                     messages=messages,
                     max_tokens=self.max_tokens,
-                    temperature=temperature or self.temperature,
+                    temperature=temperature,
+                )
+                cached = await response_cache.get(cache_key)
+                if cached is not None:
+                    logger.debug(f"LLM cache hit for {self.model}")
+                    current_call().cache_hit = True
+                    if stream:
+                        print(cached)
+                    return cached
+
+            estimated_tokens = self._estimate_tokens(messages)
+            request_messages, _ = mark_cache_breakpoints(
+                messages, None, self.prompt_cache
+            )
+
+            if not stream:
+                # Non-streaming request
+                response = await self._create(
+                    estimated_tokens,
+                    messages=request_messages,
+                    max_tokens=self.max_tokens,
+                    temperature=temperature,
                     stream=False,
                 )
                 if not response.choices or not response.choices[0].message.content:
                     raise ValueError("Empty or invalid response from LLM")
-                return response.choices[0].message.content
+                content = response.choices[0].message.content
+                if cache_key:
+                    await response_cache.set(cache_key, content)
+                return content
 
-            # Streaming request
-            response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
+            # Streaming request; hold the concurrency slot until the stream ends
+            collected_messages = []
+            call = current_call()
+            endpoint, stack, response = await self._open_stream(
+                estimated_tokens,
+                messages=request_messages,
                 max_tokens=self.max_tokens,
-                temperature=temperature or self.temperature,
-                stream=True,
+                temperature=temperature,
             )
-
-            collected_messages = []
-            async for chunk in response:
-                chunk_message = chunk.choices[0].delta.content or ""
-                collected_messages.append(chunk_message)
-                print(chunk_message, end="", flush=True)
+            async with stack:
+                try:
+                    async for chunk in response:
+                        call.first_token()
+                        chunk_message = chunk.choices[0].delta.content or ""
+                        collected_messages.append(chunk_message)
+                        print(chunk_message, end="", flush=True)
+                except Exception as e:
+                    if is_endpoint_failure(e):
+                        endpoint.record_failure(e)
+                    raise
 
             print()  # Newline after streaming
             full_response = "".join(collected_messages).strip()
             if not full_response:
                 raise ValueError("Empty response from streaming LLM")
+            # Streams carry no usage unless the server volunteers it
+            call.estimate_usage(
+                estimated_tokens - self.max_tokens,
+                self.budgeter.tokenizer.count(full_response),
+            )
+            if cache_key:
+                await response_cache.set(cache_key, full_response)
             return full_response
 
         except ValueError as ve:
@@ -186,8 +349,9 @@ class LLM:
             logger.error(f"Unexpected error in ask: {e}")
             raise
 
+    @record_call("ask_tool")
     @retry(
-        wait=wait_random_exponential(min=1, max=60),
+        wait=wait_retry_after(wait_random_exponential(min=1, max=60)),
         stop=stop_after_attempt(6),
     )
     async def ask_tool(
@@ -238,13 +402,35 @@ class LLM:
                     if not isinstance(tool, dict) or "type" not in tool:
                         raise ValueError("Each tool must be a dict with 'type' field")
 
+            temperature = temperature if temperature is not None else self.temperature
+            cache_key = None
+            if response_cache.accepts(temperature):
+                cache_key = make_cache_key(
+                    kind="ask_tool",
+                    model=self.model,
+                    messages=messages,
+                    tools=tools,
+                    tool_choice=tool_choice,
+                    max_tokens=self.max_tokens,
+                    temperature=temperature,
+                    extra=kwargs,
+                )
+                cached = await response_cache.get(cache_key)
+                if cached is not None:
+                    logger.debug(f"LLM cache hit for {self.model} (tool call)")
+                    current_call().cache_hit = True
+                    return ChatCompletionMessage.model_validate(cached)
+
             # Set up the completion request
-            response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                temperature=temperature or self.temperature,
+            request_messages, request_tools = mark_cache_breakpoints(
+                messages, tools, self.prompt_cache
+            )
+            response = await self._create(
+                self._estimate_tokens(messages, tools),
+                messages=request_messages,
+                temperature=temperature,
                 max_tokens=self.max_tokens,
-                tools=tools,
+                tools=request_tools,
                 tool_choice=tool_choice,
                 timeout=timeout,
                 **kwargs,
@@ -255,7 +441,10 @@ class LLM:
                 print(response)
                 raise ValueError("Invalid or empty response from LLM")
 
-            return response.choices[0].message
+            message = response.choices[0].message
+            if cache_key:
+                await response_cache.set(cache_key, message.model_dump())
+            return message
 
         except ValueError as ve:
             logger.error(f"Validation error in ask_tool: {ve}")
@@ -264,10 +453,186 @@ class LLM:
             if isinstance(oe, AuthenticationError):
                 logger.error("Authentication failed. Check API key.")
             elif isinstance(oe, RateLimitError):
-                logger.error("Rate limit exceeded. Consider increasing retry attempts.")
+                logger.error(
+                    "Rate limit exceeded. Consider lowering rpm/tpm for this model."
+                )
             elif isinstance(oe, APIError):
                 logger.error(f"API error: {oe}")
             raise
         except Exception as e:
             logger.error(f"Unexpected error in ask_tool: {e}")
             raise
+
+    async def ask_tool_stream(
+        self,
+        messages: List[Union[dict, Message]],
+        system_msgs: Optional[List[Union[dict, Message]]] = None,
+        timeout: int = 60,
+        tools: Optional[List[dict]] = None,
+        tool_choice: Literal["none", "auto", "required"] = "auto",
+        temperature: Optional[float] = None,
+        **kwargs,
+    ) -> AsyncIterator[Union[str, ToolCall]]:
+        """
+        Streaming variant of `ask_tool`.
+
+        Yields content deltas as `str` while they arrive and each `ToolCall`
+        as soon as its arguments are complete, so callers can start running
+        the first tool while the model is still emitting the next one.
+
+        Unlike `ask_tool` this is not retried: once a tool call has been
+        yielded the caller may already have acted on it.
+
+        Raises:
+            ValueError: If tools, tool_choice, or messages are invalid
+            OpenAIError: If the API call fails
+        """
+        if tool_choice not in ["none", "auto", "required"]:
+            raise ValueError(f"Invalid tool_choice: {tool_choice}")
+
+        if system_msgs:
+            system_msgs = self.format_messages(system_msgs)
+            messages = system_msgs + self.format_messages(messages)
+        else:
+            messages = self.format_messages(messages)
+
+        if tools:
+            for tool in tools:
+                if not isinstance(tool, dict) or "type" not in tool:
+                    raise ValueError("Each tool must be a dict with 'type' field")
+
+        temperature = temperature if temperature is not None else self.temperature
+        record = start_call("ask_tool_stream", self.model)
+        cache_key = None
+        if response_cache.accepts(temperature):
+            cache_key = make_cache_key(
+                kind="ask_tool",
+                model=self.model,
+                messages=messages,
+                tools=tools,
+                tool_choice=tool_choice,
+                max_tokens=self.max_tokens,
+                temperature=temperature,
+                extra=kwargs,
+            )
+            cached = await response_cache.get(cache_key)
+            if cached is not None:
+                logger.debug(f"LLM cache hit for {self.model} (tool call)")
+                record.cache_hit = True
+                record.finish()
+                if cached.get("content"):
+                    yield cached["content"]
+                for call in cached.get("tool_calls") or []:
+                    yield ToolCall.model_validate(call)
+                return
+
+        content_parts: List[str] = []
+        pending: Dict[int, dict] = {}  # index -> partially received tool call
+        completed: List[ToolCall] = []
+        emitted = set()
+
+        def finish(index: int) -> ToolCall:
+            call = pending.pop(index)
+            emitted.add(index)
+            tool_call = ToolCall(
+                id=call["id"],
+                function=Function(name=call["name"], arguments=call["arguments"]),
+            )
+            completed.append(tool_call)
+            return tool_call
+
+        request_messages, request_tools = mark_cache_breakpoints(
+            messages, tools, self.prompt_cache
+        )
+        estimated_tokens = self._estimate_tokens(messages, tools)
+        endpoint = None
+        try:
+            # Only the request itself is tracked as the current call: across
+            # yields the context belongs to the consumer
+            with tracking(record):
+                endpoint, stack, response = await self._open_stream(
+                    estimated_tokens,
+                    messages=request_messages,
+                    temperature=temperature,
+                    max_tokens=self.max_tokens,
+                    tools=request_tools,
+                    tool_choice=tool_choice,
+                    timeout=timeout,
+                    **kwargs,
+                )
+            async with stack:
+                async for chunk in response:
+                    record.first_token()
+                    if chunk.usage:
+                        self._record_usage(chunk.usage)
+                        record.add_usage(chunk.usage)
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta
+
+                    if delta.content:
+                        content_parts.append(delta.content)
+                        yield delta.content
+
+                    for call_delta in delta.tool_calls or []:
+                        if call_delta.index in emitted:
+                            continue
+                        # A new index means every earlier call is fully streamed
+                        for index in [i for i in pending if i < call_delta.index]:
+                            yield finish(index)
+
+                        call = pending.setdefault(
+                            call_delta.index, {"id": "", "name": "", "arguments": ""}
+                        )
+                        if call_delta.id:
+                            call["id"] = call_delta.id
+                        if call_delta.function:
+                            call["name"] += call_delta.function.name or ""
+                            call["arguments"] += call_delta.function.arguments or ""
+
+                        # Hand the call out early once its arguments form valid JSON
+                        if call["name"] and call["arguments"].rstrip().endswith("}"):
+                            try:
+                                json.loads(call["arguments"])
+                            except json.JSONDecodeError:
+                                continue
+                            yield finish(call_delta.index)
+
+                for index in sorted(pending):
+                    yield finish(index)
+
+        except OpenAIError as oe:
+            if endpoint is not None and is_endpoint_failure(oe):
+                endpoint.record_failure(oe)
+            logger.error(f"OpenAI API error in ask_tool_stream: {oe}")
+            record.finish(oe)
+            raise
+        except (GeneratorExit, asyncio.CancelledError):
+            # The consumer stopped early; the call still cost what it cost
+            record.finish()
+            raise
+        except Exception as e:
+            record.finish(e)
+            raise
+
+        content = "".join(content_parts)
+        record.estimate_usage(
+            estimated_tokens - self.max_tokens,
+            self.budgeter.tokenizer.count(
+                content + "".join(call.function.arguments for call in completed)
+            ),
+        )
+        if not content and not completed:
+            error = ValueError("Empty response from streaming LLM")
+            record.finish(error)
+            raise error
+        record.finish()
+        if cache_key:
+            await response_cache.set(
+                cache_key,
+                {
+                    "role": "assistant",
+                    "content": content or None,
+                    "tool_calls": [call.model_dump() for call in completed] or None,
+                },
+            )
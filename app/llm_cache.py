@@ -0,0 +1,228 @@
+"""Content-addressed cache for LLM responses with memory and SQLite tiers."""
+
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Optional
+
+from app.config import PROJECT_ROOT, config
+from app.logger import logger
+
+
+def make_cache_key(**parts: Any) -> str:
+    """Hash the request parts into a stable key.
+
+    Keys are built from canonical JSON (sorted keys, no whitespace) so two
+    requests that differ only in dict ordering map to the same entry.
+    """
+    canonical = json.dumps(
+        parts, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class _DiskTier:
+    """SQLite-backed store with TTL and an LRU size cap."""
+
+    def __init__(self, path: Path, max_bytes: int):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                expires_at REAL,
+                last_access REAL NOT NULL
+            )"""
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_responses_access ON responses(last_access)"
+        )
+        self._conn.commit()
+        row = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+        self.total_bytes = row[0]
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, size, expires_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, size, expires_at = row
+            if expires_at is not None and expires_at < now:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                self.total_bytes -= size
+                return None
+            self._conn.execute(
+                "UPDATE responses SET last_access = ? WHERE key = ?", (now, key)
+            )
+            self._conn.commit()
+            return value
+
+    def set(self, key: str, value: str, expires_at: Optional[float]) -> None:
+        size = len(value.encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            old = self._conn.execute(
+                "SELECT size FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, expires_at, now),
+            )
+            self.total_bytes += size - (old[0] if old else 0)
+            if self.total_bytes > self.max_bytes:
+                self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float) -> None:
+        """Drop expired entries, then least recently used ones down to 90% of the cap."""
+        self._conn.execute(
+            "DELETE FROM responses WHERE expires_at IS NOT NULL AND expires_at < ?",
+            (now,),
+        )
+        target = int(self.max_bytes * 0.9)
+        total = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+        rows = self._conn.execute(
+            "SELECT key, size FROM responses ORDER BY last_access"
+        ).fetchall()
+        doomed = []
+        for key, size in rows:
+            if total <= target:
+                break
+            doomed.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", doomed)
+        self.evictions += len(doomed)
+        self.total_bytes = total
+
+
+class ResponseCache:
+    """Two-tier response cache: an in-memory LRU in front of an optional SQLite file.
+
+    Values must be JSON-serialisable. A hit in the disk tier is promoted to
+    the memory tier.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        deterministic_only: bool = True,
+        ttl: Optional[float] = None,
+        max_entries: int = 1024,
+        path: Optional[Path] = None,
+        max_disk_bytes: int = 256 * 1024 * 1024,
+    ):
+        self.enabled = enabled
+        self.deterministic_only = deterministic_only
+        self.ttl = ttl or None
+        self.max_entries = max_entries
+        self._memory: "OrderedDict[str, tuple[Optional[float], Any]]" = OrderedDict()
+        self._disk: Optional[_DiskTier] = None
+        if enabled and path is not None:
+            try:
+                self._disk = _DiskTier(path, max_disk_bytes)
+            except sqlite3.Error as e:
+                logger.warning(f"LLM cache disk tier unavailable ({path}): {e}")
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.writes = 0
+
+    @classmethod
+    def from_config(cls) -> "ResponseCache":
+        settings = config.llm_cache
+        path = None
+        if settings.path:
+            path = Path(settings.path)
+            if not path.is_absolute():
+                path = PROJECT_ROOT / path
+        return cls(
+            enabled=settings.enabled,
+            deterministic_only=settings.deterministic_only,
+            ttl=settings.ttl,
+            max_entries=settings.max_entries,
+            path=path,
+            max_disk_bytes=settings.max_disk_mb * 1024 * 1024,
+        )
+
+    def accepts(self, temperature: Optional[float]) -> bool:
+        """Whether a call sampled at `temperature` may be served from the cache."""
+        if not self.enabled:
+            return False
+        return not self.deterministic_only or not temperature
+
+    async def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        entry = self._memory.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at is None or expires_at >= now:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return value
+            del self._memory[key]
+
+        if self._disk is not None:
+            raw = await asyncio.to_thread(self._disk.get, key)
+            if raw is not None:
+                value = json.loads(raw)
+                self._remember(key, value, now + self.ttl if self.ttl else None)
+                self.disk_hits += 1
+                return value
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: Any) -> None:
+        expires_at = time.time() + self.ttl if self.ttl else None
+        self._remember(key, value, expires_at)
+        self.writes += 1
+        if self._disk is not None:
+            raw = json.dumps(value, ensure_ascii=False)
+            await asyncio.to_thread(self._disk.set, key, raw, expires_at)
+
+    def _remember(self, key: str, value: Any, expires_at: Optional[float]) -> None:
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        stats = {
+            "enabled": self.enabled,
+            "memory_entries": len(self._memory),
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "writes": self.writes,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups
+            if lookups
+            else 0.0,
+        }
+        if self._disk is not None:
+            stats["disk_bytes"] = self._disk.total_bytes
+            stats["disk_evictions"] = self._disk.evictions
+        return stats
+
+
+response_cache = ResponseCache.from_config()
@@ -0,0 +1,348 @@
+"""Latency-aware routing, failover and hedging across endpoints serving one model."""
+
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+
+from openai import (
+    APIConnectionError,
+    APIStatusError,
+    APITimeoutError,
+    RateLimitError,
+)
+
+from app.config import LLMSettings
+from app.logger import logger
+from app.rate_limiter import RateLimiter, retry_after_seconds
+from app.transport import get_openai_client
+
+
+T = TypeVar("T")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+def is_endpoint_failure(error: BaseException) -> bool:
+    """Whether `error` says something about the endpoint rather than the request.
+
+    Connection problems, timeouts, 429s and 5xx responses are worth retrying
+    elsewhere; 4xx errors such as a bad request would fail on any endpoint.
+    """
+    if isinstance(error, (APIConnectionError, APITimeoutError, RateLimitError)):
+        return True
+    if isinstance(error, APIStatusError):
+        return error.status_code >= 500
+    return False
+
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Endpoint:
+    """One OpenAI-compatible endpoint with rolling health statistics."""
+
+    def __init__(
+        self,
+        base_url: str,
+        api_key: str,
+        model: Optional[str],
+        settings: LLMSettings,
+        window: int = 100,
+    ):
+        self.base_url = base_url
+        self.model = model
+        self.client = get_openai_client(api_key=api_key, base_url=base_url)
+        self.rate_limiter = RateLimiter.for_model(
+            settings.model_copy(
+                update={"base_url": base_url, "model": model or settings.model}
+            )
+        )
+        self.failure_threshold = settings.failure_threshold
+        self.cooldown = settings.circuit_cooldown
+
+        self.latencies: deque = deque(maxlen=window)
+        self.outcomes: deque = deque(maxlen=window)  # True for success
+        self.in_flight = 0
+        self.consecutive_failures = 0
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.probing = False
+
+    def available(self, now: float) -> bool:
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN and now - self.opened_at >= self.cooldown:
+            self.state = HALF_OPEN
+            self.probing = False
+        # Half-open: let exactly one probe request through
+        return self.state == HALF_OPEN and not self.probing
+
+    @property
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return 1 - sum(self.outcomes) / len(self.outcomes)
+
+    def score(self) -> float:
+        """Lower is better: median latency inflated by errors and current load."""
+        p50 = _percentile(list(self.latencies), 0.5)
+        if p50 is None:
+            return 0.0  # Untried endpoints go first so they get measured
+        return p50 * (1 + 4 * self.error_rate) * (1 + 0.25 * self.in_flight)
+
+    def record_success(self, latency: Optional[float] = None) -> None:
+        if latency is not None:
+            self.latencies.append(latency)
+        self.outcomes.append(True)
+        self.consecutive_failures = 0
+        if self.state != CLOSED:
+            logger.info(f"LLM endpoint {self.base_url} recovered, closing circuit")
+        self.state = CLOSED
+        self.probing = False
+
+    def record_failure(self, error: BaseException) -> None:
+        self.outcomes.append(False)
+        self.consecutive_failures += 1
+        if isinstance(error, RateLimitError):
+            self.rate_limiter.pause(retry_after_seconds(error) or 1.0)
+        if self.state == HALF_OPEN or (
+            self.state == CLOSED and self.consecutive_failures >= self.failure_threshold
+        ):
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+            self.probing = False
+            logger.warning(
+                f"LLM endpoint {self.base_url} ejected for {self.cooldown:.0f}s "
+                f"after {self.consecutive_failures} consecutive failures: {error}"
+            )
+
+    @asynccontextmanager
+    async def track(self):
+        """Record the latency or failure of the call made inside the block."""
+        if self.state == HALF_OPEN:
+            self.probing = True
+        self.in_flight += 1
+        started = time.monotonic()
+        try:
+            yield self
+        except asyncio.CancelledError:
+            # A hedged call that lost the race was at least this slow; without
+            # recording it an endpoint that never answers would keep its
+            # untried rank and stay first forever.
+            self.latencies.append(time.monotonic() - started)
+            if self.state == HALF_OPEN:
+                self.probing = False
+            raise
+        except Exception as e:
+            if is_endpoint_failure(e):
+                self.record_failure(e)
+            elif self.state == HALF_OPEN:
+                self.probing = False
+            raise
+        else:
+            self.record_success(time.monotonic() - started)
+        finally:
+            self.in_flight -= 1
+
+    def stats(self) -> dict:
+        latencies = list(self.latencies)
+        return {
+            "base_url": self.base_url,
+            "model": self.model,
+            "state": self.state,
+            "in_flight": self.in_flight,
+            "p50": _percentile(latencies, 0.5),
+            "p95": _percentile(latencies, 0.95),
+            "error_rate": self.error_rate,
+            "consecutive_failures": self.consecutive_failures,
+        }
+
+
+class LLMRouter:
+    """Routes each call of one logical model to its healthiest endpoint.
+
+    Endpoints are ranked by rolling median latency, error rate and load.
+    A call that fails with an endpoint error fails over to the next endpoint
+    straight away; an endpoint with `failure_threshold` consecutive failures
+    is ejected for `circuit_cooldown` seconds and then re-admitted by a
+    single probe. With `hedge_delay` set, a non-streaming call that has not
+    answered after that many seconds is duplicated on the next endpoint and
+    whichever answers first wins.
+    """
+
+    _instances: Dict[str, "LLMRouter"] = {}
+
+    def __init__(
+        self, name: str, endpoints: List[Endpoint], hedge_delay: Optional[float] = None
+    ):
+        self.name = name
+        self.endpoints = endpoints
+        self.hedge_delay = hedge_delay
+        self.failovers = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    @classmethod
+    def from_settings(cls, name: str, settings: LLMSettings) -> "LLMRouter":
+        endpoints = [Endpoint(settings.base_url, settings.api_key, None, settings)] + [
+            Endpoint(
+                extra.base_url,
+                extra.api_key or settings.api_key,
+                extra.model,
+                settings,
+            )
+            for extra in settings.endpoints
+        ]
+        if len(endpoints) > 1:
+            # The router fails over itself; SDK retries would only delay that
+            for endpoint in endpoints:
+                endpoint.client = endpoint.client.with_options(max_retries=0)
+        router = cls(name, endpoints, hedge_delay=settings.hedge_delay)
+        cls._instances[name] = router
+        return router
+
+    def ranked(self, exclude: Tuple[Endpoint, ...] = ()) -> List[Endpoint]:
+        """Available endpoints, best first.
+
+        When every circuit is open the endpoint closest to re-admission is
+        returned, so callers always get something to try.
+        """
+        now = time.monotonic()
+        candidates = [e for e in self.endpoints if e not in exclude]
+        available = sorted(
+            (e for e in candidates if e.available(now)), key=lambda e: e.score()
+        )
+        if available or not candidates:
+            return available
+        return [min(candidates, key=lambda e: e.opened_at)]
+
+    async def call(
+        self, attempt: Callable[[Endpoint], Awaitable[T]], hedge: bool = True
+    ) -> T:
+        """Run `attempt(endpoint)` on the best endpoint with failover and hedging."""
+        tried: Tuple[Endpoint, ...] = ()
+        last_error: Optional[BaseException] = None
+        while True:
+            ranked = self.ranked(exclude=tried)
+            if not ranked:
+                raise last_error
+            primary = ranked[0]
+            tried += (primary,)
+            try:
+                if hedge and self.hedge_delay is not None and len(ranked) > 1:
+                    return await self._hedged(attempt, primary, ranked[1])
+                async with primary.track():
+                    return await attempt(primary)
+            except Exception as e:
+                if not is_endpoint_failure(e):
+                    raise
+                last_error = e
+                self.failovers += 1
+                logger.warning(
+                    f"LLM endpoint {primary.base_url} failed ({type(e).__name__}), "
+                    f"failing over"
+                )
+
+    async def _hedged(
+        self,
+        attempt: Callable[[Endpoint], Awaitable[T]],
+        primary: Endpoint,
+        backup: Endpoint,
+    ) -> T:
+        async def run(endpoint: Endpoint) -> T:
+            async with endpoint.track():
+                return await attempt(endpoint)
+
+        first = asyncio.create_task(run(primary))
+        done, _ = await asyncio.wait({first}, timeout=self.hedge_delay)
+        if done:
+            return first.result()
+
+        self.hedges += 1
+        logger.info(
+            f"LLM endpoint {primary.base_url} slower than {self.hedge_delay}s, "
+            f"hedging on {backup.base_url}"
+        )
+        second = asyncio.create_task(run(backup))
+        pending = {first, second}
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def open_stream(
+        self, attempt: Callable[[Endpoint], Awaitable[T]]
+    ) -> Tuple[Endpoint, T]:
+        """Open a streaming response with failover; latency is time to headers.
+
+        Returns the endpoint alongside the stream so the caller can report a
+        failure that happens while consuming it via `Endpoint.record_failure`.
+        """
+        endpoint_used: List[Endpoint] = []
+
+        async def opened(endpoint: Endpoint) -> T:
+            endpoint_used.append(endpoint)
+            return await attempt(endpoint)
+
+        # A half-read stream cannot be handed over, so streams are not hedged
+        stream = await self.call(opened, hedge=False)
+        return endpoint_used[-1], stream
+
+    async def health_check(self, timeout: float = 10.0) -> None:
+        """Probe ejected endpoints whose cooldown has passed with a models listing."""
+        now = time.monotonic()
+        for endpoint in self.endpoints:
+            if endpoint.state == CLOSED or not endpoint.available(now):
+                continue
+            endpoint.probing = True
+            try:
+                await asyncio.wait_for(endpoint.client.models.list(), timeout)
+            except Exception as e:
+                logger.debug(f"Health check failed for {endpoint.base_url}: {e}")
+                endpoint.record_failure(e)
+            else:
+                # Probe latency says nothing about completions, don't record it
+                endpoint.record_success()
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "hedge_delay": self.hedge_delay,
+            "failovers": self.failovers,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "endpoints": [endpoint.stats() for endpoint in self.endpoints],
+        }
+
+
+async def run_health_checks(interval: float = 15.0) -> None:
+    """Periodically probe ejected endpoints of every router; run as a background task."""
+    while True:
+        await asyncio.sleep(interval)
+        for router in list(LLMRouter._instances.values()):
+            await router.health_check()
+
+
+def router_stats() -> list:
+    """Return routing statistics for every router created in this process."""
+    return [router.stats() for router in LLMRouter._instances.values()]
@@ -0,0 +1,246 @@
+"""Cleaning of intercepted log lines and background detection of generated files."""
+
+import asyncio
+import os
+import queue
+import re
+import threading
+import time
+import weakref
+from collections import Counter, OrderedDict
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from app.logger import logger
+from app.task_context import TaskContext
+
+
+# The prefixes log lines may carry, stripped in this order in one anchored
+# match: "2024-01-01 12:34:56.789 | INFO | app.module: ", "INFO: " or
+# "INFO | ", another "INFO | ", then "| INFO | "
+_PREFIX = re.compile(
+    r"(?:\d{4}-\d{2}-\d{2}\s+\d{2}:\d{2}:\d{2}.\d+\s+\|\s+\w+\s+\|\s+[\w\.]+:\s*)?"
+    r"(?:(?:INFO|WARNING|ERROR)\s*[:|]\s*)?"
+    r"(?:(?:INFO|WARNING|ERROR)\s*\|\s*)?"
+    r"(?:\|\s*\w+\s*\|\s*)?"
+)
+
+_FILE_PATH = r"[\'\"]?([\w\-./\\]+\.\w+)[\'\"]?"
+# Phrases announcing a generated file, with the path captured
+_FILE_MENTION = re.compile(
+    r"(?:saved|created|generated|written)(?:\s*to)?\s*(?:file)?\s*[:]?\s*(?:as|to)?[:]?\s*"
+    + _FILE_PATH
+    + r"|file\s*(?:saved|created|generated)\s*[:]?\s*"
+    + _FILE_PATH
+    + r"|generated file\s*[:]?\s*"
+    + _FILE_PATH
+)
+# Every file mention contains one of these words; other lines skip the regex
+_FILE_WORDS = ("saved", "created", "generated", "written")
+
+
+def clean_log_line(message: str) -> str:
+    """Strip timestamp, level and module prefixes and trailing separators."""
+    return message[_PREFIX.match(message).end() :].rstrip("|").strip()
+
+
+def may_mention_file(line: str) -> bool:
+    return any(word in line for word in _FILE_WORDS)
+
+
+def find_file_mentions(line: str) -> Iterator[str]:
+    """Paths that `line` says were saved, created, generated or written."""
+    if not may_mention_file(line):
+        return
+    for match in _FILE_MENTION.finditer(line):
+        yield next(path for path in match.groups() if path)
+
+
+def _wake(waiter: asyncio.Future) -> None:
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class PathExistsCache:
+    """`os.path.exists` with the answers remembered.
+
+    Files that exist are assumed to keep existing; missing paths are checked
+    again after `negative_ttl` seconds, since logs can mention a file just
+    before it is written. At most `max_entries` paths are remembered.
+    """
+
+    def __init__(self, max_entries: int = 4096, negative_ttl: float = 2.0):
+        self.max_entries = max_entries
+        self.negative_ttl = negative_ttl
+        self._entries: "OrderedDict[str, Tuple[bool, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def exists(self, path: str) -> bool:
+        now = time.monotonic()
+        entry = self._entries.get(path)
+        if entry is not None and (entry[0] or now - entry[1] < self.negative_ttl):
+            self.hits += 1
+            self._entries.move_to_end(path)
+            return entry[0]
+        self.misses += 1
+        exists = os.path.exists(path)
+        self._entries[path] = (exists, now)
+        self._entries.move_to_end(path)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return exists
+
+
+class FileDetector:
+    """Finds generated files mentioned in task logs, off the logging path.
+
+    `submit` only checks a line for a few keywords and queues it; a
+    background thread takes queued lines in batches, matches the file
+    patterns and checks the paths exist, then hands the files found back to
+    the event loop running the line's task, where they are added to the
+    task context and announced with a file event. Results are never applied
+    on the detector thread: if that loop has closed they are dropped.
+    """
+
+    def __init__(self, batch_size: int = 256, linger: float = 0.05):
+        self.batch_size = batch_size
+        self.linger = linger
+        self.paths = PathExistsCache()
+        self._queue: "queue.Queue[Tuple[TaskContext, str]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        # Event loop of each context, for lines logged from other threads
+        self._loops = weakref.WeakKeyDictionary()
+        # Queued lines not yet applied, and flush() calls waiting, per context
+        self._pending: Dict[TaskContext, int] = {}
+        self._waiters: Dict[TaskContext, List[asyncio.Future]] = {}
+        # Guards the thread, loops, pending and waiters: lines are submitted
+        # from logging sinks on any thread
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.skipped = 0
+        self.detected = 0
+        self.dropped = 0
+        self.batches = 0
+
+    def submit(self, ctx: TaskContext, line: str) -> None:
+        """Queue `line`, logged in task context `ctx`, for file detection."""
+        if not may_mention_file(line):
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        with self._lock:
+            if loop is not None:
+                self._loops[ctx] = loop
+            elif ctx not in self._loops:
+                # Logged off the event loop; without a loop to hand the files
+                # back to, the line is not worth detecting
+                self.skipped += 1
+                return
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="log-file-detector", daemon=True
+                )
+                self._thread.start()
+            self._pending[ctx] = self._pending.get(ctx, 0) + 1
+            self.submitted += 1
+        self._queue.put((ctx, line))
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.linger
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            try:
+                found = self._detect(batch)
+            except Exception as e:
+                logger.warning(f"Detecting files in logs failed: {e}")
+                found = []
+            self.batches += 1
+            # Hand each loop the files found for its contexts, along with
+            # how many of their lines are done
+            with self._lock:
+                loops = {ctx: self._loops.get(ctx) for ctx, _ in batch}
+            by_loop: Dict[asyncio.AbstractEventLoop, Tuple[list, Counter]] = {}
+            for ctx, _ in batch:
+                by_loop.setdefault(loops[ctx], ([], Counter()))[1][ctx] += 1
+            for ctx, line, path in found:
+                by_loop[loops[ctx]][0].append((ctx, line, path))
+            for loop, (loop_found, done) in by_loop.items():
+                try:
+                    loop.call_soon_threadsafe(self._apply, loop_found, done)
+                except (AttributeError, RuntimeError):  # no loop, or closed
+                    self.dropped += len(loop_found)
+                    self._done(done)
+
+    def _detect(
+        self, batch: List[Tuple[TaskContext, str]]
+    ) -> List[Tuple[TaskContext, str, str]]:
+        found = []
+        for ctx, line in batch:
+            for path in find_file_mentions(line):
+                if path and self.paths.exists(path):
+                    found.append((ctx, line, path))
+                    break
+        return found
+
+    def _apply(self, found: List[Tuple[TaskContext, str, str]], done: Counter) -> None:
+        for ctx, line, path in found:
+            self.detected += 1
+            if ctx.add_file(path):
+                logger.info(f"识别到新生成的文件: {path}")
+            ctx.publish({"content": line, "file": path})
+        self._done(done)
+
+    def _done(self, done: Counter) -> None:
+        """Count `done` lines as processed, waking flush() calls with none left."""
+        waiters = []
+        with self._lock:
+            for ctx, count in done.items():
+                left = self._pending.get(ctx, 0) - count
+                if left > 0:
+                    self._pending[ctx] = left
+                else:
+                    self._pending.pop(ctx, None)
+                    waiters.extend(self._waiters.pop(ctx, ()))
+        for waiter in waiters:
+            try:
+                waiter.get_loop().call_soon_threadsafe(_wake, waiter)
+            except RuntimeError:  # the waiting loop is closed
+                pass
+
+    async def flush(self, ctx: TaskContext) -> None:
+        """Wait until the lines `ctx` queued are processed and their files added.
+
+        Only this context's lines are waited for, not other tasks' backlog.
+        """
+        with self._lock:
+            if not self._pending.get(ctx):
+                return
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.setdefault(ctx, []).append(waiter)
+        await waiter
+
+    def stats(self) -> dict:
+        return {
+            "submitted": self.submitted,
+            "skipped": self.skipped,
+            "pending": self._queue.qsize(),
+            "pending_tasks": len(self._pending),
+            "batches": self.batches,
+            "detected": self.detected,
+            "dropped": self.dropped,
+            "path_cache_hits": self.paths.hits,
+            "path_cache_misses": self.paths.misses,
+        }
+
+
+file_detector = FileDetector()
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 from datetime import datetime
 import uuid
 
@@ -37,6 +37,7 @@ class Task(BaseModel):
     updated_at: datetime = Field(default_factory=datetime.now)
     completed_at: Optional[datetime] = None
     files: List[TaskFile] = []
+    usage: Optional[Dict[str, Any]] = None
     
     class Config:
         orm_mode = True
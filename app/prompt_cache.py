@@ -0,0 +1,117 @@
+"""Provider prompt-prefix caching: cache breakpoints and cached-token metrics."""
+
+import threading
+from typing import Dict, List, Optional, Tuple
+
+
+EPHEMERAL = {"type": "ephemeral"}
+
+
+def mark_cache_breakpoints(
+    messages: List[dict], tools: Optional[List[dict]], mode: str
+) -> Tuple[List[dict], Optional[List[dict]]]:
+    """Annotate the stable parts of a request so the provider can cache them.
+
+    In "anthropic" mode `cache_control` breakpoints are placed on the last
+    tool definition, the last system message and the newest message, which
+    caches the tools, the system prompt and the conversation so far; each
+    step then only pays full price for what it appended. In "auto" mode the
+    request is left alone: OpenAI and prefix-caching local servers match
+    prefixes automatically as long as they stay byte-identical.
+
+    Marked entries are copies; the input dicts are never modified since
+    they are shared with the message serialisation cache.
+    """
+    if mode != "anthropic":
+        return messages, tools
+
+    if tools:
+        tools = tools[:-1] + [{**tools[-1], "cache_control": EPHEMERAL}]
+
+    messages = list(messages)
+    last_system = None
+    for i, message in enumerate(messages):
+        if message["role"] == "system":
+            last_system = i
+    for i in {last_system, len(messages) - 1}:
+        if i is not None and i >= 0:
+            messages[i] = _with_breakpoint(messages[i])
+    return messages, tools
+
+
+def _with_breakpoint(message: dict) -> dict:
+    content = message.get("content")
+    if isinstance(content, str) and content:
+        parts = [{"type": "text", "text": content, "cache_control": EPHEMERAL}]
+        return {**message, "content": parts}
+    if isinstance(content, list) and content:
+        parts = content[:-1] + [{**content[-1], "cache_control": EPHEMERAL}]
+        return {**message, "content": parts}
+    return message
+
+
+def cached_prompt_tokens(usage) -> Tuple[int, int]:
+    """Return (cache read, cache write) prompt tokens reported in `usage`.
+
+    Understands OpenAI's `prompt_tokens_details.cached_tokens` and the
+    Anthropic-style `cache_read_input_tokens` / `cache_creation_input_tokens`
+    that OpenAI-compatible gateways pass through.
+    """
+    details = getattr(usage, "prompt_tokens_details", None)
+    read = getattr(details, "cached_tokens", None) or 0
+    read = read or getattr(usage, "cache_read_input_tokens", None) or 0
+    written = getattr(usage, "cache_creation_input_tokens", None) or 0
+    return read, written
+
+
+class PromptCacheStats:
+    """Cached vs. uncached prompt tokens for one model."""
+
+    def __init__(self, model: str):
+        self.model = model
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.cache_write_tokens = 0
+        self._lock = threading.Lock()
+
+    def record(self, usage) -> Tuple[int, int]:
+        """Add one response's usage; returns (prompt tokens, cached tokens)."""
+        prompt = getattr(usage, "prompt_tokens", None) or 0
+        read, written = cached_prompt_tokens(usage)
+        with self._lock:
+            self.requests += 1
+            self.prompt_tokens += prompt
+            self.cached_tokens += read
+            self.cache_write_tokens += written
+        return prompt, read
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "model": self.model,
+                "requests": self.requests,
+                "prompt_tokens": self.prompt_tokens,
+                "cached_tokens": self.cached_tokens,
+                "uncached_tokens": self.prompt_tokens - self.cached_tokens,
+                "cache_write_tokens": self.cache_write_tokens,
+                "cached_ratio": self.cached_tokens / self.prompt_tokens
+                if self.prompt_tokens
+                else 0.0,
+            }
+
+
+_stats: Dict[str, PromptCacheStats] = {}
+_lock = threading.Lock()
+
+
+def stats_for(model: str) -> PromptCacheStats:
+    with _lock:
+        if model not in _stats:
+            _stats[model] = PromptCacheStats(model)
+        return _stats[model]
+
+
+def prompt_cache_stats() -> list:
+    """Return cached-token metrics for every model used in this process."""
+    return [stats.snapshot() for stats in list(_stats.values())]
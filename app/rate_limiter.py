@@ -0,0 +1,210 @@
+"""Per-model request/token budgets and concurrency governor for LLM calls."""
+
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional, Tuple
+
+from tenacity import RetryCallState
+from tenacity.wait import wait_base
+
+from app.logger import logger
+
+
+class _TokenBucket:
+    """A token bucket refilled continuously at `per_minute / 60` units per second."""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay_for(self, amount: float, now: float) -> float:
+        """Seconds until `amount` units are available (0 if available now)."""
+        self._refill(now)
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing / self.rate)
+
+    def consume(self, amount: float) -> None:
+        self.level -= min(amount, self.capacity)
+
+    def adjust(self, delta: float) -> None:
+        """Give back (positive) or charge (negative) units after the fact."""
+        self.level = min(self.capacity, self.level + delta)
+
+
+class Reservation:
+    """Budget held by one in-flight call; settle it with the real token usage."""
+
+    def __init__(self, limiter: "RateLimiter", estimated_tokens: int):
+        self._limiter = limiter
+        self.estimated_tokens = estimated_tokens
+        self.wait_time = 0.0
+
+    def settle(self, actual_tokens: Optional[int]) -> None:
+        if actual_tokens is None or self._limiter._tokens is None:
+            return
+        self._limiter._tokens.adjust(self.estimated_tokens - actual_tokens)
+
+
+class RateLimiter:
+    """Shared limiter for one (base_url, model) pair.
+
+    Calls queue in arrival order across all tasks, so a burst of agents is
+    turned into a steady stream that stays inside the configured RPM/TPM
+    budgets instead of bouncing off provider 429s.
+    """
+
+    _instances: Dict[Tuple[str, str], "RateLimiter"] = {}
+
+    def __init__(
+        self,
+        name: str,
+        rpm: Optional[int] = None,
+        tpm: Optional[int] = None,
+        max_concurrency: Optional[int] = None,
+    ):
+        self.name = name
+        self._requests = _TokenBucket(rpm) if rpm else None
+        self._tokens = _TokenBucket(tpm) if tpm else None
+        self._semaphore = (
+            asyncio.Semaphore(max_concurrency) if max_concurrency else None
+        )
+        self._lock = asyncio.Lock()
+        self._paused_until = 0.0
+
+        self.calls = 0
+        self.throttled_calls = 0
+        self.rate_limit_errors = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    @classmethod
+    def for_model(cls, llm_config) -> "RateLimiter":
+        """Return the limiter shared by every LLM bound to the same endpoint and model."""
+        key = (llm_config.base_url, llm_config.model)
+        if key not in cls._instances:
+            cls._instances[key] = cls(
+                name=llm_config.model,
+                rpm=llm_config.rpm,
+                tpm=llm_config.tpm,
+                max_concurrency=llm_config.max_concurrency,
+            )
+        return cls._instances[key]
+
+    @asynccontextmanager
+    async def reserve(self, estimated_tokens: int = 0):
+        """Wait for budget, then hold a concurrency slot for the duration of the call."""
+        started = time.monotonic()
+        if self._semaphore:
+            await self._semaphore.acquire()
+        try:
+            await self._acquire(estimated_tokens)
+            reservation = Reservation(self, estimated_tokens)
+            reservation.wait_time = time.monotonic() - started
+            self._record_wait(reservation.wait_time)
+            yield reservation
+        finally:
+            if self._semaphore:
+                self._semaphore.release()
+
+    async def _acquire(self, tokens: int) -> None:
+        # The lock is FIFO and held while sleeping, so the head of the queue
+        # is always served first and later callers cannot overtake it.
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                delay = self._paused_until - now
+                if delay <= 0:
+                    delay = max(
+                        self._requests.delay_for(1, now) if self._requests else 0.0,
+                        self._tokens.delay_for(tokens, now) if self._tokens else 0.0,
+                    )
+                if delay <= 0:
+                    if self._requests:
+                        self._requests.consume(1)
+                    if self._tokens:
+                        self._tokens.consume(tokens)
+                    return
+                await asyncio.sleep(delay)
+
+    def pause(self, seconds: float) -> None:
+        """Stop admitting calls for `seconds`, e.g. after a 429 with Retry-After."""
+        self.rate_limit_errors += 1
+        until = time.monotonic() + max(0.0, seconds)
+        if until > self._paused_until:
+            self._paused_until = until
+            logger.warning(
+                f"Rate limit hit for {self.name}, pausing new requests for {seconds:.1f}s"
+            )
+
+    def _record_wait(self, seconds: float) -> None:
+        self.calls += 1
+        if seconds > 0.01:
+            self.throttled_calls += 1
+        self.wait_total += seconds
+        self.wait_max = max(self.wait_max, seconds)
+
+    def stats(self) -> dict:
+        return {
+            "model": self.name,
+            "calls": self.calls,
+            "throttled_calls": self.throttled_calls,
+            "rate_limit_errors": self.rate_limit_errors,
+            "wait_avg": self.wait_total / self.calls if self.calls else 0.0,
+            "wait_max": self.wait_max,
+            "paused_for": max(0.0, self._paused_until - time.monotonic()),
+        }
+
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    """Extract the server-requested back-off from an API error's response headers."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return float(retry_after)
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class wait_retry_after(wait_base):
+    """Tenacity wait strategy that honours Retry-After and falls back otherwise."""
+
+    def __init__(self, fallback: wait_base, max_wait: float = 120.0):
+        self.fallback = fallback
+        self.max_wait = max_wait
+
+    def __call__(self, retry_state: RetryCallState) -> float:
+        error = retry_state.outcome.exception() if retry_state.outcome else None
+        delay = retry_after_seconds(error) if error else None
+        if delay is not None:
+            return min(delay, self.max_wait)
+        return self.fallback(retry_state)
+
+
+def rate_limiter_stats() -> list:
+    """Return stats for every limiter created in this process."""
+    return [limiter.stats() for limiter in RateLimiter._instances.values()]
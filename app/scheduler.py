@@ -0,0 +1,237 @@
+"""Admission control and bounded concurrency for agent tasks."""
+
+import asyncio
+import bisect
+import math
+import time
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from app.config import config
+from app.logger import logger
+
+
+class AdmissionRejected(Exception):
+    """Raised by `TaskScheduler.submit` when a task cannot be queued."""
+
+    def __init__(self, message: str, queue_length: int, retry_after: int):
+        super().__init__(message)
+        self.message = message
+        self.queue_length = queue_length
+        self.retry_after = retry_after
+
+
+class _Entry:
+    __slots__ = ("key", "user_id", "run", "priority", "seq", "submitted", "task")
+
+    def __init__(self, key, user_id, run, priority, seq):
+        self.key = key
+        self.user_id = user_id
+        self.run = run
+        self.priority = priority
+        self.seq = seq
+        self.submitted = time.monotonic()
+        self.task: Optional[asyncio.Task] = None
+
+    def __lt__(self, other: "_Entry") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class TaskScheduler:
+    """Runs at most `max_concurrency` tasks at once and queues the rest.
+
+    Queued tasks start in priority order (lower first, then in submission
+    order), skipping users already running `max_running_per_user` tasks.
+    `submit` rejects a task instead of queueing it once `max_pending` tasks
+    or `max_queued_per_user` of the user's tasks are waiting, so a burst
+    turns into quick 429 responses rather than an ever-growing backlog.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 4,
+        max_pending: int = 32,
+        max_running_per_user: int = 2,
+        max_queued_per_user: int = 8,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_pending = max_pending
+        self.max_running_per_user = max_running_per_user
+        self.max_queued_per_user = max_queued_per_user
+        self._pending: List[_Entry] = []  # sorted, next to start first
+        self._running: Dict[str, _Entry] = {}
+        self._running_by_user: Counter = Counter()
+        self._queued_by_user: Counter = Counter()
+        self._seq = 0
+        # Metrics
+        self.admitted = 0
+        self.started = 0
+        self.rejected = 0
+        self.cancelled = 0
+        self.finished = 0
+        self.max_queue_depth = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._run_total = 0.0
+
+    @classmethod
+    def from_config(cls) -> "TaskScheduler":
+        settings = config.scheduler
+        return cls(
+            max_concurrency=settings.max_concurrency,
+            max_pending=settings.max_pending,
+            max_running_per_user=settings.max_running_per_user,
+            max_queued_per_user=settings.max_queued_per_user,
+        )
+
+    def submit(
+        self,
+        task_id: Any,
+        user_id: str,
+        run: Callable[[], Awaitable[Any]],
+        priority: int = 0,
+    ) -> int:
+        """Queue `run()` as task `task_id`: its queue position, 0 if it started.
+
+        Raises AdmissionRejected when the queue or the user's quota is full.
+        """
+        key = str(task_id)
+        if self.is_active(key):
+            raise ValueError(f"Task {task_id} is already scheduled")
+        if self._queued_by_user[user_id] >= self.max_queued_per_user:
+            self._reject(f"用户排队中的任务已达上限 ({self.max_queued_per_user})")
+        entry = _Entry(key, user_id, run, priority, self._seq)
+        self._seq += 1
+        if self._can_start(entry):
+            self.admitted += 1
+            self._start(entry)
+            return 0
+        if len(self._pending) >= self.max_pending:
+            self._reject(f"任务队列已满 ({self.max_pending})")
+        self.admitted += 1
+        bisect.insort(self._pending, entry)
+        self._queued_by_user[user_id] += 1
+        self.max_queue_depth = max(self.max_queue_depth, len(self._pending))
+        return self._pending.index(entry) + 1
+
+    def _reject(self, message: str) -> None:
+        self.rejected += 1
+        raise AdmissionRejected(message, len(self._pending), self._retry_after())
+
+    def _retry_after(self) -> int:
+        """Rough seconds until a slot frees up, from the average run time."""
+        if not self.finished:
+            return 5
+        average = self._run_total / self.finished
+        return max(1, math.ceil(average / max(self.max_concurrency, 1)))
+
+    def _can_start(self, entry: _Entry) -> bool:
+        return (
+            len(self._running) < self.max_concurrency
+            and self._running_by_user[entry.user_id] < self.max_running_per_user
+        )
+
+    def _start(self, entry: _Entry) -> None:
+        wait = time.monotonic() - entry.submitted
+        self.started += 1
+        self._wait_total += wait
+        self._wait_max = max(self._wait_max, wait)
+        self._running[entry.key] = entry
+        self._running_by_user[entry.user_id] += 1
+        entry.task = asyncio.create_task(self._run(entry))
+
+    async def _run(self, entry: _Entry) -> None:
+        started = time.monotonic()
+        try:
+            await entry.run()
+        except asyncio.CancelledError:
+            logger.info(f"Task {entry.key} cancelled")
+        except Exception as e:
+            logger.warning(f"Task {entry.key} failed: {e}")
+        finally:
+            self._run_total += time.monotonic() - started
+            self.finished += 1
+            del self._running[entry.key]
+            self._running_by_user[entry.user_id] -= 1
+            if not self._running_by_user[entry.user_id]:
+                del self._running_by_user[entry.user_id]
+            self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Start queued tasks while slots are free."""
+        i = 0
+        while i < len(self._pending) and len(self._running) < self.max_concurrency:
+            entry = self._pending[i]
+            if self._can_start(entry):
+                self._dequeue(i)
+                self._start(entry)
+            else:
+                i += 1
+
+    def _dequeue(self, index: int) -> _Entry:
+        entry = self._pending.pop(index)
+        self._queued_by_user[entry.user_id] -= 1
+        if not self._queued_by_user[entry.user_id]:
+            del self._queued_by_user[entry.user_id]
+        return entry
+
+    async def cancel(self, task_id: Any) -> bool:
+        """Drop a queued task or cancel a running one; False if neither."""
+        key = str(task_id)
+        for i, entry in enumerate(self._pending):
+            if entry.key == key:
+                self._dequeue(i)
+                self.cancelled += 1
+                return True
+        entry = self._running.get(key)
+        if entry is None:
+            return False
+        self.cancelled += 1
+        entry.task.cancel()
+        # Let the task run its cleanup before the caller updates its status
+        await asyncio.wait([entry.task])
+        return True
+
+    def is_active(self, task_id: Any) -> bool:
+        """Whether the task is queued or running."""
+        return self.position(task_id) is not None
+
+    def position(self, task_id: Any) -> Optional[int]:
+        """Queue position of the task, 0 if running, None if neither."""
+        key = str(task_id)
+        if key in self._running:
+            return 0
+        for i, entry in enumerate(self._pending):
+            if entry.key == key:
+                return i + 1
+        return None
+
+    async def close(self) -> None:
+        self._pending.clear()
+        self._queued_by_user.clear()
+        tasks = [entry.task for entry in self._running.values()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "running": len(self._running),
+            "queue_depth": len(self._pending),
+            "max_queue_depth": self.max_queue_depth,
+            "admitted": self.admitted,
+            "started": self.started,
+            "rejected": self.rejected,
+            "cancelled": self.cancelled,
+            "finished": self.finished,
+            "wait_avg": self._wait_total / self.started if self.started else 0.0,
+            "wait_max": self._wait_max,
+            "oldest_wait": time.monotonic() - min(e.submitted for e in self._pending)
+            if self._pending
+            else 0.0,
+            "running_by_user": dict(self._running_by_user),
+        }
+
+
+task_scheduler = TaskScheduler.from_config()
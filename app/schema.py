@@ -1,7 +1,9 @@
+import json
+from collections import Counter
 from enum import Enum
-from typing import Any, List, Literal, Optional, Union
+from typing import Any, List, Literal, Optional, Tuple, Union
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, PrivateAttr
 
 
 class AgentState(str, Enum):
@@ -35,6 +37,18 @@ class Message(BaseModel):
     name: Optional[str] = Field(default=None)
     tool_call_id: Optional[str] = Field(default=None)
 
+    # Derived data cached until a field is reassigned. Hot paths read these
+    # through __pydantic_private__ directly, which is far cheaper than
+    # pydantic's private attribute lookup.
+    _wire: Optional[dict] = PrivateAttr(default=None)
+    # (tokenizer name, token count), see app.token_budget
+    _token_count: Optional[Tuple[str, int]] = PrivateAttr(default=None)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        super().__setattr__(name, value)
+        if name in type(self).model_fields:
+            self.__pydantic_private__.update(_wire=None, _token_count=None)
+
     def __add__(self, other) -> List["Message"]:
         """支持 Message + list 或 Message + Message 的操作"""
         if isinstance(other, list):
@@ -56,16 +70,26 @@ class Message(BaseModel):
             )
 
     def to_dict(self) -> dict:
-        """Convert message to dictionary format"""
+        """Convert message to dictionary format.
+
+        The dict is built once and cached until a field is reassigned, so
+        treat it as read-only.
+        """
+        cache = self.__pydantic_private__
+        if cache["_wire"] is not None:
+            return cache["_wire"]
         message = {"role": self.role}
         if self.content is not None:
             message["content"] = self.content
         if self.tool_calls is not None:
-            message["tool_calls"] = [tool_call.dict() for tool_call in self.tool_calls]
+            message["tool_calls"] = [
+                tool_call.model_dump() for tool_call in self.tool_calls
+            ]
         if self.name is not None:
             message["name"] = self.name
         if self.tool_call_id is not None:
             message["tool_call_id"] = self.tool_call_id
+        cache["_wire"] = message
         return message
 
     @classmethod
@@ -107,20 +131,73 @@ class Message(BaseModel):
         )
 
 
+def tool_call_signature(tool_calls: List[ToolCall]) -> Tuple[Tuple[str, str], ...]:
+    """Calls and their arguments, ignoring call ids and JSON formatting"""
+    signature = []
+    for call in tool_calls:
+        try:
+            arguments = json.dumps(json.loads(call.function.arguments), sort_keys=True)
+        except (TypeError, ValueError):
+            arguments = call.function.arguments
+        signature.append((call.function.name, arguments))
+    return tuple(signature)
+
+
+class WireMessages(list):
+    """Wire-format dicts kept by `Memory.to_dict_list`, already validated.
+
+    `LLM.format_messages` passes such a list through as is, so requests built
+    from memory only pay for the messages added since the previous one.
+    """
+
+
 class Memory(BaseModel):
     messages: List[Message] = Field(default_factory=list)
     max_messages: int = Field(default=100)
 
+    # Wire-format dicts of `messages`, synced lazily by to_dict_list();
+    # _wire_tail is the last message serialised
+    _wire: WireMessages = PrivateAttr(default_factory=WireMessages)
+    _wire_tail: Optional[Message] = PrivateAttr(default=None)
+    # Counts of assistant contents, and the latest run of assistant messages
+    # issuing identical tool calls, for duplicate detection; synced lazily by
+    # _sync_index(). _index_keys holds the content counted for each indexed
+    # message, aligned with `messages`.
+    _content_counts: Counter = PrivateAttr(default_factory=Counter)
+    _call_streak: Tuple[Optional[tuple], int] = PrivateAttr(default=(None, 0))
+    _index_keys: List[Optional[str]] = PrivateAttr(default_factory=list)
+    _indexed_tail: Optional[Message] = PrivateAttr(default=None)
+
     def add_message(self, message: Message) -> None:
         """Add a message to memory"""
         self.messages.append(message)
         # Optional: Implement message limit
         if len(self.messages) > self.max_messages:
-            self.messages = self.messages[-self.max_messages :]
+            self._trim()
+
+    def _trim(self) -> None:
+        start = self._trim_start()
+        self._sync_index()
+        for content in self._index_keys[:start]:
+            if content is not None:
+                self._content_counts[content] -= 1
+        del self._index_keys[:start]
+        del self._wire[:start]
+        self.messages = self.messages[start:]
+
+    def _trim_start(self) -> int:
+        """Index to trim from so at most max_messages remain without orphaning tool results"""
+        start = len(self.messages) - self.max_messages
+        # A tool result is only valid right after the assistant call that issued it
+        while start < len(self.messages) and self.messages[start].role == "tool":
+            start += 1
+        return start
 
     def add_messages(self, messages: List[Message]) -> None:
         """Add multiple messages to memory"""
         self.messages.extend(messages)
+        if len(self.messages) > self.max_messages:
+            self._trim()
 
     def clear(self) -> None:
         """Clear all messages"""
@@ -130,6 +207,76 @@ class Memory(BaseModel):
         """Get n most recent messages"""
         return self.messages[-n:]
 
-    def to_dict_list(self) -> List[dict]:
-        """Convert messages to list of dicts"""
-        return [msg.to_dict() for msg in self.messages]
+    def content_count(self, content: str) -> int:
+        """Number of assistant messages in memory with exactly this content"""
+        self._sync_index()
+        return self._content_counts[content]
+
+    def tool_call_streak(self) -> int:
+        """Number of assistant messages in a row, up to the latest, issuing identical calls.
+
+        Arguments are compared too. Only consecutive repeats count: the same command run again after other
+        work, like a test run after each edit, starts a new streak.
+        """
+        self._sync_index()
+        return self._call_streak[1]
+
+    def _sync_index(self) -> None:
+        """Index messages added since the last sync.
+
+        Appends are indexed incrementally; if the list was replaced or
+        edited some other way the index is rebuilt.
+        """
+        messages, keys = self.messages, self._index_keys
+        indexed = len(keys)
+        if indexed > len(messages) or (
+            indexed and messages[indexed - 1] is not self._indexed_tail
+        ):
+            self._content_counts.clear()
+            self._call_streak = (None, 0)
+            keys.clear()
+            indexed = 0
+        for message in messages[indexed:]:
+            content = None
+            if message.role == "assistant":
+                content = message.content or None
+                if content is not None:
+                    self._content_counts[content] += 1
+                calls = (
+                    tool_call_signature(message.tool_calls)
+                    if message.tool_calls
+                    else None
+                )
+                if calls is not None and calls == self._call_streak[0]:
+                    self._call_streak = (calls, self._call_streak[1] + 1)
+                else:
+                    self._call_streak = (calls, 1 if calls is not None else 0)
+            keys.append(content)
+        self._indexed_tail = messages[-1] if messages else None
+
+    def to_dict_list(self) -> WireMessages:
+        """Convert messages to list of dicts.
+
+        The list is kept between calls: messages appended since the last call
+        are serialised and checked, earlier ones are not looked at again, and
+        the list is rebuilt if `messages` was replaced. Callers get a shallow
+        copy, so changing the returned list does not affect the cached one.
+
+        Raises:
+            ValueError: If a message has neither content nor tool calls
+        """
+        messages, wire = self.messages, self._wire
+        synced = len(wire)
+        if synced > len(messages) or (
+            synced and messages[synced - 1] is not self._wire_tail
+        ):
+            wire.clear()
+            synced = 0
+        for message in messages[synced:]:
+            if message.content is None and message.tool_calls is None:
+                raise ValueError(
+                    "Message must contain either 'content' or 'tool_calls'"
+                )
+            wire.append(message.to_dict())
+            self._wire_tail = message
+        return WireMessages(wire)
@@ -174,6 +174,7 @@ class DBService:
                 prompt VARCHAR(2000) NOT NULL COMMENT '提示词内容',
                 status VARCHAR(20) NOT NULL COMMENT '任务状态: pending, running, completed, failed',
                 log_url VARCHAR(512) COMMENT '日志文件COS存储URL',
+                llm_usage TEXT COMMENT '任务结束时的LLM用量汇总(JSON)',
                 created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
                 updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间',
                 completed_at TIMESTAMP NULL COMMENT '完成时间'
@@ -193,6 +194,15 @@ class DBService:
             ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='任务生成文件表'
             ''')
             
+            # 为已有的任务表补充LLM用量汇总字段
+            try:
+                cursor.execute('ALTER TABLE tasks ADD COLUMN llm_usage TEXT COMMENT \'任务结束时的LLM用量汇总(JSON)\' AFTER log_url')
+            except Exception as e:
+                # 忽略字段已存在错误
+                if 'Duplicate' not in str(e):
+                    logger.error(f"添加任务表用量字段失败: {str(e)}")
+                    raise
+            
             # 创建索引
             try:
                 cursor.execute('CREATE INDEX idx_tasks_user_id ON tasks(user_id) COMMENT \'用户ID索引，加速按用户查询任务\'')
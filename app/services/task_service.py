@@ -6,15 +6,50 @@ from datetime import datetime
 import asyncio
 import tempfile
 import io
+import json
 import uuid
 
 from app.services.db_service import db_service
 from app.services.cos_service import cos_service
+from app.telemetry import LLMCallRecord, UsageSummary
 
 # 设置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# 任务结束时的状态：此时将LLM用量汇总写入任务记录，并从内存中移除
+FINISHED_STATUSES = ("completed", "failed", "cancelled", "interrupted")
+
+
+def _stored_usage(task: Optional[Dict]) -> Optional[Dict[str, Any]]:
+    """任务记录中保存的LLM用量汇总（数据库中为JSON文本）"""
+    usage = task.get("llm_usage") if task else None
+    if isinstance(usage, str):
+        try:
+            usage = json.loads(usage)
+        except ValueError:
+            logger.warning(f"任务用量汇总格式错误: ID={task.get('id')}")
+            return None
+    return usage or None
+
+
+def _merge_usage(stored: Dict[str, Any], current: Dict[str, Any]) -> Dict[str, Any]:
+    """合并同一任务多次执行（中断后恢复）的用量汇总：数值累加，平均首token耗时取最近一次"""
+    merged = dict(stored)
+    for key, value in current.items():
+        old = merged.get(key)
+        if isinstance(value, dict) and isinstance(old, dict):
+            merged[key] = _merge_usage(old, value)
+        elif (
+            isinstance(value, (int, float)) and isinstance(old, (int, float))
+            and key != "avg_ttft_seconds"
+        ):
+            merged[key] = round(old + value, 3) if isinstance(value, float) else old + value
+        elif value is not None:
+            merged[key] = value
+    return merged
+
+
 class TaskService:
     """任务管理服务，整合数据库操作和文件处理"""
     
@@ -23,6 +58,9 @@ class TaskService:
         self.in_memory_tasks = {}
         self.in_memory_files = {}
         self.in_memory_logs = {}
+        # 执行中任务的LLM调用用量汇总（token、耗时、重试、缓存命中），
+        # 任务结束时写入任务记录并移除
+        self.task_usage: Dict[str, UsageSummary] = {}
     
     async def create_task(self, user_id: str, prompt: str) -> int:
         """创建新任务"""
@@ -60,6 +98,45 @@ class TaskService:
             logger.info(f"内存模式(备选): 创建任务成功: ID={task_id}, 用户={user_id}")
             return task_id
     
+    async def ensure_task(self, task_id, user_id: str, prompt: str, status: str = "interrupted") -> None:
+        """确保任务记录存在：内存模式下重启会丢失任务，按检查点中的信息重建"""
+        if db_service.db_available or str(task_id) in self.in_memory_tasks:
+            return
+        self.in_memory_tasks[str(task_id)] = {
+            "id": task_id,
+            "user_id": user_id,
+            "prompt": prompt,
+            "status": status,
+            "created_at": datetime.now().isoformat(),
+            "updated_at": datetime.now().isoformat()
+        }
+        logger.info(f"内存模式: 按检查点重建任务记录: ID={task_id}")
+    
+    def take_task_records(self, task_id) -> Dict[str, Any]:
+        """取出并移除内存中记录的任务日志URL与文件，工作进程据此将结果交回主进程"""
+        task = self.in_memory_tasks.pop(str(task_id), None) or {}
+        self.in_memory_logs.pop(str(task_id), None)
+        files = [
+            self.in_memory_files.pop(file_id)
+            for file_id, file in list(self.in_memory_files.items())
+            if str(file.get("task_id")) == str(task_id)
+        ]
+        return {"log_url": task.get("log_url"), "files": files}
+    
+    async def add_task_records(self, task_id, records: Optional[Dict[str, Any]]) -> None:
+        """记录工作进程交回的任务日志URL与文件（工作进程的内存存储不与主进程共享）"""
+        if not records:
+            return
+        if records.get("log_url"):
+            await self.update_task_log_url(task_id, records["log_url"])
+        task = self.in_memory_tasks.get(str(task_id))
+        for file_record in records.get("files", []):
+            self.in_memory_files[file_record["id"]] = file_record
+            if task is not None:
+                task.setdefault("files", []).append(file_record)
+        if records.get("files"):
+            logger.info(f"记录工作进程交回的任务文件: ID={task_id}, 文件数={len(records['files'])}")
+    
     async def get_task(self, task_id: int) -> Dict:
         """获取任务信息"""
         try:
@@ -77,6 +154,7 @@ class TaskService:
                         task["files"] = self.in_memory_files[str(task_id)]
                     else:
                         task["files"] = []
+                    task["usage"] = self.get_task_usage(task_id, task)
                     logger.debug(f"内存模式: 获取任务: ID={task_id}")
                     return task
                 else:
@@ -103,6 +181,9 @@ class TaskService:
             # 获取任务文件
             task['files'] = db_service.get_task_files(task_id)
             
+            # 获取LLM用量汇总
+            task['usage'] = self.get_task_usage(task_id, task)
+            
             return task
         except Exception as e:
             logger.error(f"获取任务信息失败: {str(e)}")
@@ -117,6 +198,7 @@ class TaskService:
                     task["files"] = self.in_memory_files[str(task_id)]
                 else:
                     task["files"] = []
+                task["usage"] = self.get_task_usage(task_id, task)
                 logger.debug(f"内存模式(备选): 获取任务: ID={task_id}")
                 return task
             return {}
@@ -179,7 +261,9 @@ class TaskService:
             return page_tasks
     
     async def update_task_status(self, task_id: int, status: str, logs: Optional[str] = None) -> bool:
-        """更新任务状态"""
+        """更新任务状态；任务结束时同时保存其LLM用量汇总"""
+        if status in FINISHED_STATUSES:
+            self.save_task_usage(task_id)
         try:
             if not db_service.db_available:
                 # 如果数据库不可用，使用内存存储
@@ -647,6 +731,66 @@ class TaskService:
             logger.error(f"下载任务文件失败: {str(e)}")
             raise
     
+    async def get_task_status(self, task_id) -> Dict:
+        """获取任务状态（不下载日志、不查询文件），用于频繁轮询"""
+        task = self.in_memory_tasks.get(str(task_id))
+        if task is None and db_service.db_available:
+            try:
+                task = db_service.get_task(task_id)
+            except Exception as e:
+                logger.error(f"获取任务状态失败: {str(e)}")
+        if not task:
+            return {}
+        status = {
+            key: task.get(key)
+            for key in ["id", "user_id", "status", "created_at", "updated_at", "completed_at"]
+        }
+        status["usage"] = self.get_task_usage(task_id, task)
+        return status
+    
+    def record_llm_call(self, record: LLMCallRecord) -> None:
+        """遥测sink：将一次LLM调用计入所属任务的用量汇总"""
+        if record.task_id is None:
+            return
+        summary = self.task_usage.get(str(record.task_id))
+        if summary is None:
+            summary = self.task_usage[str(record.task_id)] = UsageSummary()
+        summary.add(record)
+    
+    def get_task_usage(self, task_id: int, task: Optional[Dict] = None) -> Optional[Dict[str, Any]]:
+        """获取任务的LLM用量汇总：执行中的取内存汇总，已结束的取任务记录task中保存的；
+        没有调用记录时返回None"""
+        if task is None:
+            task = self.in_memory_tasks.get(str(task_id))
+        stored = _stored_usage(task)
+        summary = self.task_usage.get(str(task_id))
+        if summary is None:
+            return stored
+        return _merge_usage(stored, summary.to_dict()) if stored else summary.to_dict()
+    
+    def save_task_usage(self, task_id: int) -> None:
+        """将任务的LLM用量汇总写入任务记录（与之前执行的用量累加），并从内存中移除"""
+        summary = self.task_usage.pop(str(task_id), None)
+        if summary is None:
+            return
+        try:
+            if not db_service.db_available or str(task_id) in self.in_memory_tasks:
+                task = self.in_memory_tasks.get(str(task_id))
+                if task is None:
+                    logger.warning(f"内存模式: 保存任务用量失败: 找不到任务 ID={task_id}")
+                    return
+                stored = _stored_usage(task)
+                usage = summary.to_dict()
+                task["llm_usage"] = _merge_usage(stored, usage) if stored else usage
+                return
+            stored = _stored_usage(db_service.get_task(task_id))
+            usage = summary.to_dict()
+            if stored:
+                usage = _merge_usage(stored, usage)
+            db_service.update_task(task_id, {"llm_usage": json.dumps(usage, ensure_ascii=False)})
+        except Exception as e:
+            logger.error(f"保存任务用量汇总失败: ID={task_id}, 错误: {str(e)}")
+    
     async def delete_task(self, task_id: int) -> bool:
         """删除任务及其关联文件"""
         try:
@@ -674,6 +818,7 @@ class TaskService:
             
             # 删除任务记录（数据库文件记录会通过外键级联删除）
             success = db_service.delete_task(task_id)
+            self.task_usage.pop(str(task_id), None)
             
             if success:
                 logger.info(f"删除任务成功: ID={task_id}")
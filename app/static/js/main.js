@@ -24,10 +24,15 @@ document.addEventListener('DOMContentLoaded', function() {
     
     // 初始化已发送消息ID集合
     const sentMessageIds = new Set();
+    // 最后收到的事件序号，重连时用于补发断线期间错过的事件
+    let lastEventId = null;
     
     // 生成的文件列表
     let generatedFiles = [];
     
+    // 当前正在接收流式token的日志条目
+    let streamingEntry = null;
+    
     // 自动滚动日志到底部
     function scrollLogsToBottom() {
         elements.logs.scrollTop = elements.logs.scrollHeight;
@@ -502,8 +507,9 @@ document.addEventListener('DOMContentLoaded', function() {
 
     // 创建EventSource，用于接收实时日志更新
     function connectEventSource() {
-        // 创建EventSource实例
-        eventSource = new EventSource('/api/events');
+        // 创建EventSource实例，重连时带上最后收到的事件序号
+        const url = lastEventId ? `/api/events?last_event_id=${encodeURIComponent(lastEventId)}` : '/api/events';
+        eventSource = new EventSource(url);
         
         // 连接打开时
         eventSource.onopen = function() {
@@ -512,6 +518,9 @@ document.addEventListener('DOMContentLoaded', function() {
         
         // 收到消息时
         eventSource.onmessage = function(event) {
+            if (event.lastEventId) {
+                lastEventId = event.lastEventId;
+            }
             try {
                 const data = JSON.parse(event.data);
                 
@@ -543,8 +552,17 @@ document.addEventListener('DOMContentLoaded', function() {
         const content = data.message || data.content;
         const files = data.files;
         
+        // 非token事件结束当前的流式输出条目
+        if (eventType !== 'token') {
+            streamingEntry = null;
+        }
+        
         // 处理不同类型的事件
         switch (eventType) {
+            case 'token':
+                appendToken(content);
+                break;
+                
             case 'log':
                 appendLog(content, data.level || 'log');
                 scrollLogsToBottom();
@@ -620,6 +638,17 @@ document.addEventListener('DOMContentLoaded', function() {
     }
     
     // 添加日志
+    // 将模型流式输出的token追加到同一个日志条目中
+    function appendToken(token) {
+        if (!streamingEntry) {
+            streamingEntry = document.createElement('div');
+            streamingEntry.className = 'log-entry log-token';
+            elements.logs.appendChild(streamingEntry);
+        }
+        streamingEntry.textContent += token;
+        scrollLogsToBottom();
+    }
+    
     function appendLog(message, type = 'log') {
         // 创建日志条目元素
         const logEntry = document.createElement('div');
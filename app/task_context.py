@@ -0,0 +1,150 @@
+"""Per-task execution context: each task run's logs, files and event channel."""
+
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional
+
+from app.event_bus import Subscription, event_broker
+
+
+# Conversation history entries kept per context
+MAX_HISTORY: int = 100
+# Finished task contexts kept for lookups by task id, oldest dropped first
+MAX_FINISHED: int = 32
+
+
+class TaskContext:
+    """State of one task run, kept apart from the runs sharing the event loop.
+
+    Owns the task's log buffers, generated files, conversation history,
+    summary and log callback, plus an event topic on the event broker that
+    fans each event out to the streams subscribed to it. History also goes
+    to the parent context, normally the process-wide root context, and the
+    root context's subscribers see every task's events.
+    """
+
+    def __init__(
+        self,
+        task_id: Any = None,
+        prompt: str = "",
+        parent: Optional["TaskContext"] = None,
+    ):
+        self.task_id = task_id
+        self.prompt = prompt
+        self.parent = parent
+        self.logs: List[str] = []  # every log line, uploaded when the task ends
+        self.pure_logs: List[str] = []  # lines not yet scanned for files
+        self.files: List[str] = []
+        self.history: List[Dict[str, str]] = []
+        self.summary = ""
+        self.summary_status: Dict[str, Any] = {"in_progress": False}
+        self.log_callback: Optional[Callable[[str], None]] = None
+
+    @property
+    def is_root(self) -> bool:
+        return self.parent is None
+
+    @property
+    def topic(self) -> Optional[str]:
+        """The event broker topic; the root context's covers all tasks."""
+        return None if self.is_root else str(self.task_id)
+
+    def publish(self, event: Any) -> None:
+        """Send `event` to this context's subscribers and the root context's."""
+        event_broker.publish(self.topic, event)
+
+    def subscribe(self, **options) -> Subscription:
+        """Subscribe to this context's events; see `EventBroker.subscribe`.
+
+        Events arrive as (sequence number, event) pairs; passing the last
+        number seen as `after` replays the events missed since.
+        """
+        return event_broker.subscribe(self.topic, **options)
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        event_broker.unsubscribe(subscription)
+
+    def add_log(self, line: str) -> None:
+        # The root context has no task to upload its logs with
+        if not self.is_root:
+            self.logs.append(line)
+
+    def add_file(self, path: str) -> bool:
+        """Record a generated file; False if it was already known."""
+        if path in self.files:
+            return False
+        self.files.append(path)
+        return True
+
+    def add_history(self, role: str, content: str) -> None:
+        self.history.append({"role": role, "content": content})
+        del self.history[:-MAX_HISTORY]
+        if self.parent is not None:
+            self.parent.add_history(role, content)
+
+
+# Context of the events and logs produced outside any task
+root_context = TaskContext()
+
+_current: ContextVar[Optional[TaskContext]] = ContextVar("task_context", default=None)
+_running: Dict[str, TaskContext] = {}
+_finished: "OrderedDict[str, TaskContext]" = OrderedDict()
+_latest: Optional[TaskContext] = None
+
+
+def current_task_context() -> TaskContext:
+    """The context of the task running in this asyncio task, else the root one."""
+    return _current.get() or root_context
+
+
+def open_task_context(task_id: Any, prompt: str = "") -> TaskContext:
+    """Task `task_id`'s context, created if the task has none yet.
+
+    Opening it when the task is queued lets clients subscribe to its events
+    before it starts.
+    """
+    key = str(task_id)
+    ctx = _running.get(key)
+    if ctx is None:
+        ctx = _running[key] = TaskContext(task_id, prompt, parent=root_context)
+    return ctx
+
+
+def start_task_context(task_id: Any, prompt: str = "") -> TaskContext:
+    """Make task `task_id`'s context current, opening it if needed.
+
+    Like `app.telemetry.set_context`, this applies to the current asyncio
+    task and the tasks it creates afterwards, so it is meant to be called at
+    the start of the asyncio task running the agent.
+    """
+    global _latest
+    ctx = open_task_context(task_id, prompt)
+    _current.set(ctx)
+    _latest = ctx
+    return ctx
+
+
+def finish_task_context(ctx: TaskContext) -> None:
+    """Mark `ctx`'s task as over; its files and summary stay available."""
+    key = str(ctx.task_id)
+    if _running.get(key) is ctx:
+        del _running[key]
+    ctx.log_callback = None
+    ctx.logs = []
+    ctx.pure_logs = []
+    _finished[key] = ctx
+    _finished.move_to_end(key)
+    while len(_finished) > MAX_FINISHED:
+        forgotten, _ = _finished.popitem(last=False)
+        event_broker.drop_topic(forgotten)
+
+
+def get_task_context(task_id: Any) -> Optional[TaskContext]:
+    """The context of a running or recently finished task."""
+    key = str(task_id)
+    return _running.get(key) or _finished.get(key)
+
+
+def latest_task_context() -> Optional[TaskContext]:
+    """The context of the most recently started task."""
+    return _latest
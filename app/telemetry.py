@@ -0,0 +1,311 @@
+"""Per-call LLM telemetry: call records, context propagation and pluggable sinks."""
+
+import functools
+import json
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from app.config import PROJECT_ROOT, config
+from app.logger import logger
+from app.prompt_cache import cached_prompt_tokens
+
+
+# Who is calling: task_id, agent and step, set by the task runner and the agent loop
+_context: ContextVar[Dict[str, Any]] = ContextVar("llm_telemetry_context", default={})
+# The LLM call in progress in this asyncio task
+_current: ContextVar[Optional["LLMCallRecord"]] = ContextVar(
+    "llm_telemetry_call", default=None
+)
+
+
+def set_context(**fields: Any) -> Token:
+    """Attach `fields` to every LLM call made from the current asyncio task.
+
+    Tasks inherit a copy of the context when they are created, so calls made
+    by tasks spawned afterwards carry the fields too.
+    """
+    return _context.set({**_context.get(), **fields})
+
+
+@contextmanager
+def bind(**fields: Any):
+    """Attach `fields` to the LLM calls made inside the block."""
+    token = set_context(**fields)
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+@dataclass
+class LLMCallRecord:
+    """One logical LLM call, including its retries, failovers and hedges."""
+
+    kind: str
+    model: str
+    task_id: Optional[str] = None
+    agent: Optional[str] = None
+    step: Optional[int] = None
+    tier: Optional[str] = None  # model cascade tier serving the step
+    endpoint: Optional[str] = None
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0
+    usage_estimated: bool = False
+    # Latency breakdown in seconds
+    queue_seconds: float = 0.0  # waiting for a rate-limit slot
+    ttft_seconds: Optional[float] = None  # time to first streamed token
+    latency_seconds: float = 0.0
+    attempts: int = 0  # requests sent to an endpoint
+    cache_hit: bool = False
+    error: Optional[str] = None
+    started_at: float = field(default_factory=time.time)
+    _started: float = field(default_factory=time.monotonic, repr=False)
+
+    @property
+    def retries(self) -> int:
+        return max(self.attempts - 1, 0)
+
+    def first_token(self) -> None:
+        if self.ttft_seconds is None:
+            self.ttft_seconds = time.monotonic() - self._started
+
+    def add_usage(self, usage) -> None:
+        if usage is None:
+            return
+        self.prompt_tokens = getattr(usage, "prompt_tokens", None) or 0
+        self.completion_tokens = getattr(usage, "completion_tokens", None) or 0
+        self.cached_tokens = cached_prompt_tokens(usage)[0]
+        self.usage_estimated = False
+
+    def estimate_usage(self, prompt_tokens: int, completion_tokens: int) -> None:
+        """Fill in token counts for responses that did not report usage."""
+        if self.prompt_tokens or self.completion_tokens:
+            return
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.usage_estimated = True
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        self.latency_seconds = time.monotonic() - self._started
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+        emit(self)
+
+    def to_dict(self) -> dict:
+        record = asdict(self)
+        del record["_started"]
+        record["retries"] = self.retries
+        return record
+
+
+def start_call(kind: str, model: str) -> LLMCallRecord:
+    """Create a record for a new call, tagged with the current context."""
+    context = _context.get()
+    return LLMCallRecord(
+        kind=kind,
+        model=model,
+        task_id=context.get("task_id"),
+        agent=context.get("agent"),
+        step=context.get("step"),
+        tier=context.get("tier"),
+    )
+
+
+def current_call() -> LLMCallRecord:
+    """The record of the call in progress; a detached one when nothing is tracked."""
+    return _current.get() or LLMCallRecord(kind="untracked", model="")
+
+
+@contextmanager
+def tracking(record: LLMCallRecord):
+    """Make `record` the current call inside the block."""
+    token = _current.set(record)
+    try:
+        yield record
+    finally:
+        _current.reset(token)
+
+
+def record_call(kind: str):
+    """Decorator for `LLM` methods: emit one record per call, across retries.
+
+    Apply it outside the retry decorator so every attempt lands in the same
+    record.
+    """
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(llm, *args, **kwargs):
+            record = start_call(kind, llm.model)
+            with tracking(record):
+                try:
+                    result = await fn(llm, *args, **kwargs)
+                except BaseException as e:
+                    record.finish(e)
+                    raise
+            record.finish()
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+Sink = Callable[[LLMCallRecord], None]
+
+_sinks: List[Sink] = []
+
+
+def add_sink(sink: Sink) -> None:
+    """Register a callable that receives every finished call record.
+
+    Sinks run inline on the event loop and must be cheap; hand the record
+    off to a queue for anything slow.
+    """
+    if sink not in _sinks:
+        _sinks.append(sink)
+
+
+def remove_sink(sink: Sink) -> None:
+    if sink in _sinks:
+        _sinks.remove(sink)
+
+
+def emit(record: LLMCallRecord) -> None:
+    for sink in list(_sinks):
+        try:
+            sink(record)
+        except Exception as e:
+            logger.warning(f"LLM telemetry sink {sink!r} failed: {e}")
+
+
+def log_sink(record: LLMCallRecord) -> None:
+    """Log a one-line summary of each call."""
+    ttft = f"{record.ttft_seconds:.2f}s" if record.ttft_seconds is not None else "-"
+    logger.debug(
+        f"LLM {record.kind} {record.model} task={record.task_id} "
+        f"agent={record.agent} step={record.step} tier={record.tier}: "
+        f"{record.prompt_tokens}+{record.completion_tokens} tokens "
+        f"({record.cached_tokens} cached), queue {record.queue_seconds:.2f}s, "
+        f"ttft {ttft}, total {record.latency_seconds:.2f}s, "
+        f"retries {record.retries}, cache {'hit' if record.cache_hit else 'miss'}"
+        + (f", error {record.error}" if record.error else "")
+    )
+
+
+class JsonlSink:
+    """Append each call record as one JSON line to a file."""
+
+    def __init__(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8", buffering=1)
+
+    def __call__(self, record: LLMCallRecord) -> None:
+        line = json.dumps(record.to_dict(), ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + "\n")
+
+    def __repr__(self) -> str:
+        return f"JsonlSink({self.path})"
+
+
+class UsageSummary:
+    """Running totals over the LLM calls of one task."""
+
+    def __init__(self):
+        self.calls = 0
+        self.failed_calls = 0
+        self.cache_hits = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+        self.retries = 0
+        self.latency_seconds = 0.0
+        self.queue_seconds = 0.0
+        self._ttft_total = 0.0
+        self._ttft_count = 0
+        self.by_model: Dict[str, Dict[str, int]] = {}
+        self.by_agent: Dict[str, Dict[str, float]] = {}
+        self.by_tier: Dict[str, Dict[str, float]] = {}
+        self._tier_steps: Dict[str, set] = {}
+
+    def add(self, record: LLMCallRecord) -> None:
+        self.calls += 1
+        self.failed_calls += record.error is not None
+        self.cache_hits += record.cache_hit
+        self.prompt_tokens += record.prompt_tokens
+        self.completion_tokens += record.completion_tokens
+        self.cached_tokens += record.cached_tokens
+        self.retries += record.retries
+        self.latency_seconds += record.latency_seconds
+        self.queue_seconds += record.queue_seconds
+        if record.ttft_seconds is not None:
+            self._ttft_total += record.ttft_seconds
+            self._ttft_count += 1
+
+        model = self.by_model.setdefault(
+            record.model, {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0}
+        )
+        model["calls"] += 1
+        model["prompt_tokens"] += record.prompt_tokens
+        model["completion_tokens"] += record.completion_tokens
+
+        agent = self.by_agent.setdefault(
+            record.agent or "-", {"calls": 0, "latency_seconds": 0.0}
+        )
+        agent["calls"] += 1
+        agent["latency_seconds"] += record.latency_seconds
+
+        if record.tier is not None:
+            tier = self.by_tier.setdefault(
+                record.tier, {"steps": 0, "calls": 0, "latency_seconds": 0.0}
+            )
+            steps = self._tier_steps.setdefault(record.tier, set())
+            steps.add((record.agent, record.step))
+            tier["steps"] = len(steps)
+            tier["calls"] += 1
+            tier["latency_seconds"] += record.latency_seconds
+
+    def to_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "failed_calls": self.failed_calls,
+            "cache_hits": self.cache_hits,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cached_tokens": self.cached_tokens,
+            "retries": self.retries,
+            "latency_seconds": round(self.latency_seconds, 3),
+            "queue_seconds": round(self.queue_seconds, 3),
+            "avg_ttft_seconds": round(self._ttft_total / self._ttft_count, 3)
+            if self._ttft_count
+            else None,
+            "by_model": self.by_model,
+            "by_agent": self.by_agent,
+            "by_tier": self.by_tier,
+        }
+
+
+def _configure_from_config() -> None:
+    settings = config.telemetry
+    if settings.log_calls:
+        add_sink(log_sink)
+    if settings.path:
+        path = Path(settings.path)
+        if not path.is_absolute():
+            path = PROJECT_ROOT / path
+        try:
+            add_sink(JsonlSink(path))
+        except OSError as e:
+            logger.warning(f"LLM telemetry file unavailable ({path}): {e}")
+
+
+_configure_from_config()
@@ -0,0 +1,308 @@
+"""Token counting and context-window budgeting for agent conversations."""
+
+import json
+import math
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from app.schema import Message
+
+
+try:
+    import tiktoken
+
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+
+
+# Fixed per-message cost of the chat format (role, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+class Tokenizer:
+    """Counts tokens in a string. Subclass and override `count` to plug in another tokenizer."""
+
+    name: str = "approx"
+
+    def count(self, text: str) -> int:
+        # ~4 characters per token is a fair upper-middle estimate for English
+        # and code; CJK text is closer to one token per character.
+        if not text:
+            return 0
+        wide = sum(1 for ch in text if ord(ch) > 0x2E80)
+        return wide + math.ceil((len(text) - wide) / 4)
+
+
+class TiktokenTokenizer(Tokenizer):
+    """Exact counts for OpenAI models via `tiktoken`."""
+
+    def __init__(self, model: str):
+        try:
+            self.encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            self.encoding = tiktoken.get_encoding("cl100k_base")
+        self.name = f"tiktoken:{self.encoding.name}"
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+
+@lru_cache(maxsize=None)
+def get_tokenizer(model: str) -> Tokenizer:
+    """Return the best available tokenizer for `model`."""
+    if TIKTOKEN_AVAILABLE:
+        return TiktokenTokenizer(model)
+    return Tokenizer()
+
+
+def count_message_tokens(message: Message, tokenizer: Tokenizer) -> int:
+    """Count the tokens of one message, caching the result on the message."""
+    cached = message.__pydantic_private__["_token_count"]
+    if cached is not None and cached[0] == tokenizer.name:
+        return cached[1]
+
+    tokens = MESSAGE_OVERHEAD_TOKENS + tokenizer.count(message.content or "")
+    for call in message.tool_calls or []:
+        tokens += tokenizer.count(call.function.name)
+        tokens += tokenizer.count(call.function.arguments)
+    if message.name:
+        tokens += tokenizer.count(message.name)
+
+    message.__pydantic_private__["_token_count"] = (tokenizer.name, tokens)
+    return tokens
+
+
+def group_messages(messages: List[Message]) -> List[List[Message]]:
+    """Split a conversation into units that must be kept or dropped together.
+
+    An assistant message that issues tool calls is grouped with the tool
+    results that answer it, since the API rejects one without the other.
+    """
+    groups: List[List[Message]] = []
+    for message in messages:
+        if message.role == "tool" and groups and _expects_results(groups[-1]):
+            groups[-1].append(message)
+        else:
+            groups.append([message])
+    return groups
+
+
+def _expects_results(group: List[Message]) -> bool:
+    return bool(group[0].role == "assistant" and group[0].tool_calls)
+
+
+@dataclass
+class BudgetReport:
+    """What the budgeter did to make a prompt fit."""
+
+    budget: int
+    original_tokens: int
+    prompt_tokens: int
+    elided_observations: int = 0
+    dropped_messages: int = 0
+
+    def __str__(self) -> str:
+        text = f"{self.prompt_tokens}/{self.budget} prompt tokens"
+        if self.prompt_tokens != self.original_tokens:
+            text += (
+                f" (was {self.original_tokens}; elided {self.elided_observations}"
+                f" observations, dropped {self.dropped_messages} messages)"
+            )
+        return text
+
+
+class BudgetState:
+    """Compaction decisions carried from one step of a conversation to the next.
+
+    Replaying earlier decisions keeps the prompt prefix byte-identical between
+    steps, which is what provider prompt caches key on. New decisions are only
+    taken once the budget is exceeded again, and then compact down to the low
+    watermark so the prefix changes rarely.
+    """
+
+    def __init__(self):
+        # Head message of the last group whose observations were shortened / dropped
+        self.shortened_through: Optional[Message] = None
+        self.dropped_through: Optional[Message] = None
+        # id(original) -> (original, shortened copy)
+        self.copies: Dict[int, Tuple[Message, Message]] = {}
+
+
+class ContextBudgeter:
+    """Fits a conversation into a model's prompt token budget.
+
+    Old tool observations are shortened first (they are by far the largest
+    messages and the least useful once acted on), then the oldest message
+    groups are dropped. The first user message, which carries the task, and
+    the most recent groups are always kept verbatim.
+    """
+
+    def __init__(
+        self,
+        budget: int,
+        tokenizer: Optional[Tokenizer] = None,
+        keep_recent: int = 2,
+        low_watermark: float = 0.8,
+        observation_head_chars: int = 800,
+        observation_tail_chars: int = 400,
+    ):
+        self.budget = budget
+        self.tokenizer = tokenizer or Tokenizer()
+        self.keep_recent = keep_recent
+        self.low_watermark = low_watermark
+        self.observation_head_chars = observation_head_chars
+        self.observation_tail_chars = observation_tail_chars
+
+    def count(self, messages: List[Message]) -> int:
+        return sum(count_message_tokens(msg, self.tokenizer) for msg in messages)
+
+    def fit(
+        self,
+        messages: List[Message],
+        system_msgs: Optional[List[Message]] = None,
+        tools: Optional[List[dict]] = None,
+        state: Optional[BudgetState] = None,
+    ) -> Tuple[List[Message], BudgetReport]:
+        """Return a copy of `messages` that fits the budget, plus a report.
+
+        The messages themselves are never modified; shortened observations
+        are new Message objects, so memory keeps the full history. Pass the
+        same `state` on every step of a conversation to keep its prefix stable.
+        """
+        fixed = self.count(system_msgs or [])
+        if tools:
+            fixed += self.tokenizer.count(json.dumps(tools))
+
+        groups = group_messages(messages)
+        heads = [group[0] for group in groups]
+        sizes = [self.count(group) for group in groups]
+        original = fixed + sum(sizes)
+        report = BudgetReport(
+            budget=self.budget, original_tokens=original, prompt_tokens=original
+        )
+        if original <= self.budget and (
+            state is None
+            or (state.shortened_through is None and state.dropped_through is None)
+        ):
+            return messages, report
+
+        total = original
+        protected_tail = max(len(groups) - self.keep_recent, 0)
+        first_user = next(
+            (i for i, group in enumerate(groups) if group[0].role == "user"), None
+        )
+        dropped = set()
+        copies: Dict[int, Tuple[Message, Message]] = {}
+        previous_copies = state.copies if state else {}
+
+        def shorten_group(i: int) -> None:
+            nonlocal total
+            shortened = [self._shorten(msg, previous_copies) for msg in groups[i]]
+            changed = 0
+            for new, old in zip(shortened, groups[i]):
+                if new is not old:
+                    copies[id(old)] = (old, new)
+                    changed += 1
+            if changed:
+                report.elided_observations += changed
+                groups[i] = shortened
+                new_size = self.count(shortened)
+                total -= sizes[i] - new_size
+                sizes[i] = new_size
+
+        def drop_group(i: int) -> None:
+            nonlocal total
+            dropped.add(i)
+            total -= sizes[i]
+            report.dropped_messages += len(groups[i])
+
+        def replay_limit(marker: Optional[Message]) -> int:
+            for i, head in enumerate(heads[:protected_tail]):
+                if head is marker:
+                    return i + 1
+            return 0
+
+        # 0. Re-apply earlier decisions so the prefix matches the previous step
+        shortened_upto = dropped_upto = 0
+        if state is not None:
+            shortened_upto = replay_limit(state.shortened_through)
+            dropped_upto = replay_limit(state.dropped_through)
+            for i in range(shortened_upto):
+                shorten_group(i)
+            for i in range(dropped_upto):
+                if i != first_user:
+                    drop_group(i)
+
+        if total > self.budget:
+            target = (
+                int(self.budget * self.low_watermark)
+                if state is not None
+                else self.budget
+            )
+
+            # 1. Shorten old tool observations, oldest first
+            for i in range(shortened_upto, protected_tail):
+                if total <= target:
+                    break
+                shorten_group(i)
+                shortened_upto = i + 1
+
+            # 2. Drop the oldest groups, keeping the task prompt
+            for i in range(dropped_upto, protected_tail):
+                if total <= target:
+                    break
+                if i != first_user:
+                    drop_group(i)
+                dropped_upto = i + 1
+
+            if state is not None:
+                state.shortened_through = (
+                    heads[shortened_upto - 1] if shortened_upto else None
+                )
+                state.dropped_through = (
+                    heads[dropped_upto - 1] if dropped_upto else None
+                )
+
+            # 3. Still too large: shorten recent observations too, except the latest
+            for i in range(protected_tail, len(groups) - 1):
+                if total <= self.budget:
+                    break
+                shorten_group(i)
+
+        if state is not None:
+            state.copies = copies
+
+        report.prompt_tokens = total
+        fitted = [
+            msg for i, group in enumerate(groups) if i not in dropped for msg in group
+        ]
+        return fitted, report
+
+    def _shorten(
+        self, message: Message, previous: Dict[int, Tuple[Message, Message]]
+    ) -> Message:
+        content = message.content or ""
+        keep = self.observation_head_chars + self.observation_tail_chars
+        if message.role != "tool" or len(content) <= keep:
+            return message
+        original, copy = previous.get(id(message), (None, None))
+        if original is message and copy is not None:
+            return copy
+        elided = len(content) - keep
+        tail = (
+            content[-self.observation_tail_chars :]
+            if self.observation_tail_chars
+            else ""
+        )
+        shortened = (
+            f"{content[: self.observation_head_chars]}\n"
+            f"... [{elided} characters elided to fit the context window] ...\n"
+            f"{tail}"
+        )
+        copy = message.model_copy()
+        copy.content = shortened  # assignment also drops the copied caches
+        return copy
@@ -8,6 +8,8 @@ class BaseTool(ABC, BaseModel):
     name: str
     description: str
     parameters: Optional[dict] = None
+    # Tools that only read state may run concurrently with each other
+    read_only: bool = False
 
     class Config:
         arbitrary_types_allowed = True
@@ -20,6 +22,30 @@ class BaseTool(ABC, BaseModel):
     async def execute(self, **kwargs) -> Any:
         """Execute the tool with given parameters."""
 
+    def is_concurrency_safe(self, **kwargs) -> bool:
+        """Whether a call with these parameters may overlap other safe calls.
+
+        Defaults to `read_only`; override to decide per call, e.g. for a
+        tool with both reading and writing commands.
+        """
+        return self.read_only
+
+    def checkpoint_state(self) -> Optional[dict]:
+        """JSON-serialisable state to save with an agent checkpoint, if any."""
+        return None
+
+    async def restore_state(self, state: dict) -> None:
+        """Restore state returned by `checkpoint_state`."""
+
+    async def warm_up(self) -> None:
+        """Start sessions or processes ahead of the first call."""
+
+    async def reset(self) -> None:
+        """Drop all state left by previous calls, so another task can use the tool."""
+
+    async def close(self) -> None:
+        """Release sessions or processes held by the tool."""
+
     def to_param(self) -> Dict:
         """Convert tool to function call format."""
         return {
@@ -1,5 +1,7 @@
 import asyncio
 import os
+import shlex
+import signal
 from typing import Optional
 
 from app.exceptions import ToolError
@@ -24,9 +26,10 @@ class _BashSession:
     _timeout: float = 120.0  # seconds
     _sentinel: str = "<<exit>>"
 
-    def __init__(self):
+    def __init__(self, cwd: Optional[str] = None):
         self._started = False
         self._timed_out = False
+        self._cwd = cwd
 
     async def start(self):
         if self._started:
@@ -41,6 +44,9 @@ class _BashSession:
             "stderr": asyncio.subprocess.PIPE,
         }
         
+        if self._cwd and os.path.isdir(self._cwd):
+            kwargs["cwd"] = self._cwd
+
         # 在Unix/Linux系统上使用setsid，Windows上跳过
         if os.name != 'nt':  # 非Windows系统
             kwargs["preexec_fn"] = os.setsid
@@ -55,12 +61,32 @@ class _BashSession:
 
         self._started = True
 
+    def cwd(self) -> Optional[str]:
+        """Current directory of the shell, read without running a command (Linux only)."""
+        if not self._started or self._process.returncode is not None:
+            return None
+        pid = self._process.pid
+        try:
+            # The process is `sh -c bash` unless sh exec'd bash; ask bash itself
+            with open(f"/proc/{pid}/task/{pid}/children") as f:
+                children = f.read().split()
+            return os.readlink(f"/proc/{children[0] if children else pid}/cwd")
+        except OSError:
+            return None
+
     def stop(self):
         """Terminate the bash shell."""
         if not self._started:
             raise ToolError("Session has not started.")
         if self._process.returncode is not None:
             return
+        if os.name != "nt":
+            # The shell leads its own session (setsid); end bash and its jobs too
+            try:
+                os.killpg(self._process.pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+            return
         self._process.terminate()
 
     async def run(self, command: str):
@@ -141,6 +167,33 @@ class Bash(BaseTool):
     }
 
     _session: Optional[_BashSession] = None
+    _cwd: Optional[str] = None  # directory new sessions start in
+
+    def checkpoint_state(self) -> Optional[dict]:
+        cwd = (self._session and self._session.cwd()) or self._cwd
+        return {"cwd": cwd} if cwd else None
+
+    async def restore_state(self, state: dict) -> None:
+        self._cwd = state.get("cwd")
+        if self._cwd and self._session is not None:
+            await self._session.run(f"cd {shlex.quote(self._cwd)}")
+
+    async def warm_up(self) -> None:
+        if self._session is None:
+            self._session = _BashSession(cwd=self._cwd)
+            await self._session.start()
+
+    async def reset(self) -> None:
+        """Replace the session with a fresh shell: no leftover cwd, variables or jobs."""
+        self._cwd = None
+        if self._session is not None:
+            await self.close()
+            await self.warm_up()
+
+    async def close(self) -> None:
+        if self._session is not None:
+            self._session.stop()
+            self._session = None
 
     async def execute(
         self, command: str | None = None, restart: bool = False, **kwargs
@@ -148,13 +201,13 @@ class Bash(BaseTool):
         if restart:
             if self._session:
                 self._session.stop()
-            self._session = _BashSession()
+            self._session = _BashSession(cwd=self._cwd)
             await self._session.start()
 
             return ToolResult(system="tool has been restarted.")
 
         if self._session is None:
-            self._session = _BashSession()
+            self._session = _BashSession(cwd=self._cwd)
             await self._session.start()
 
         if command is not None:
@@ -0,0 +1,141 @@
+"""Bounded undo history for the file editor, kept as compressed reverse deltas."""
+
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+
+# Undo history kept per file, in compressed bytes; the oldest edits go first
+MAX_BYTES_PER_FILE: int = 1024 * 1024
+# Files with undo history; the least recently edited file is forgotten first
+MAX_FILES: int = 64
+
+# Delta texts shorter than this are stored uncompressed
+_COMPRESS_MIN: int = 256
+
+
+def _common_prefix(a: str, b: str) -> int:
+    """Length of the common prefix, comparing slices so the work stays in C."""
+    low, high = 0, min(len(a), len(b))
+    while low < high:
+        mid = (low + high + 1) // 2
+        if a[low:mid] == b[low:mid]:
+            low = mid
+        else:
+            high = mid - 1
+    return low
+
+
+def _common_suffix(a: str, b: str, limit: int) -> int:
+    """Length of the common suffix, at most `limit`."""
+    low, high = 0, limit
+    while low < high:
+        mid = (low + high + 1) // 2
+        if a[len(a) - mid : len(a) - low] == b[len(b) - mid : len(b) - low]:
+            low = mid
+        else:
+            high = mid - 1
+    return low
+
+
+def _pack(text: str) -> bytes:
+    data = text.encode("utf-8")
+    if len(data) < _COMPRESS_MIN:
+        return b"\0" + data
+    return b"\1" + zlib.compress(data)
+
+
+def _unpack(data: bytes) -> str:
+    if data[:1] == b"\0":
+        return data[1:].decode("utf-8")
+    return zlib.decompress(data[1:]).decode("utf-8")
+
+
+# A reverse delta turns a version back into its predecessor:
+# old = new[:start] + unpack(old_middle) + new[end:]
+Delta = Tuple[int, int, bytes]
+
+
+class _FileEntry:
+    __slots__ = ("latest", "latest_hash", "deltas", "size")
+
+    def __init__(self, text: str):
+        self.latest = _pack(text)
+        self.latest_hash = hash(text)
+        self.deltas: List[Delta] = []
+        self.size = len(self.latest)
+
+
+class FileHistory:
+    """Undo history of the files one editor changed.
+
+    Each file keeps its latest known content, compressed, plus one reverse
+    delta per edit covering only the changed span, so an edit costs about
+    the size of the change rather than a full copy of the file. History is
+    capped at `max_bytes_per_file` per file, dropping the oldest edits, and
+    at `max_files` files, dropping the least recently edited.
+    """
+
+    def __init__(
+        self, max_bytes_per_file: int = MAX_BYTES_PER_FILE, max_files: int = MAX_FILES
+    ):
+        self.max_bytes_per_file = max_bytes_per_file
+        self.max_files = max_files
+        self._files: "OrderedDict[Path, _FileEntry]" = OrderedDict()
+
+    def record(self, path: Path, old_text: Optional[str], new_text: str) -> None:
+        """Remember that `path` changed from `old_text` (None if new) to `new_text`."""
+        entry = self._files.get(path)
+        if old_text is None or entry is None or entry.latest_hash != hash(old_text):
+            # No history yet, or the file changed outside the editor: the
+            # deltas no longer lead back from the current content
+            entry = _FileEntry(new_text)
+        else:
+            entry.size -= len(entry.latest)
+            entry.latest = _pack(new_text)
+            entry.latest_hash = hash(new_text)
+            entry.size += len(entry.latest)
+        if old_text is not None:
+            delta = self._delta(old_text, new_text)
+            entry.deltas.append(delta)
+            entry.size += len(delta[2])
+
+        while entry.deltas and entry.size > self.max_bytes_per_file:
+            entry.size -= len(entry.deltas.pop(0)[2])
+        self._files[path] = entry
+        self._files.move_to_end(path)
+        while len(self._files) > self.max_files:
+            self._files.popitem(last=False)
+
+    def undo(self, path: Path) -> Optional[str]:
+        """The content before the last recorded edit of `path`, or None."""
+        entry = self._files.get(path)
+        if entry is None or not entry.deltas:
+            return None
+        start, end, old_middle = entry.deltas.pop()
+        latest = _unpack(entry.latest)
+        previous = latest[:start] + _unpack(old_middle) + latest[end:]
+        entry.size -= len(entry.latest) + len(old_middle)
+        entry.latest = _pack(previous)
+        entry.latest_hash = hash(previous)
+        entry.size += len(entry.latest)
+        return previous
+
+    def clear(self) -> None:
+        self._files.clear()
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(entry.size for entry in self._files.values())
+
+    @staticmethod
+    def _delta(old_text: str, new_text: str) -> Delta:
+        prefix = _common_prefix(old_text, new_text)
+        limit = min(len(old_text), len(new_text)) - prefix
+        suffix = _common_suffix(old_text, new_text, limit)
+        return (
+            prefix,
+            len(new_text) - suffix,
+            _pack(old_text[prefix : len(old_text) - suffix]),
+        )
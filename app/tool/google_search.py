@@ -27,6 +27,7 @@ The tool returns a list of URLs that match the search query.
         },
         "required": ["query"],
     }
+    read_only: bool = True
 
     async def execute(self, query: str, num_results: int = 10) -> List[str]:
         """
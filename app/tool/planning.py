@@ -1,6 +1,8 @@
 # tool/planning.py
 from typing import Dict, List, Literal, Optional
 
+from pydantic import Field
+
 from app.exceptions import ToolError
 from app.tool.base import BaseTool, ToolResult
 
@@ -48,6 +50,11 @@ class PlanningTool(BaseTool):
                 "type": "array",
                 "items": {"type": "string"},
             },
+            "step_dependencies": {
+                "description": "For each step, the 0-based indices of earlier steps it depends on. Steps whose dependencies are completed may run in parallel, so list only real prerequisites. Optional for create and update commands; when omitted, each step depends on the one before it.",
+                "type": "array",
+                "items": {"type": "array", "items": {"type": "integer"}},
+            },
             "step_index": {
                 "description": "Index of the step to update (0-based). Required for mark_step command.",
                 "type": "integer",
@@ -66,9 +73,25 @@ class PlanningTool(BaseTool):
         "additionalProperties": False,
     }
 
-    plans: dict = {}  # Dictionary to store plans by plan_id
+    plans: dict = Field(default_factory=dict)  # Dictionary to store plans by plan_id
     _current_plan_id: Optional[str] = None  # Track the current active plan
 
+    def is_concurrency_safe(self, command: str = "", **kwargs) -> bool:
+        return command in ("list", "get")
+
+    def checkpoint_state(self) -> Optional[dict]:
+        if not self.plans:
+            return None
+        return {"plans": self.plans, "current_plan_id": self._current_plan_id}
+
+    async def restore_state(self, state: dict) -> None:
+        self.plans.update(state.get("plans", {}))
+        self._current_plan_id = state.get("current_plan_id")
+
+    async def reset(self) -> None:
+        self.plans.clear()
+        self._current_plan_id = None
+
     async def execute(
         self,
         *,
@@ -83,6 +106,7 @@ class PlanningTool(BaseTool):
             Literal["not_started", "in_progress", "completed", "blocked"]
         ] = None,
         step_notes: Optional[str] = None,
+        step_dependencies: Optional[List[List[int]]] = None,
         **kwargs,
     ):
         """
@@ -96,12 +120,13 @@ class PlanningTool(BaseTool):
         - step_index: Index of the step to update (used with mark_step command)
         - step_status: Status to set for a step (used with mark_step command)
         - step_notes: Additional notes for a step (used with mark_step command)
+        - step_dependencies: Indices of the earlier steps each step depends on (used with create and update commands)
         """
 
         if command == "create":
-            return self._create_plan(plan_id, title, steps)
+            return self._create_plan(plan_id, title, steps, step_dependencies)
         elif command == "update":
-            return self._update_plan(plan_id, title, steps)
+            return self._update_plan(plan_id, title, steps, step_dependencies)
         elif command == "list":
             return self._list_plans()
         elif command == "get":
@@ -118,7 +143,11 @@ class PlanningTool(BaseTool):
             )
 
     def _create_plan(
-        self, plan_id: Optional[str], title: Optional[str], steps: Optional[List[str]]
+        self,
+        plan_id: Optional[str],
+        title: Optional[str],
+        steps: Optional[List[str]],
+        step_dependencies: Optional[List[List[int]]] = None,
     ) -> ToolResult:
         """Create a new plan with the given ID, title, and steps."""
         if not plan_id:
@@ -148,6 +177,9 @@ class PlanningTool(BaseTool):
             "steps": steps,
             "step_statuses": ["not_started"] * len(steps),
             "step_notes": [""] * len(steps),
+            "step_dependencies": self._check_dependencies(
+                step_dependencies, len(steps)
+            ),
         }
 
         self.plans[plan_id] = plan
@@ -158,7 +190,11 @@ class PlanningTool(BaseTool):
         )
 
     def _update_plan(
-        self, plan_id: Optional[str], title: Optional[str], steps: Optional[List[str]]
+        self,
+        plan_id: Optional[str],
+        title: Optional[str],
+        steps: Optional[List[str]],
+        step_dependencies: Optional[List[List[int]]] = None,
     ) -> ToolResult:
         """Update an existing plan with new title or steps."""
         if not plan_id:
@@ -201,11 +237,64 @@ class PlanningTool(BaseTool):
             plan["steps"] = steps
             plan["step_statuses"] = new_statuses
             plan["step_notes"] = new_notes
+            # Dependencies of the old steps no longer apply to the new ones
+            if step_dependencies is None:
+                plan["step_dependencies"] = self._check_dependencies(None, len(steps))
+
+        if step_dependencies is not None:
+            plan["step_dependencies"] = self._check_dependencies(
+                step_dependencies, len(plan["steps"])
+            )
 
         return ToolResult(
             output=f"Plan updated successfully: {plan_id}\n\n{self._format_plan(plan)}"
         )
 
+    @staticmethod
+    def _check_dependencies(
+        step_dependencies: Optional[List[List[int]]], step_count: int
+    ) -> List[List[int]]:
+        """Validate step dependencies, defaulting to each step after the previous one."""
+        if step_dependencies is None:
+            return [[i - 1] if i else [] for i in range(step_count)]
+        if (
+            not isinstance(step_dependencies, list)
+            or len(step_dependencies) != step_count
+        ):
+            raise ToolError(
+                "Parameter `step_dependencies` must have one list of step indices per step"
+            )
+        checked = []
+        for i, dependencies in enumerate(step_dependencies):
+            if not isinstance(dependencies, list) or not all(
+                isinstance(d, int) and 0 <= d < i for d in dependencies
+            ):
+                # Only earlier steps may be depended on, which rules out cycles
+                raise ToolError(
+                    f"Invalid dependencies for step {i}: {dependencies}. A step can only depend on earlier steps."
+                )
+            checked.append(sorted(set(dependencies)))
+        return checked
+
+    def _dependencies(self, plan: Dict) -> List[List[int]]:
+        # Plans created before dependencies existed run their steps in order
+        dependencies = plan.get("step_dependencies")
+        if dependencies is None or len(dependencies) != len(plan["steps"]):
+            return self._check_dependencies(None, len(plan["steps"]))
+        return dependencies
+
+    def ready_steps(self, plan_id: str, exclude=()) -> List[int]:
+        """Indices of unfinished steps whose dependencies are all completed."""
+        plan = self.plans[plan_id]
+        statuses = plan["step_statuses"]
+        return [
+            i
+            for i, dependencies in enumerate(self._dependencies(plan))
+            if i not in exclude
+            and statuses[i] in ("not_started", "in_progress")
+            and all(statuses[d] == "completed" for d in dependencies)
+        ]
+
     def _list_plans(self) -> ToolResult:
         """List all available plans."""
         if not self.plans:
@@ -345,9 +434,14 @@ class PlanningTool(BaseTool):
         output += f"Status: {completed} completed, {in_progress} in progress, {blocked} blocked, {not_started} not started\n\n"
         output += "Steps:\n"
 
-        # Add each step with its status and notes
-        for i, (step, status, notes) in enumerate(
-            zip(plan["steps"], plan["step_statuses"], plan["step_notes"])
+        # Add each step with its status, dependencies and notes
+        for i, (step, status, notes, dependencies) in enumerate(
+            zip(
+                plan["steps"],
+                plan["step_statuses"],
+                plan["step_notes"],
+                self._dependencies(plan),
+            )
         ):
             status_symbol = {
                 "not_started": "[ ]",
@@ -356,7 +450,12 @@ class PlanningTool(BaseTool):
                 "blocked": "[!]",
             }.get(status, "[ ]")
 
-            output += f"{i}. {status_symbol} {step}\n"
+            output += f"{i}. {status_symbol} {step}"
+            # Only dependencies other than the previous step are worth showing
+            if dependencies != ([i - 1] if i else []):
+                after = ", ".join(map(str, dependencies)) or "none"
+                output += f" (depends on: {after})"
+            output += "\n"
             if notes:
                 output += f"   Notes: {notes}\n"
 
@@ -1,10 +1,12 @@
-from collections import defaultdict
 from pathlib import Path
 from typing import Literal, get_args
 
+from pydantic import PrivateAttr
+
 from app.exceptions import ToolError
 from app.tool import BaseTool
 from app.tool.base import CLIResult, ToolResult
+from app.tool.file_history import FileHistory
 from app.tool.run import run
 
 
@@ -86,7 +88,15 @@ class StrReplaceEditor(BaseTool):
         "required": ["command", "path"],
     }
 
-    _file_history: list = defaultdict(list)
+    # Per-editor undo history, bounded in size
+    _file_history: FileHistory = PrivateAttr(default_factory=FileHistory)
+
+    async def reset(self) -> None:
+        self._file_history.clear()
+
+    def is_concurrency_safe(self, command: str = "", **kwargs) -> bool:
+        """Only `view` leaves the files (and the undo history) untouched."""
+        return command == "view"
 
     async def execute(
         self,
@@ -108,7 +118,7 @@ class StrReplaceEditor(BaseTool):
             if file_text is None:
                 raise ToolError("Parameter `file_text` is required for command: create")
             self.write_file(_path, file_text)
-            self._file_history[_path].append(file_text)
+            self._file_history.record(_path, None, file_text)
             result = ToolResult(output=f"File created successfully at: {_path}")
         elif command == "str_replace":
             if old_str is None:
@@ -236,7 +246,7 @@ class StrReplaceEditor(BaseTool):
         self.write_file(path, new_file_content)
 
         # Save the content to history
-        self._file_history[path].append(file_content)
+        self._file_history.record(path, file_content, new_file_content)
 
         # Create a snippet of the edited section
         replacement_line = file_content.split(old_str)[0].count("\n")
@@ -281,7 +291,7 @@ class StrReplaceEditor(BaseTool):
         snippet = "\n".join(snippet_lines)
 
         self.write_file(path, new_file_text)
-        self._file_history[path].append(file_text)
+        self._file_history.record(path, file_text, new_file_text)
 
         success_msg = f"The file {path} has been edited. "
         success_msg += self._make_output(
@@ -294,10 +304,10 @@ class StrReplaceEditor(BaseTool):
 
     def undo_edit(self, path: Path):
         """Implement the undo_edit command."""
-        if not self._file_history[path]:
+        old_text = self._file_history.undo(path)
+        if old_text is None:
             raise ToolError(f"No edit history found for {path}.")
 
-        old_text = self._file_history[path].pop()
         self.write_file(path, old_text)
 
         return CLIResult(
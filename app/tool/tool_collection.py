@@ -1,4 +1,5 @@
 """Collection classes for managing multiple tools."""
+import asyncio
 from typing import Any, Dict, List
 
 from app.exceptions import ToolError
@@ -11,12 +12,17 @@ class ToolCollection:
     def __init__(self, *tools: BaseTool):
         self.tools = tools
         self.tool_map = {tool.name: tool for tool in tools}
+        self._params = None
 
     def __iter__(self):
         return iter(self.tools)
 
     def to_params(self) -> List[Dict[str, Any]]:
-        return [tool.to_param() for tool in self.tools]
+        # Built once so every request sends a byte-identical tool list,
+        # which keeps it inside the provider's cached prompt prefix
+        if self._params is None:
+            self._params = [tool.to_param() for tool in self.tools]
+        return self._params
 
     async def execute(
         self, *, name: str, tool_input: Dict[str, Any] = None
@@ -30,6 +36,16 @@ class ToolCollection:
         except ToolError as e:
             return ToolFailure(error=e.message)
 
+    def is_concurrency_safe(self, *, name: str, tool_input: Dict[str, Any]) -> bool:
+        """Whether the call may run concurrently with other safe calls."""
+        tool = self.tool_map.get(name)
+        if not tool:
+            return False
+        try:
+            return tool.is_concurrency_safe(**tool_input)
+        except TypeError:
+            return False
+
     async def execute_all(self) -> List[ToolResult]:
         """Execute all tools in the collection sequentially."""
         results = []
@@ -41,12 +57,36 @@ class ToolCollection:
                 results.append(ToolFailure(error=e.message))
         return results
 
+    def checkpoint_state(self) -> Dict[str, dict]:
+        """Checkpoint state of every tool that has some, by tool name."""
+        states = {}
+        for tool in self.tools:
+            state = tool.checkpoint_state()
+            if state is not None:
+                states[tool.name] = state
+        return states
+
+    async def restore_state(self, states: Dict[str, dict]) -> None:
+        for name, state in states.items():
+            if name in self.tool_map:
+                await self.tool_map[name].restore_state(state)
+
+    async def warm_up(self) -> None:
+        await asyncio.gather(*(tool.warm_up() for tool in self.tools))
+
+    async def reset(self) -> None:
+        await asyncio.gather(*(tool.reset() for tool in self.tools))
+
+    async def close(self) -> None:
+        await asyncio.gather(*(tool.close() for tool in self.tools))
+
     def get_tool(self, name: str) -> BaseTool:
         return self.tool_map.get(name)
 
     def add_tool(self, tool: BaseTool):
         self.tools += (tool,)
         self.tool_map[tool.name] = tool
+        self._params = None
         return self
 
     def add_tools(self, *tools: BaseTool):
@@ -0,0 +1,229 @@
+"""Process-wide pooled HTTP transport shared by every LLM client."""
+
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+import httpx
+from openai import AsyncOpenAI
+
+from app.config import config
+from app.logger import logger
+
+
+try:
+    import h2  # noqa: F401
+
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+# httpcore trace events that mark the moment a request got hold of a connection
+_CONNECTION_ACQUIRED_EVENTS = (
+    "connection.connect_tcp.started",
+    "connection.connect_unix_socket.started",
+    "http11.send_request_headers.started",
+    "http2.send_request_headers.started",
+)
+
+
+class TransportStats:
+    """Counters describing how the shared connection pool is being used."""
+
+    def __init__(self, max_connections: int):
+        self.max_connections = max_connections
+        self.requests = 0
+        self.failures = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.connections_opened = 0
+        self.pool_wait_total = 0.0
+        self.pool_wait_max = 0.0
+        self._lock = threading.Lock()
+
+    def request_started(self) -> None:
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def request_finished(self, failed: bool = False) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            if failed:
+                self.failures += 1
+
+    def connection_opened(self) -> None:
+        with self._lock:
+            self.connections_opened += 1
+
+    def record_pool_wait(self, seconds: float) -> None:
+        with self._lock:
+            self.pool_wait_total += seconds
+            self.pool_wait_max = max(self.pool_wait_max, seconds)
+
+    def snapshot(self) -> dict:
+        """Return a JSON-serialisable view of the counters."""
+        with self._lock:
+            requests = self.requests
+            return {
+                "requests": requests,
+                "failures": self.failures,
+                "in_flight": self.in_flight,
+                "peak_in_flight": self.peak_in_flight,
+                "max_connections": self.max_connections,
+                "pool_utilization": self.in_flight / self.max_connections
+                if self.max_connections
+                else 0.0,
+                "connections_opened": self.connections_opened,
+                "connection_reuse_ratio": 1 - self.connections_opened / requests
+                if requests
+                else 0.0,
+                "pool_wait_avg": self.pool_wait_total / requests if requests else 0.0,
+                "pool_wait_max": self.pool_wait_max,
+            }
+
+
+class _TrackedStream(httpx.AsyncByteStream):
+    """Response body wrapper that reports when the connection is released."""
+
+    def __init__(self, stream: httpx.AsyncByteStream, on_close: Callable[[], None]):
+        self._stream = stream
+        self._on_close = on_close
+        self._closed = False
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            if not self._closed:
+                self._closed = True
+                self._on_close()
+
+
+class InstrumentedTransport(httpx.AsyncHTTPTransport):
+    """An AsyncHTTPTransport that records pool utilisation and wait time."""
+
+    def __init__(self, stats: TransportStats, **kwargs):
+        super().__init__(**kwargs)
+        self.stats = stats
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        started = time.monotonic()
+        acquired: Optional[float] = None
+        upstream_trace = request.extensions.get("trace")
+
+        async def trace(event_name: str, info: dict) -> None:
+            nonlocal acquired
+            if acquired is None and event_name in _CONNECTION_ACQUIRED_EVENTS:
+                acquired = time.monotonic()
+                self.stats.record_pool_wait(acquired - started)
+            if event_name == "connection.connect_tcp.complete":
+                self.stats.connection_opened()
+            if upstream_trace is not None:
+                await upstream_trace(event_name, info)
+
+        request.extensions["trace"] = trace
+        self.stats.request_started()
+        try:
+            response = await super().handle_async_request(request)
+        except Exception:
+            if acquired is None:
+                self.stats.record_pool_wait(time.monotonic() - started)
+            self.stats.request_finished(failed=True)
+            raise
+
+        response.stream = _TrackedStream(response.stream, self.stats.request_finished)
+        return response
+
+
+_lock = threading.Lock()
+_http_client: Optional[httpx.AsyncClient] = None
+_stats: Optional[TransportStats] = None
+_openai_clients: Dict[Tuple[str, Optional[str]], AsyncOpenAI] = {}
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the process-wide pooled AsyncClient, creating it on first use."""
+    global _http_client, _stats
+    if _http_client is not None:
+        return _http_client
+
+    with _lock:
+        if _http_client is None:
+            settings = config.http
+            http2 = settings.http2 and HTTP2_AVAILABLE
+            if settings.http2 and not HTTP2_AVAILABLE:
+                logger.warning(
+                    "HTTP/2 requested but `h2` is not installed, using HTTP/1.1"
+                )
+
+            _stats = TransportStats(settings.max_connections)
+            limits = httpx.Limits(
+                max_connections=settings.max_connections,
+                max_keepalive_connections=settings.max_keepalive_connections,
+                keepalive_expiry=settings.keepalive_expiry,
+            )
+            transport = InstrumentedTransport(
+                _stats, limits=limits, http2=http2, retries=0
+            )
+            _http_client = httpx.AsyncClient(
+                transport=transport,
+                timeout=httpx.Timeout(
+                    None,
+                    connect=settings.connect_timeout,
+                    pool=settings.pool_timeout,
+                ),
+                follow_redirects=True,
+            )
+            logger.info(
+                f"Shared HTTP pool ready: max_connections={settings.max_connections}, "
+                f"keepalive={settings.max_keepalive_connections}, http2={http2}"
+            )
+    return _http_client
+
+
+def get_openai_client(api_key: str, base_url: Optional[str] = None) -> AsyncOpenAI:
+    """Return an AsyncOpenAI client bound to the shared pool.
+
+    Clients are cached per (api_key, base_url) so identical endpoints share
+    one client object as well as the underlying connections.
+    """
+    key = (api_key, base_url or None)
+    client = _openai_clients.get(key)
+    if client is None:
+        http_client = get_http_client()
+        with _lock:
+            client = _openai_clients.get(key)
+            if client is None:
+                client = AsyncOpenAI(
+                    api_key=api_key, base_url=base_url or None, http_client=http_client
+                )
+                _openai_clients[key] = client
+    return client
+
+
+def transport_stats() -> dict:
+    """Return pool utilisation and wait-time metrics for the shared transport."""
+    if _stats is None:
+        return {"initialized": False}
+    return {
+        "initialized": True,
+        "http2": HTTP2_AVAILABLE and config.http.http2,
+        **_stats.snapshot(),
+    }
+
+
+async def aclose_http_client() -> None:
+    """Close the shared pool; later calls to get_http_client() recreate it."""
+    global _http_client
+    with _lock:
+        client, _http_client = _http_client, None
+        _openai_clients.clear()
+    if client is not None:
+        await client.aclose()
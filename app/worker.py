@@ -0,0 +1,351 @@
+"""Worker processes running agent tasks off the API server's event loop."""
+
+import asyncio
+import multiprocessing
+import queue
+import threading
+from typing import Any, Dict, List, Optional, Set
+
+from app.config import config
+from app.event_bus import Subscription, event_broker
+from app.logger import logger
+from app.task_context import get_task_context, open_task_context
+
+
+# Seconds a cancelled task waits for its worker to report it stopped
+CANCEL_TIMEOUT = 10
+
+
+class WorkerUnavailable(Exception):
+    """Raised when no worker process is alive to take a task."""
+
+
+class WorkerCrashed(Exception):
+    """Raised when the worker running a task exits before finishing it."""
+
+
+class WorkerTaskFailed(Exception):
+    """Raised when a task fails inside its worker; the worker reported it already."""
+
+    def __init__(self, message: str, outcome: Optional[Dict[str, Any]] = None):
+        super().__init__(message)
+        self.outcome = outcome or {}
+
+
+# Messages put on a worker's job queue:
+#   ("run", job)        job = dict(task_id, prompt, model, user_info, resume)
+#   ("cancel", task_id)
+#   None                shut down
+# Messages workers put on the shared event queue, as (kind, task_id, payload):
+#   ("events", task_id, [event, ...])   events published in the task's context
+#   ("llm_call", None, record_dict)     a finished LLM call record
+#   ("done", task_id, outcome)          outcome has "files", "error" or "cancelled",
+#                                       and "records", the task's log URL and
+#                                       uploaded files kept by the worker's
+#                                       in-memory task service
+
+
+class _Worker:
+    """Parent-side handle of one worker process."""
+
+    def __init__(self, index: int, mp_context, events):
+        self.index = index
+        self.jobs = mp_context.Queue()
+        self.active: Set[str] = set()
+        self.process = mp_context.Process(
+            target=_worker_main,
+            args=(index, self.jobs, events),
+            name=f"agent-worker-{index}",
+            daemon=True,
+        )
+        self.process.start()
+
+    def alive(self) -> bool:
+        return self.process.is_alive()
+
+
+class WorkerPool:
+    """Runs agent tasks in `processes` worker processes.
+
+    Each worker runs the whole task pipeline (agent, log cleaning, file
+    detection, uploads) in its own event loop, so CPU-heavy work no longer
+    competes with the web handlers and a misbehaving agent can only take its
+    own process down. Events a task publishes in its worker are streamed
+    back and republished in the task's context here, where SSE clients are
+    subscribed. Workers that exit are replaced, failing the tasks they ran.
+    """
+
+    def __init__(self, processes: int = 0):
+        self.processes = processes
+        self._mp = multiprocessing.get_context("spawn")
+        self._events = None
+        self._workers: List[_Worker] = []
+        self._futures: Dict[str, asyncio.Future] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._reader: Optional[threading.Thread] = None
+        self._monitor: Optional[asyncio.Task] = None
+        self.completed = 0
+        self.failed = 0
+        self.crashes = 0
+
+    @classmethod
+    def from_config(cls) -> "WorkerPool":
+        return cls(processes=config.worker.processes)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self._workers)
+
+    def start(self) -> None:
+        """Spawn the workers; without any, tasks keep running in this process."""
+        if self.processes <= 0 or self._workers:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._events = self._mp.Queue()
+        try:
+            for i in range(self.processes):
+                self._workers.append(_Worker(i, self._mp, self._events))
+        except OSError as e:
+            logger.warning(
+                f"Starting agent workers failed, running tasks in-process: {e}"
+            )
+            self._stop_workers()
+            return
+        self._reader = threading.Thread(
+            target=self._read_events, name="agent-worker-events", daemon=True
+        )
+        self._reader.start()
+        self._monitor = asyncio.create_task(self._watch())
+        logger.info(f"Started {len(self._workers)} agent worker processes")
+
+    async def run(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        """Run `job` in the least busy worker and wait for its outcome."""
+        workers = [w for w in self._workers if w.alive()]
+        if not workers:
+            raise WorkerUnavailable("no agent worker process is alive")
+        worker = min(workers, key=lambda w: len(w.active))
+        key = str(job["task_id"])
+        future = self._loop.create_future()
+        self._futures[key] = future
+        worker.active.add(key)
+        worker.jobs.put(("run", job))
+        try:
+            outcome = await future
+        except asyncio.CancelledError:
+            if worker.alive():
+                worker.jobs.put(("cancel", key))
+                # Return once the worker has cleaned up, so the caller does not
+                # race a checkpoint write still in progress there
+                await asyncio.wait([future], timeout=CANCEL_TIMEOUT)
+            raise
+        finally:
+            self._futures.pop(key, None)
+            worker.active.discard(key)
+        if "error" in outcome:
+            self.failed += 1
+            raise WorkerTaskFailed(outcome["error"], outcome)
+        self.completed += 1
+        return outcome
+
+    def _read_events(self) -> None:
+        """Thread: move worker messages onto the event loop in batches."""
+        while True:
+            message = self._events.get()
+            if message is None:
+                return
+            batch = [message]
+            try:
+                while len(batch) < 256:
+                    message = self._events.get_nowait()
+                    if message is None:
+                        self._loop.call_soon_threadsafe(self._deliver, batch)
+                        return
+                    batch.append(message)
+            except queue.Empty:
+                pass
+            try:
+                self._loop.call_soon_threadsafe(self._deliver, batch)
+            except RuntimeError:  # the loop is closed
+                return
+
+    def _deliver(self, batch: List[tuple]) -> None:
+        for kind, key, payload in batch:
+            if kind == "events":
+                ctx = get_task_context(key)
+                if ctx is None:  # finished and forgotten meanwhile
+                    continue
+                for event in payload:
+                    ctx.publish(event)
+            elif kind == "llm_call":
+                _record_llm_call(payload)
+            elif kind == "done":
+                future = self._futures.get(key)
+                if future is not None and not future.done():
+                    future.set_result(payload)
+
+    async def _watch(self) -> None:
+        """Replace workers that exited, failing the tasks they were running."""
+        while True:
+            await asyncio.sleep(1)
+            for i, worker in enumerate(self._workers):
+                if worker.alive():
+                    continue
+                self.crashes += 1
+                logger.error(
+                    f"Agent worker {worker.index} exited with code "
+                    f"{worker.process.exitcode}, restarting it"
+                )
+                for key in list(worker.active):
+                    future = self._futures.get(key)
+                    if future is not None and not future.done():
+                        future.set_exception(
+                            WorkerCrashed(
+                                f"worker exited with code {worker.process.exitcode}"
+                            )
+                        )
+                try:
+                    self._workers[i] = _Worker(worker.index, self._mp, self._events)
+                except OSError as e:
+                    logger.error(f"Restarting agent worker {worker.index} failed: {e}")
+
+    def _stop_workers(self) -> None:
+        for worker in self._workers:
+            try:
+                worker.jobs.put(None)
+            except (OSError, ValueError):
+                pass
+        for worker in self._workers:
+            worker.process.join(timeout=5)
+            if worker.alive():
+                worker.process.terminate()
+        self._workers = []
+
+    async def close(self) -> None:
+        if self._monitor is not None:
+            self._monitor.cancel()
+        if not self._workers:
+            return
+        await asyncio.to_thread(self._stop_workers)
+        self._events.put(None)
+        for future in self._futures.values():
+            if not future.done():
+                future.set_exception(WorkerCrashed("server shutting down"))
+
+    def stats(self) -> dict:
+        return {
+            "processes": self.processes,
+            "alive": sum(1 for w in self._workers if w.alive()),
+            "running": {w.index: len(w.active) for w in self._workers},
+            "completed": self.completed,
+            "failed": self.failed,
+            "crashes": self.crashes,
+        }
+
+
+def _record_llm_call(payload: Dict[str, Any]) -> None:
+    from app.services.task_service import task_service
+    from app.telemetry import LLMCallRecord
+
+    payload.pop("retries", None)
+    task_service.record_llm_call(LLMCallRecord(**payload))
+
+
+# Worker process side
+
+
+def _worker_main(index: int, jobs, events) -> None:
+    asyncio.run(_serve(index, jobs, events))
+
+
+async def _serve(index: int, jobs, events) -> None:
+    # The task pipeline lives in the API module; importing it does not start
+    # the web server
+    from app.agent.pool import close_pools, get_pool
+    from app.api import log_interceptor, new_swe_agent
+    from app.telemetry import add_sink
+
+    # Same log forwarding as the API server's entry point
+    logger.add(
+        lambda message: log_interceptor(
+            f"{message.record['level'].name} | {message.record['message']}"
+        )
+    )
+    # Task usage is summed and saved by the API server only; app.api registers
+    # the task service's sink at startup, which does not run here
+    add_sink(lambda record: events.put(("llm_call", None, record.to_dict())))
+    # Events are numbered and replayed by the API server's broker
+    event_broker.replay_size = 0
+    event_broker.spill_dir = None
+    get_pool("swe", new_swe_agent).start()
+
+    running: Dict[str, asyncio.Task] = {}
+    while True:
+        message = await asyncio.to_thread(jobs.get)
+        if message is None:
+            break
+        kind, payload = message
+        if kind == "run":
+            key = str(payload["task_id"])
+            task = asyncio.create_task(_run_job(payload, events))
+            running[key] = task
+            task.add_done_callback(lambda _, key=key: running.pop(key, None))
+        elif kind == "cancel" and payload in running:
+            running[payload].cancel()
+
+    for task in running.values():
+        task.cancel()
+    await asyncio.gather(*running.values(), return_exceptions=True)
+    await close_pools()
+
+
+async def _run_job(job: Dict[str, Any], events) -> None:
+    from app.api import process_prompt_with_agent
+    from app.services.task_service import task_service
+
+    key = str(job["task_id"])
+    # Without a database the task record only exists in the API server; hold
+    # a copy here so the log URL and files recorded for it can be handed back
+    user_info = job["user_info"]
+    await task_service.ensure_task(
+        job["task_id"],
+        user_info.get("user_id", "anonymous") if user_info else "anonymous",
+        job["prompt"],
+        status="running",
+    )
+    ctx = open_task_context(job["task_id"], job["prompt"])
+    # Unbounded: the forwarder keeps up, and no event may be lost on the way
+    channel = ctx.subscribe(buffer_size=0)
+    forward = asyncio.create_task(_forward(key, channel, events))
+    try:
+        result = await process_prompt_with_agent(
+            job["prompt"],
+            job["model"],
+            job["user_info"],
+            task_id=job["task_id"],
+            resume=job["resume"],
+            # The API server writes the task's status from the outcome
+            record_status=False,
+        )
+        outcome = {"files": result["files"]}
+    except asyncio.CancelledError:
+        outcome = {"cancelled": True}
+    except Exception as e:
+        outcome = {"error": f"{type(e).__name__}: {e}"}
+    finally:
+        forward.cancel()
+        ctx.unsubscribe(channel)
+    outcome["records"] = task_service.take_task_records(job["task_id"])
+    # Events still queued go out before the outcome, keeping their order
+    pending = [event for _, event in channel.drain()]
+    if pending:
+        events.put(("events", key, pending))
+    events.put(("done", key, outcome))
+
+
+async def _forward(key: str, channel: Subscription, events) -> None:
+    while True:
+        await channel.wait()
+        events.put(("events", key, [event for _, event in channel.drain()]))
+
+
+worker_pool = WorkerPool.from_config()
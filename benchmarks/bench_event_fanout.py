@@ -0,0 +1,187 @@
+"""Fan-out of task events to hundreds of concurrent SSE subscribers.
+
+A publisher emits log events for one task in bursts while N subscribers
+each read the task's topic and serialise every event into an SSE frame, as
+/api/events does. A few deliberately slow subscribers show the slow-consumer
+policy at work without holding the others back. Reports the publish cost
+per event, delivery latency percentiles, and how many events each kind of
+subscriber received, dropped or lost to a disconnect. For comparison, the
+legacy setup of all connections reading one shared asyncio.Queue is run
+with the same load, where each event reaches a single subscriber.
+
+Usage:
+    python benchmarks/bench_event_fanout.py [--subscribers 300] [--events 2000]
+        [--burst 20] [--slow 5] [--buffer-size 1000]
+        [--policy drop_oldest|disconnect]
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+from typing import List, Optional
+
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.event_bus import EventBroker, SlowConsumer  # noqa: E402
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def sse_frame(event: dict) -> str:
+    return f"data: {json.dumps({'type': 'log', 'message': event['content']})}\n\n"
+
+
+async def subscriber(
+    broker: EventBroker,
+    topic: str,
+    delay: float,
+    latencies: List[float],
+    results: List[dict],
+) -> None:
+    subscription = broker.subscribe(topic)
+    received = 0
+    try:
+        while True:
+            try:
+                _, event = await subscription.get()
+            except SlowConsumer:
+                break
+            if event is None:  # end of the run
+                break
+            sse_frame(event)
+            latencies.append(time.perf_counter() - event["published"])
+            received += 1
+            if delay:
+                await asyncio.sleep(delay)
+    finally:
+        # Closed before we unsubscribe means the broker disconnected us
+        disconnected = subscription.closed
+        broker.unsubscribe(subscription)
+        results.append(
+            {
+                "received": received,
+                "dropped": subscription.dropped,
+                "disconnected": disconnected,
+            }
+        )
+
+
+async def publish_all(publish, events: int, burst: int) -> float:
+    """Publish `events` events in bursts; the seconds spent inside publish."""
+    spent = 0.0
+    for i in range(events):
+        event = {"content": f"step {i}: running tool", "published": time.perf_counter()}
+        started = time.perf_counter()
+        publish(event)
+        spent += time.perf_counter() - started
+        if (i + 1) % burst == 0:
+            await asyncio.sleep(0)  # let subscribers catch up between bursts
+    return spent
+
+
+async def run_broker(args) -> None:
+    broker = EventBroker(buffer_size=args.buffer_size, slow_consumer=args.policy)
+    topic = "task-1"
+    fast_latencies: List[float] = []
+    fast_results: List[dict] = []
+    slow_results: List[dict] = []
+    fast = [
+        asyncio.create_task(subscriber(broker, topic, 0, fast_latencies, fast_results))
+        for _ in range(args.subscribers - args.slow)
+    ]
+    slow = [
+        asyncio.create_task(subscriber(broker, topic, 0.01, [], slow_results))
+        for _ in range(args.slow)
+    ]
+    await asyncio.sleep(0)  # subscribe everyone before publishing
+
+    started = time.perf_counter()
+    spent = await publish_all(
+        lambda event: broker.publish(topic, event), args.events, args.burst
+    )
+    broker.publish(topic, None)
+    await asyncio.gather(*fast)
+    elapsed = time.perf_counter() - started
+    # Slow subscribers are stopped where they are, with events still pending
+    for task in slow:
+        task.cancel()
+    await asyncio.gather(*slow, return_exceptions=True)
+
+    deliveries = args.events * args.subscribers
+    print(
+        f"broker: {args.subscribers} subscribers ({args.slow} slow), "
+        f"{args.events} events, buffer {args.buffer_size}, policy {args.policy}"
+    )
+    print(
+        f"  publish {spent / args.events * 1e6:.1f} us/event "
+        f"({spent / deliveries * 1e9:.0f} ns per delivery), "
+        f"all fast subscribers done in {elapsed:.2f}s "
+        f"({deliveries / elapsed:,.0f} deliveries/s)"
+    )
+    p50, p99 = percentile(fast_latencies, 0.5), percentile(fast_latencies, 0.99)
+    print(f"  fast latency p50 {p50 * 1000:.2f} ms, p99 {p99 * 1000:.2f} ms")
+    complete = sum(1 for r in fast_results if r["received"] == args.events)
+    print(f"  fast subscribers with every event: {complete}/{len(fast_results)}")
+    if slow_results:
+        print(
+            "  slow subscribers when the fast ones finished: received "
+            f"{sum(r['received'] for r in slow_results) / len(slow_results):.0f}, "
+            f"dropped {sum(r['dropped'] for r in slow_results) / len(slow_results):.0f} "
+            "events on average, "
+            f"{sum(r['disconnected'] for r in slow_results)} disconnected"
+        )
+
+
+async def run_shared_queue(args) -> None:
+    """The pre-broker setup: every connection reads the same queue."""
+    queue: asyncio.Queue = asyncio.Queue()
+    received = [0] * args.subscribers
+
+    async def reader(index: int) -> None:
+        while True:
+            event = await queue.get()
+            if event is None:
+                return
+            sse_frame(event)
+            received[index] += 1
+
+    readers = [asyncio.create_task(reader(i)) for i in range(args.subscribers)]
+    await asyncio.sleep(0)
+    await publish_all(queue.put_nowait, args.events, args.burst)
+    for _ in readers:
+        queue.put_nowait(None)
+    await asyncio.gather(*readers)
+    print(
+        f"shared queue: {sum(received)} deliveries for {args.events} events "
+        f"and {args.subscribers} subscribers; "
+        f"{sum(1 for r in received if r == args.events)} subscribers saw every event, "
+        f"the busiest saw {max(received)}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--subscribers", type=int, default=300)
+    parser.add_argument("--events", type=int, default=2000)
+    parser.add_argument(
+        "--burst", type=int, default=20, help="events published between yields"
+    )
+    parser.add_argument(
+        "--slow", type=int, default=5, help="subscribers taking 10 ms per event"
+    )
+    parser.add_argument("--buffer-size", type=int, default=1000)
+    parser.add_argument(
+        "--policy", choices=["drop_oldest", "disconnect"], default="drop_oldest"
+    )
+    args = parser.parse_args()
+    asyncio.run(run_broker(args))
+    asyncio.run(run_shared_queue(args))
@@ -0,0 +1,123 @@
+"""Per-step cost of formatting the conversation for a simulated 30-step SWEAgent run.
+
+Each step appends the next-step prompt, an assistant tool call and a large
+tool observation, then formats the whole history the way ToolCallAgent.think
+does. The legacy path re-serialises and re-validates every message on every
+step; the cached path takes memory's wire list, which only serialises and
+validates what was added since the previous step.
+
+Usage:
+    python benchmarks/bench_format_messages.py [--steps 30] [--observation-kb 16]
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.llm import LLM  # noqa: E402
+from app.schema import Function, Memory, Message, ToolCall  # noqa: E402
+
+
+def legacy_to_dict(message: Message) -> dict:
+    """Message.to_dict() as it was before serialisation was cached."""
+    result = {"role": message.role}
+    if message.content is not None:
+        result["content"] = message.content
+    if message.tool_calls is not None:
+        result["tool_calls"] = [call.model_dump() for call in message.tool_calls]
+    if message.name is not None:
+        result["name"] = message.name
+    if message.tool_call_id is not None:
+        result["tool_call_id"] = message.tool_call_id
+    return result
+
+
+def legacy_format_messages(messages):
+    """LLM.format_messages() as it was before serialisation was cached."""
+    formatted = [legacy_to_dict(msg) for msg in messages]
+    for msg in formatted:
+        if msg["role"] not in ["system", "user", "assistant", "tool"]:
+            raise ValueError(f"Invalid role: {msg['role']}")
+        if "content" not in msg and "tool_calls" not in msg:
+            raise ValueError("Message must contain either 'content' or 'tool_calls'")
+    return formatted
+
+
+def simulate_step(memory: Memory, step: int, observation: str) -> None:
+    memory.add_message(Message.user_message(f"Step {step}: what next?"))
+    call = ToolCall(
+        id=f"call_{step}",
+        function=Function(
+            name="str_replace_editor",
+            arguments=json.dumps({"command": "view", "path": f"/repo/file_{step}.py"}),
+        ),
+    )
+    memory.add_message(
+        Message.from_tool_calls(content="Looking at the file.", tool_calls=[call])
+    )
+    memory.add_message(
+        Message.tool_message(
+            observation, name="str_replace_editor", tool_call_id=f"call_{step}"
+        )
+    )
+
+
+def run(steps: int, observation_kb: int, repeat: int) -> None:
+    observation = ("x = compute(value)  # " + "y" * 40 + "\n") * (
+        observation_kb * 1024 // 64
+    )
+    system = [Message.system_message("You are an autonomous programmer.")]
+    memory = Memory(max_messages=1000)
+
+    print(
+        f"{'step':>4} {'messages':>8} {'legacy ms':>10} {'cached ms':>10} {'speedup':>8}"
+    )
+    legacy_total = cached_total = 0.0
+    for step in range(1, steps + 1):
+        simulate_step(memory, step, observation)
+
+        started = time.perf_counter()
+        for _ in range(repeat):
+            legacy = legacy_format_messages(system + memory.messages)
+        legacy_ms = (time.perf_counter() - started) * 1000 / repeat
+
+        # Fresh messages so the first cached call pays for serialising them,
+        # as it would in a real run
+        started = time.perf_counter()
+        cached = LLM.format_messages(system) + LLM.format_messages(
+            memory.to_dict_list()
+        )
+        for _ in range(repeat - 1):
+            cached = LLM.format_messages(system) + LLM.format_messages(
+                memory.to_dict_list()
+            )
+        cached_ms = (time.perf_counter() - started) * 1000 / repeat
+
+        assert legacy == cached
+        legacy_total += legacy_ms
+        cached_total += cached_ms
+        print(
+            f"{step:>4} {len(memory.messages):>8} {legacy_ms:>10.3f} "
+            f"{cached_ms:>10.3f} {legacy_ms / cached_ms:>7.1f}x"
+        )
+
+    print(
+        f"\ntotal over {steps} steps: legacy {legacy_total:.2f} ms, "
+        f"cached {cached_total:.2f} ms ({legacy_total / cached_total:.1f}x)"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--steps", type=int, default=30)
+    parser.add_argument("--observation-kb", type=int, default=16)
+    parser.add_argument(
+        "--repeat", type=int, default=1, help="format calls per step to average over"
+    )
+    args = parser.parse_args()
+    run(args.steps, args.observation_kb, args.repeat)
@@ -0,0 +1,166 @@
+"""Throughput of log_interceptor's cleaning and file detection on agent logs.
+
+Replays a representative mix of agent log lines (step markers, thoughts,
+tool calls, long tool observations, file announcements) through the legacy
+per-line processing, which ran four re.sub calls, three file-pattern
+searches and an os.path.exists per candidate, and through the current one:
+one precompiled prefix match per line, with file detection reduced to a
+keyword check on the logging path. The batched background detection that
+handles the remaining lines is measured separately. Cleaned lines are
+checked to be identical to the legacy output.
+
+Usage:
+    python benchmarks/bench_log_processing.py [--lines 200000] [--file-ratio 0.02]
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.log_processing import (  # noqa: E402
+    FileDetector,
+    clean_log_line,
+    may_mention_file,
+)
+
+
+def legacy_process(message: str):
+    """log_interceptor's cleaning and file detection as they were."""
+    cleaned_message = re.sub(
+        r"^\d{4}-\d{2}-\d{2}\s+\d{2}:\d{2}:\d{2}.\d+\s+\|\s+\w+\s+\|\s+[\w\.]+:\s*",
+        "",
+        message,
+    )
+    cleaned_message = re.sub(r"^(INFO|WARNING|ERROR)\s*[:|]\s*", "", cleaned_message)
+    cleaned_message = re.sub(r"^(INFO|WARNING|ERROR)\s*\|\s*", "", cleaned_message)
+    cleaned_message = re.sub(r"^\|\s*\w+\s*\|\s*", "", cleaned_message)
+    cleaned_message = cleaned_message.rstrip("|").strip()
+    file_patterns = [
+        r'(?:saved|created|generated|written)(?:\s*to)?\s*(?:file)?\s*[:]?\s*(?:as|to)?[:]?\s*[\'"]?(?P<filepath>[\w\-./\\]+\.\w+)[\'"]?',
+        r'file\s*(?:saved|created|generated)\s*[:]?\s*[\'"]?(?P<filepath>[\w\-./\\]+\.\w+)[\'"]?',
+        r'generated file\s*[:]?\s*[\'"]?(?P<filepath>[\w\-./\\]+\.\w+)[\'"]?',
+    ]
+    for pattern in file_patterns:
+        match = re.search(pattern, cleaned_message)
+        if match:
+            file_path = match.group("filepath")
+            if file_path and os.path.exists(file_path):
+                return cleaned_message, file_path
+    return cleaned_message, None
+
+
+def make_lines(count: int, file_ratio: float, workdir: str) -> list:
+    rng = random.Random(0)
+    files = []
+    for i in range(20):
+        path = os.path.join(workdir, f"report_{i}.md")
+        Path(path).write_text("x")
+        files.append(path)
+    observation = "total 48\n-rw-r--r-- 1 root root 1204 main.py " * 20
+    templates = [
+        lambda i: f"INFO | 🚀 Step {i}/30",
+        lambda i: "INFO | ✨ SWE's thoughts: Let me look at the failing test and "
+        "then fix the parser so that it handles nested brackets correctly.",
+        lambda i: "INFO | 🛠️ SWE selected 1 tools to use",
+        lambda i: "INFO | 🧰 Tools being prepared: ['bash']",
+        lambda i: "INFO | 🔧 Activating tool: 'str_replace_editor'...",
+        lambda i: f"INFO | 🎯 Tool 'bash' completed its mission! Result: {observation}",
+        lambda i: f"2024-05-01 12:34:{i % 60:02d}.{i % 1000:03d} | WARNING | "
+        f"app.llm:ask:{i % 300}: Token budget tight, trimming history",
+        lambda i: "ERROR | Tool 'python_execute' raised: NameError: name 'df' is not defined",
+        lambda i: f"INFO | Observed output of cmd `pytest -q`: {i} passed, 1 warning in 2.31s",
+    ]
+    lines = []
+    for i in range(count):
+        if rng.random() < file_ratio:
+            if rng.random() < 0.5:
+                path = rng.choice(files)
+            else:
+                path = os.path.join(workdir, f"missing_{i % 50}.py")
+            lines.append(
+                f"INFO | 🎯 Tool 'file_saver' completed its mission! Result: "
+                f"Content successfully saved to {path}"
+            )
+        else:
+            lines.append(rng.choice(templates)(i))
+    return lines
+
+
+class _Context:
+    """The part of TaskContext the detector uses."""
+
+    def __init__(self):
+        self.files = []
+
+    def add_file(self, path: str) -> bool:
+        if path in self.files:
+            return False
+        self.files.append(path)
+        return True
+
+    def publish(self, event) -> None:
+        pass
+
+
+def run(count: int, file_ratio: float) -> None:
+    with tempfile.TemporaryDirectory() as workdir:
+        lines = make_lines(count, file_ratio, workdir)
+
+        started = time.perf_counter()
+        legacy = [legacy_process(line) for line in lines]
+        legacy_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        cleaned = [clean_log_line(line) for line in lines]
+        queued = [line for line in cleaned if may_mention_file(line)]
+        current_seconds = time.perf_counter() - started
+        assert cleaned == [line for line, _ in legacy], "cleaning changed"
+
+        # The detector's batch step, run inline to time it on its own
+        detector = FileDetector()
+        context = _Context()
+        started = time.perf_counter()
+        found = []
+        for i in range(0, len(queued), detector.batch_size):
+            batch = [(context, line) for line in queued[i : i + detector.batch_size]]
+            found.extend(detector._detect(batch))
+        detect_seconds = time.perf_counter() - started
+        legacy_files = sorted({path for _, path in legacy if path})
+        assert sorted({path for _, _, path in found}) == legacy_files
+
+    print(f"{count:,} lines, {len(queued):,} queued for file detection")
+    print(
+        f"legacy   {count / legacy_seconds:>12,.0f} lines/s "
+        f"({legacy_seconds * 1e6 / count:.2f} us/line on the logging path)"
+    )
+    print(
+        f"current  {count / current_seconds:>12,.0f} lines/s "
+        f"({current_seconds * 1e6 / count:.2f} us/line on the logging path, "
+        f"{legacy_seconds / current_seconds:.1f}x)"
+    )
+    print(
+        f"background detection {len(queued) / detect_seconds:,.0f} lines/s, "
+        f"path cache {detector.paths.hits} hits / {detector.paths.misses} misses, "
+        f"{len(legacy_files)} files found"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lines", type=int, default=200000)
+    parser.add_argument(
+        "--file-ratio",
+        type=float,
+        default=0.02,
+        help="share of lines announcing a file, half of them missing",
+    )
+    args = parser.parse_args()
+    run(args.lines, args.file_ratio)
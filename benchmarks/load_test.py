@@ -0,0 +1,192 @@
+"""Drive N concurrent /api/prompt tasks against a running server and report latency.
+
+Each task is submitted through /api/prompt (or the form-based /api/process
+with --endpoint process) and polled through
+/api/task_status/{task_id} until it completes or fails. Prompts carry a run
+id and index so every task is a distinct conversation. Reports throughput,
+end-to-end latency percentiles and the LLM usage the server recorded per
+task. Run the server against benchmarks/mock_llm_server.py for repeatable,
+free numbers on a laptop:
+
+    python benchmarks/mock_llm_server.py --latency lognormal:-0.7,0.4 --tokens-per-second 80 &
+    # config/config.toml: base_url = "http://127.0.0.1:8001/v1"
+    python main.py &                      # or however the API server is started
+    python benchmarks/load_test.py --tasks 50 --concurrency 10
+
+Usage:
+    python benchmarks/load_test.py [--base-url http://127.0.0.1:8000] [--tasks 20]
+        [--concurrency 5] [--endpoint prompt|process] [--prompt "..."]
+        [--timeout 600] [--token ...] [--json results.json]
+"""
+
+import argparse
+import asyncio
+import json
+import time
+import uuid
+from typing import List, Optional
+
+import httpx
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def submit(client: httpx.AsyncClient, endpoint: str, prompt: str):
+    if endpoint == "process":
+        return await client.post("/api/process", data={"prompt": prompt})
+    return await client.post("/api/prompt", json={"prompt": prompt})
+
+
+async def run_task(
+    client: httpx.AsyncClient,
+    endpoint: str,
+    prompt: str,
+    poll_interval: float,
+    timeout: float,
+) -> dict:
+    started = time.monotonic()
+    result = {"prompt": prompt, "status": "error", "latency_seconds": None}
+    try:
+        response = await submit(client, endpoint, prompt)
+        response.raise_for_status()
+        submitted = response.json()
+        task_id = submitted.get("task_id")
+        if task_id is None:
+            result["error"] = submitted.get("message", "no task_id in response")
+            return result
+        result["task_id"] = task_id
+        result["submit_seconds"] = time.monotonic() - started
+
+        while time.monotonic() - started < timeout:
+            await asyncio.sleep(poll_interval)
+            response = await client.get(f"/api/task_status/{task_id}")
+            if response.status_code == 404:
+                continue
+            response.raise_for_status()
+            status = response.json()
+            if status.get("status") in ("completed", "failed"):
+                result["status"] = status["status"]
+                result["usage"] = status.get("usage")
+                break
+        else:
+            result["status"] = "timeout"
+    except httpx.HTTPError as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["latency_seconds"] = time.monotonic() - started
+    return result
+
+
+async def run(args: argparse.Namespace) -> dict:
+    run_id = uuid.uuid4().hex[:8]
+    semaphore = asyncio.Semaphore(args.concurrency)
+    limits = httpx.Limits(max_connections=args.concurrency * 2)
+    headers = {"Authorization": f"Bearer {args.token}"} if args.token else {}
+
+    async with httpx.AsyncClient(
+        base_url=args.base_url,
+        timeout=args.request_timeout,
+        limits=limits,
+        headers=headers,
+    ) as client:
+
+        async def bounded(index: int) -> dict:
+            async with semaphore:
+                prompt = f"{args.prompt} [load-test {run_id}-{index}]"
+                return await run_task(
+                    client, args.endpoint, prompt, args.poll_interval, args.timeout
+                )
+
+        started = time.monotonic()
+        results = await asyncio.gather(*(bounded(i) for i in range(args.tasks)))
+        elapsed = time.monotonic() - started
+
+    completed = [r for r in results if r["status"] == "completed"]
+    latencies = [r["latency_seconds"] for r in completed]
+    usages = [r["usage"] for r in completed if r.get("usage")]
+    llm_calls = sum(u["calls"] for u in usages)
+    llm_seconds = sum(u["latency_seconds"] for u in usages)
+    summary = {
+        "run_id": run_id,
+        "tasks": args.tasks,
+        "concurrency": args.concurrency,
+        "elapsed_seconds": elapsed,
+        "completed": len(completed),
+        "failed": sum(r["status"] == "failed" for r in results),
+        "timed_out": sum(r["status"] == "timeout" for r in results),
+        "errors": sum(r["status"] == "error" for r in results),
+        "tasks_per_minute": len(completed) / elapsed * 60 if elapsed else 0.0,
+        "latency_p50": percentile(latencies, 0.5),
+        "latency_p90": percentile(latencies, 0.9),
+        "latency_p99": percentile(latencies, 0.99),
+        "latency_max": max(latencies) if latencies else None,
+        "llm_calls_per_task": llm_calls / len(usages) if usages else None,
+        "llm_seconds_per_task": llm_seconds / len(usages) if usages else None,
+        "llm_share_of_latency": llm_seconds / sum(latencies) if usages else None,
+        "prompt_tokens": sum(u["prompt_tokens"] for u in usages),
+        "completion_tokens": sum(u["completion_tokens"] for u in usages),
+    }
+    return {"summary": summary, "results": results}
+
+
+def report(summary: dict) -> None:
+    def seconds(value: Optional[float]) -> str:
+        return f"{value:.2f}s" if value is not None else "-"
+
+    print(
+        f"run {summary['run_id']}: {summary['tasks']} tasks at concurrency "
+        f"{summary['concurrency']} in {summary['elapsed_seconds']:.1f}s"
+    )
+    print(
+        f"  completed {summary['completed']}, failed {summary['failed']}, "
+        f"timed out {summary['timed_out']}, errors {summary['errors']}"
+    )
+    print(f"  throughput {summary['tasks_per_minute']:.1f} tasks/min")
+    print(
+        f"  latency p50 {seconds(summary['latency_p50'])}, "
+        f"p90 {seconds(summary['latency_p90'])}, "
+        f"p99 {seconds(summary['latency_p99'])}, "
+        f"max {seconds(summary['latency_max'])}"
+    )
+    if summary["llm_calls_per_task"] is not None:
+        print(
+            f"  LLM per task: {summary['llm_calls_per_task']:.1f} calls, "
+            f"{seconds(summary['llm_seconds_per_task'])} "
+            f"({summary['llm_share_of_latency']:.0%} of task latency); "
+            f"tokens {summary['prompt_tokens']}+{summary['completion_tokens']}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument(
+        "--endpoint",
+        choices=["prompt", "process"],
+        default="prompt",
+        help="submit through /api/prompt (Manus) or /api/process (SWEAgent)",
+    )
+    parser.add_argument("--token", help="bearer token when the server requires login")
+    parser.add_argument("--tasks", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=5)
+    parser.add_argument(
+        "--prompt",
+        default="List the files in the workspace and report how many there are.",
+    )
+    parser.add_argument("--poll-interval", type=float, default=0.5)
+    parser.add_argument(
+        "--timeout", type=float, default=600, help="per-task timeout in seconds"
+    )
+    parser.add_argument("--request-timeout", type=float, default=30)
+    parser.add_argument("--json", help="write the summary and per-task results here")
+    args = parser.parse_args()
+
+    outcome = asyncio.run(run(args))
+    report(outcome["summary"])
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(outcome, f, ensure_ascii=False, indent=2)
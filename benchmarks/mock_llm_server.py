@@ -0,0 +1,445 @@
+"""OpenAI-compatible stand-in LLM server for running the agent stack offline.
+
+Serves /v1/chat/completions (streaming and non-streaming, with tool calls)
+and /v1/models. Responses come from, in order of precedence:
+
+1. a recording (--replay), matched on the exact conversation so far, or on
+   the turn number within a recorded conversation with the same task prompt;
+2. a script (--script), a JSON list of responses indexed by turn, where an
+   entry with a "match" substring wins when the newest message contains it;
+3. a built-in script that adapts to the tools offered: planning requests get
+   a two-step plan, agents run one harmless command and then terminate.
+
+Script and recording responses look like
+    {"content": "...", "tool_calls": [{"name": "bash", "arguments": {"command": "ls"}}]}
+
+Latency is drawn per request from a seeded distribution (--latency) keyed on
+the conversation and turn, so a rerun with the same seed sees the same
+delays in the same places regardless of concurrency. --upstream turns the
+server into a recording proxy: requests are forwarded to a real endpoint and
+the exchanges appended to --record, ready for --replay.
+
+Point the app at it with `base_url = "http://127.0.0.1:8001/v1"` in
+config/config.toml, then drive it with benchmarks/load_test.py.
+
+Usage:
+    python benchmarks/mock_llm_server.py [--port 8001] [--latency lognormal:0,0.5]
+        [--tokens-per-second 80] [--script script.json | --replay calls.jsonl]
+        [--error-rate 0.01] [--seed 0]
+    python benchmarks/mock_llm_server.py --upstream https://api.openai.com/v1 \\
+        --upstream-key sk-... --record calls.jsonl
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+def _digest(value: Any) -> str:
+    canonical = json.dumps(value, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+
+
+def _text(content: Any) -> str:
+    """Flatten string or content-part message content to text."""
+    if isinstance(content, list):
+        return "".join(
+            part.get("text", "") for part in content if isinstance(part, dict)
+        )
+    return content or ""
+
+
+def conversation_key(messages: List[dict]) -> str:
+    """Identify a conversation by its first user message, the task prompt."""
+    first_user = next((m for m in messages if m.get("role") == "user"), {})
+    return _digest(_text(first_user.get("content")))
+
+
+def turn_of(messages: List[dict]) -> int:
+    """How many times the model has already answered in this conversation."""
+    return sum(1 for m in messages if m.get("role") == "assistant")
+
+
+def exchange_key(messages: List[dict]) -> str:
+    """Identify the exact conversation so far, ignoring call ids and cache annotations."""
+    return _digest(
+        [
+            [
+                m.get("role"),
+                _text(m.get("content")),
+                [call.get("function") for call in m.get("tool_calls") or []],
+                m.get("name"),
+            ]
+            for m in messages
+        ]
+    )
+
+
+class Latency:
+    """Seeded delay distribution parsed from e.g. "lognormal:0,0.5"."""
+
+    def __init__(self, spec: str):
+        name, _, params = spec.partition(":")
+        self.name = name
+        self.params = [float(p) for p in params.split(",") if p]
+        if name not in ("fixed", "uniform", "normal", "lognormal"):
+            raise ValueError(f"Unknown latency distribution: {spec}")
+
+    def sample(self, rng: random.Random) -> float:
+        p = self.params
+        if self.name == "fixed":
+            return p[0] if p else 0.0
+        if self.name == "uniform":
+            return rng.uniform(p[0], p[1])
+        if self.name == "normal":
+            return max(0.0, rng.gauss(p[0], p[1]))
+        return math.exp(rng.gauss(p[0], p[1]))
+
+
+def builtin_response(tool_names: List[str], turn: int) -> dict:
+    """A short, side-effect free run for whatever agent is calling."""
+    if "planning" in tool_names:
+        return {
+            "content": "Here is the plan.",
+            "tool_calls": [
+                {
+                    "name": "planning",
+                    "arguments": {
+                        "command": "create",
+                        "plan_id": "plan",
+                        "title": "Mock plan",
+                        "steps": ["Inspect the workspace", "Report the result"],
+                    },
+                }
+            ],
+        }
+    if not tool_names:
+        return {"content": "This is a mock response."}
+    if turn == 0:
+        for name, arguments in [
+            ("bash", {"command": "echo mock"}),
+            ("python_execute", {"code": "print('mock')"}),
+        ]:
+            if name in tool_names:
+                return {
+                    "content": "Let me check.",
+                    "tool_calls": [{"name": name, "arguments": arguments}],
+                }
+    if "terminate" in tool_names:
+        return {
+            "content": "The task is complete.",
+            "tool_calls": [{"name": "terminate", "arguments": {"status": "success"}}],
+        }
+    return {"content": "The task is complete."}
+
+
+class ResponseSource:
+    """Picks the response for a request from a recording, a script or the built-in script."""
+
+    def __init__(
+        self, script: Optional[List[dict]] = None, replay: Optional[Path] = None
+    ):
+        self.script = script or []
+        self.by_exchange: Dict[str, dict] = {}
+        self.by_turn: Dict[Tuple[str, int], dict] = {}
+        if replay is not None:
+            for line in replay.read_text(encoding="utf-8").splitlines():
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                messages = entry["request"]["messages"]
+                self.by_exchange[exchange_key(messages)] = entry["response"]
+                self.by_turn[(conversation_key(messages), turn_of(messages))] = entry[
+                    "response"
+                ]
+
+    def pick(self, messages: List[dict], tool_names: List[str]) -> Tuple[str, dict]:
+        recorded = self.by_exchange.get(exchange_key(messages))
+        if recorded is None:
+            recorded = self.by_turn.get((conversation_key(messages), turn_of(messages)))
+        if recorded is not None:
+            return "replay", recorded
+
+        if self.script:
+            latest = _text(messages[-1].get("content")) if messages else ""
+            for entry in self.script:
+                if entry.get("match") and entry["match"] in latest:
+                    return "script", entry
+            unmatched = [entry for entry in self.script if not entry.get("match")]
+            if unmatched:
+                return "script", unmatched[min(turn_of(messages), len(unmatched) - 1)]
+
+        return "builtin", builtin_response(tool_names, turn_of(messages))
+
+
+def count_tokens(text: str) -> int:
+    return max(1, len(text) // 4) if text else 0
+
+
+def completion_body(model: str, response: dict, prompt_tokens: int, seed: str) -> dict:
+    """Build a chat completion; ids derive from `seed` so reruns are identical."""
+    tool_calls = [
+        {
+            "id": f"call_{_digest([seed, index])[:12]}",
+            "type": "function",
+            "function": {"name": call["name"], "arguments": _arguments(call)},
+        }
+        for index, call in enumerate(response.get("tool_calls") or [])
+    ]
+    content = response.get("content")
+    completion_tokens = count_tokens(content or "") + sum(
+        count_tokens(call["function"]["arguments"]) for call in tool_calls
+    )
+    message = {"role": "assistant", "content": content}
+    if tool_calls:
+        message["tool_calls"] = tool_calls
+    return {
+        "id": f"chatcmpl-{_digest(seed)[:12]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [
+            {
+                "index": 0,
+                "message": message,
+                "finish_reason": "tool_calls" if tool_calls else "stop",
+            }
+        ],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+
+def _arguments(call: dict) -> str:
+    arguments = call.get("arguments", {})
+    return arguments if isinstance(arguments, str) else json.dumps(arguments)
+
+
+def _pieces(text: str, size: int = 4) -> List[str]:
+    """Split text into roughly token-sized pieces for streaming."""
+    return [text[i : i + size] for i in range(0, len(text), size)] if text else []
+
+
+async def stream_body(body: dict, tokens_per_second: float, include_usage: bool):
+    """Re-emit a completion as SSE chunks paced at `tokens_per_second`."""
+    delay = 1 / tokens_per_second if tokens_per_second else 0.0
+    message = body["choices"][0]["message"]
+
+    def chunk(delta: dict, finish_reason: Optional[str] = None, usage=None) -> str:
+        payload = {
+            "id": body["id"],
+            "object": "chat.completion.chunk",
+            "created": body["created"],
+            "model": body["model"],
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        if usage is not None:
+            payload["usage"] = usage
+        return f"data: {json.dumps(payload)}\n\n"
+
+    yield chunk({"role": "assistant", "content": ""})
+    for piece in _pieces(message.get("content") or ""):
+        if delay:
+            await asyncio.sleep(delay)
+        yield chunk({"content": piece})
+    for index, call in enumerate(message.get("tool_calls") or []):
+        yield chunk(
+            {
+                "tool_calls": [
+                    {
+                        "index": index,
+                        "id": call["id"],
+                        "type": "function",
+                        "function": {"name": call["function"]["name"], "arguments": ""},
+                    }
+                ]
+            }
+        )
+        for piece in _pieces(call["function"]["arguments"]):
+            if delay:
+                await asyncio.sleep(delay)
+            yield chunk(
+                {"tool_calls": [{"index": index, "function": {"arguments": piece}}]}
+            )
+    yield chunk({}, finish_reason=body["choices"][0]["finish_reason"])
+    if include_usage:
+        yield f"data: {json.dumps({**body, 'object': 'chat.completion.chunk', 'choices': [], 'usage': body['usage']})}\n\n"
+    yield "data: [DONE]\n\n"
+
+
+class Recorder:
+    """Appends request/response pairs to a JSONL file in the --replay format."""
+
+    def __init__(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8", buffering=1)
+        self._lock = threading.Lock()
+
+    def write(
+        self, messages: List[dict], tools: Optional[List[dict]], message: dict
+    ) -> None:
+        response = {"content": message.get("content")}
+        if message.get("tool_calls"):
+            response["tool_calls"] = [
+                {
+                    "name": call["function"]["name"],
+                    "arguments": call["function"]["arguments"],
+                }
+                for call in message["tool_calls"]
+            ]
+        line = json.dumps(
+            {"request": {"messages": messages, "tools": tools}, "response": response},
+            ensure_ascii=False,
+        )
+        with self._lock:
+            self._file.write(line + "\n")
+
+
+def create_app(args: argparse.Namespace) -> FastAPI:
+    script = (
+        json.loads(Path(args.script).read_text(encoding="utf-8"))
+        if args.script
+        else None
+    )
+    source = ResponseSource(script, Path(args.replay) if args.replay else None)
+    latency = Latency(args.latency)
+    recorder = Recorder(Path(args.record)) if args.record else None
+    upstream = None
+    if args.upstream:
+        from openai import AsyncOpenAI
+
+        upstream = AsyncOpenAI(base_url=args.upstream, api_key=args.upstream_key)
+
+    stats = Counter()
+    attempts = Counter()
+    started = time.monotonic()
+    app = FastAPI()
+
+    @app.get("/v1/models")
+    async def models():
+        return {"object": "list", "data": [{"id": args.model, "object": "model"}]}
+
+    @app.get("/stats")
+    async def get_stats():
+        elapsed = time.monotonic() - started
+        return {
+            **stats,
+            "uptime_seconds": elapsed,
+            "requests_per_second": stats["requests"] / elapsed,
+        }
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        payload = await request.json()
+        messages = payload.get("messages") or []
+        tools = payload.get("tools")
+        tool_names = [tool.get("function", {}).get("name") for tool in tools or []]
+        model = payload.get("model") or args.model
+        stats["requests"] += 1
+
+        # Deterministic per (seed, conversation, turn, attempt), independent of
+        # arrival order; a retried request rolls again
+        request_key = f"{conversation_key(messages)}:{turn_of(messages)}"
+        attempts[request_key] += 1
+        seed = f"{args.seed}:{request_key}:{attempts[request_key]}"
+        rng = random.Random(seed)
+        roll = rng.random()
+        if roll < args.error_rate:
+            stats["errors"] += 1
+            return JSONResponse(
+                {"error": {"message": "mock server error", "type": "server_error"}},
+                status_code=500,
+            )
+        if roll < args.error_rate + args.rate_limit_rate:
+            stats["rate_limited"] += 1
+            return JSONResponse(
+                {"error": {"message": "mock rate limit", "type": "rate_limit_error"}},
+                status_code=429,
+                headers={"retry-after": "1"},
+            )
+
+        if upstream is not None:
+            forwarded = {
+                k: v
+                for k, v in payload.items()
+                if k not in ("stream", "stream_options")
+            }
+            response = await upstream.chat.completions.create(**forwarded)
+            body = response.model_dump(exclude_none=True)
+            if recorder:
+                recorder.write(messages, tools, body["choices"][0]["message"])
+            stats["upstream"] += 1
+        else:
+            origin, response = source.pick(messages, tool_names)
+            stats[origin] += 1
+            prompt_tokens = count_tokens(json.dumps(messages)) + count_tokens(
+                json.dumps(tools or [])
+            )
+            body = completion_body(model, response, prompt_tokens, seed)
+            await asyncio.sleep(latency.sample(rng))
+
+        if not payload.get("stream"):
+            return body
+        include_usage = bool((payload.get("stream_options") or {}).get("include_usage"))
+        return StreamingResponse(
+            stream_body(body, args.tokens_per_second, include_usage),
+            media_type="text/event-stream",
+        )
+
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--model", default="mock-model")
+    parser.add_argument("--script", help="JSON list of scripted responses")
+    parser.add_argument("--replay", help="JSONL recording to replay")
+    parser.add_argument(
+        "--latency",
+        default="fixed:0",
+        help="delay before responding: fixed:S, uniform:A,B, normal:MEAN,STD or lognormal:MU,SIGMA",
+    )
+    parser.add_argument(
+        "--tokens-per-second",
+        type=float,
+        default=0,
+        help="streaming pace; 0 streams at once",
+    )
+    parser.add_argument(
+        "--error-rate", type=float, default=0.0, help="fraction of 500 responses"
+    )
+    parser.add_argument(
+        "--rate-limit-rate", type=float, default=0.0, help="fraction of 429 responses"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--upstream", help="forward to this OpenAI-compatible base URL instead"
+    )
+    parser.add_argument("--upstream-key", default="", help="API key for --upstream")
+    parser.add_argument(
+        "--record", help="append forwarded exchanges to this JSONL file"
+    )
+    args = parser.parse_args()
+
+    uvicorn.run(create_app(args), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
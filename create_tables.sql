@@ -9,6 +9,7 @@ CREATE TABLE IF NOT EXISTS tasks (
     prompt VARCHAR(2000) NOT NULL COMMENT '提示词内容',
     status VARCHAR(20) NOT NULL COMMENT '任务状态: pending, running, completed, failed',
     log_url VARCHAR(512) COMMENT '日志文件COS存储URL',
+    llm_usage TEXT COMMENT '任务结束时的LLM用量汇总(JSON)',
     created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
     updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间',
     completed_at TIMESTAMP NULL COMMENT '完成时间'
@@ -25,6 +26,9 @@ CREATE TABLE IF NOT EXISTS files (
     created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间'
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='任务生成文件表';
 
+-- 为已有的任务表补充LLM用量汇总字段（字段已存在时执行失败，可忽略）
+ALTER TABLE tasks ADD COLUMN llm_usage TEXT COMMENT '任务结束时的LLM用量汇总(JSON)' AFTER log_url;
+
 -- 创建索引以提高查询性能
 CREATE INDEX idx_tasks_user_id ON tasks(user_id) COMMENT '用户ID索引，加速按用户查询任务';
 CREATE INDEX idx_files_task_id ON files(task_id) COMMENT '任务ID索引，加速查询任务关联的文件';
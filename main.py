@@ -7,7 +7,7 @@ import os
 from pathlib import Path
 from app.agent.manus import Manus
 from app.logger import logger
-from app.api import app, log_interceptor, message_queue
+from app.api import app, log_interceptor
 
 # 创建一个全局变量存储最新的用户输入
 user_input_queue = asyncio.Queue()
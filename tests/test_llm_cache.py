@@ -0,0 +1,30 @@
+import asyncio
+from types import SimpleNamespace
+
+import app.llm as llm_module
+from app.llm import LLM
+from app.llm_cache import ResponseCache
+
+
+def test_zero_temperature_call_is_cached(monkeypatch):
+    llm = LLM()
+    requests = []
+
+    async def create(estimated_tokens, **params):
+        requests.append(params)
+        message = SimpleNamespace(content="hello")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+    monkeypatch.setattr(llm_module, "response_cache", ResponseCache(enabled=True))
+    monkeypatch.setattr(llm, "temperature", 0.7)
+    monkeypatch.setattr(llm, "_create", create)
+
+    async def ask():
+        return await llm.ask(
+            [{"role": "user", "content": "hi"}], stream=False, temperature=0.0
+        )
+
+    assert asyncio.run(ask()) == "hello"
+    assert asyncio.run(ask()) == "hello"
+    assert len(requests) == 1
+    assert requests[0]["temperature"] == 0.0
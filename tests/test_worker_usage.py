@@ -0,0 +1,128 @@
+import asyncio
+import json
+import queue
+
+import app.api as api
+import app.services.task_service as task_service_module
+from app import telemetry
+from app.services.task_service import task_service
+from app.worker import WorkerPool, WorkerTaskFailed, _run_job
+
+
+class FakeDatabase:
+    """The tasks table, shared by the API server and its workers"""
+
+    db_available = True
+
+    def __init__(self):
+        self.tasks = {}
+        self.status_writes = []
+
+    def create_task(self, user_id, prompt):
+        task_id = len(self.tasks) + 1
+        self.tasks[task_id] = {
+            "id": task_id, "user_id": user_id, "prompt": prompt, "status": "pending"
+        }
+        return task_id
+
+    def get_task(self, task_id):
+        return dict(self.tasks[task_id])
+
+    def update_task(self, task_id, update_data):
+        self.tasks[task_id].update(update_data)
+        return True
+
+    def update_task_status(self, task_id, status, log_url=None):
+        self.tasks[task_id]["status"] = status
+        self.status_writes.append(status)
+        return True
+
+
+class FakeLLM:
+    model = "fake-model"
+
+    def with_model(self, model):
+        return self
+
+
+class FakeAgent:
+    """Makes one LLM call per run"""
+
+    llm = FakeLLM()
+
+    async def run(self, request=None):
+        record = telemetry.start_call("ask_tool", self.llm.model)
+        record.prompt_tokens = 100
+        record.completion_tokens = 10
+        record.finish()
+
+
+class FakeAgentPool:
+    async def acquire(self):
+        return FakeAgent()
+
+    def release(self, agent):
+        pass
+
+
+class InProcessWorkerPool(WorkerPool):
+    """Runs each job through the worker's code path in this process.
+
+    Only the worker's own telemetry sink is added, as in app.worker._serve;
+    its messages are then delivered as the API server's reader thread would.
+    """
+
+    @property
+    def enabled(self):
+        return True
+
+    async def run(self, job):
+        key = str(job["task_id"])
+        self._futures[key] = asyncio.get_running_loop().create_future()
+        events = queue.Queue()
+
+        def forward(record):
+            events.put(("llm_call", None, record.to_dict()))
+
+        telemetry.add_sink(forward)
+        try:
+            await _run_job(job, events)
+        finally:
+            telemetry.remove_sink(forward)
+        self._deliver([events.get() for _ in range(events.qsize())])
+        outcome = await self._futures.pop(key)
+        if "error" in outcome:
+            raise WorkerTaskFailed(outcome["error"], outcome)
+        return outcome
+
+
+def test_worker_task_usage_is_saved_once(monkeypatch):
+    database = FakeDatabase()
+
+    async def no_files(logs_text, prompt=""):
+        return []
+
+    async def upload_text(name, text, prefix):
+        return f"cos://{prefix}{name}"
+
+    monkeypatch.setattr(task_service_module, "db_service", database)
+    monkeypatch.setattr(api, "worker_pool", InProcessWorkerPool())
+    monkeypatch.setattr(api, "get_pool", lambda name, factory: FakeAgentPool())
+    monkeypatch.setattr(api, "identify_generated_files", no_files)
+    monkeypatch.setattr(api.cos_service, "upload_text", upload_text)
+
+    async def run_task():
+        task_id = await task_service.create_task("user", "say hi")
+        await api.run_agent_task("say hi", None, None, task_id)
+        return task_id
+
+    task_id = asyncio.run(run_task())
+
+    task = database.tasks[task_id]
+    assert task["status"] == "completed"
+    assert database.status_writes == ["running", "completed"]
+    usage = json.loads(task["llm_usage"])
+    assert usage["calls"] == 1
+    assert usage["prompt_tokens"] == 100
+    assert usage["completion_tokens"] == 10
+    assert str(task_id) not in task_service.task_usage